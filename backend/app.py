@@ -1,81 +1,346 @@
 import os
+import sys
+import signal
+import io
+import stat
+import mimetypes
 import time
 import uuid
+import hashlib
 import json
+import gzip
 import shutil
+import atexit
 import threading
+import queue
+import heapq
 import subprocess
 import re
+import math
+import socket
+import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from pathlib import Path
-from datetime import timedelta
-from typing import Dict, Any, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, abort, send_from_directory
+from flask import Flask, Response, request, jsonify, abort, send_file, stream_with_context
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-# Google GenAI client
-from google import genai
-from google.genai import types
-
-# Google Cloud Storage
-from google.cloud import storage
-
-# OpenAI for prompt improvement
-import openai
+# google-genai, google-cloud-storage and openai are imported on first use (see
+# LazyClient below); together they are most of the import time
 from flask_cors import CORS
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import DuplicateKeyError
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+try:
+    import brotli
+except ImportError:  # optional; JSON responses fall back to gzip
+    brotli = None
 
 # -----------------------
 # Config & Initialization
 # -----------------------
 load_dotenv()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(process)d %(message)s")
+log = logging.getLogger("app")
 
 # Google GenAI
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 
-# GCS
+# GCS (checked when the storage client is first built; /readyz reports it)
 GCS_BUCKET = os.getenv("GCS_BUCKET_NAME")
-if not GCS_BUCKET:
-    raise RuntimeError("Please set GCS_BUCKET_NAME in your environment or .env file")
 
 GCS_PUBLIC = (os.getenv("GCS_PUBLIC", "false").lower() in ("1", "true", "yes"))
 SIGNED_URL_TTL_MIN = int(os.getenv("SIGNED_URL_TTL_MIN", "60"))
+# Per-process LRU of signed URLs; each is reused for the first 3/4 of its lifetime
+SIGNED_URL_CACHE_ENTRIES = int(os.getenv("SIGNED_URL_CACHE_ENTRIES", "4096"))
+GCS_UPLOAD_WORKERS = int(os.getenv("GCS_UPLOAD_WORKERS", "8"))
+# Chunk size must be a multiple of 256 KiB
+GCS_CHUNK_SIZE = int(os.getenv("GCS_CHUNK_SIZE_MB", "8")) * 1024 * 1024
+GCS_RESUMABLE_THRESHOLD = int(os.getenv("GCS_RESUMABLE_THRESHOLD_MB", "16")) * 1024 * 1024
+# How often finished HLS segments are picked up for upload while ffmpeg is still running
+HLS_UPLOAD_POLL_SEC = float(os.getenv("HLS_UPLOAD_POLL_SEC", "0.5"))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MANIFEST_SUFFIXES = (".m3u8", ".mpd", ".vtt")
 
 # Model for video generation
 MODEL_NAME = os.getenv("MODEL_NAME", "veo-2.0-generate-001")
+# Upper bound for "samples" on /api/generate (videos requested from one Veo operation)
+VEO_MAX_SAMPLES = int(os.getenv("VEO_MAX_SAMPLES", "4"))
 
 # ffmpeg
 FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+# How the Veo output gets to GCS/ffmpeg: "stream" tees the download into a resumable
+# upload and ffmpeg's stdin; "file" saves it to VIDEO_DIR first
+VEO_TRANSFER_MODE = os.getenv("VEO_TRANSFER_MODE", "stream").lower()
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Head of the download held back to probe it before ffmpeg starts
+STREAM_PROBE_BYTES = int(os.getenv("STREAM_PROBE_KB", "1024")) * 1024
+HLS_SEGMENT_SEC = int(os.getenv("HLS_SEGMENT_SEC", "2"))
+# ABR ladder as height:bitrate pairs; empty = single rendition (stream copy when possible)
+HLS_LADDER_SPEC = os.getenv("HLS_LADDER", "720:2800k,480:1400k,360:800k")
+# Bitrate cap for the single-rendition transcode (no ladder, source not copyable)
+HLS_MAXRATE_KBPS = int(os.getenv("HLS_MAXRATE_KBPS", "5000"))
+# "mpegts" (.ts) or "fmp4" (CMAF-style .m4s + init.mp4, reusable for DASH)
+HLS_SEGMENT_TYPE = os.getenv("HLS_SEGMENT_TYPE", "mpegts").lower()
+# Only used when the source cannot be stream-copied into HLS
+X264_PRESET = os.getenv("X264_PRESET", "veryfast")
+X264_THREADS = int(os.getenv("X264_THREADS", "0"))  # 0 = let x264 decide
+# Thumbnails: "sprite" tiles frames into sheets referenced with #xywh= cues,
+# "frames" writes one image per interval
+THUMB_MODE = os.getenv("THUMB_MODE", "sprite").lower()
+THUMB_INTERVAL_SEC = float(os.getenv("THUMB_INTERVAL_SEC", "1"))
+THUMB_WIDTH = int(os.getenv("THUMB_WIDTH", "160"))
+THUMB_FORMAT = os.getenv("THUMB_FORMAT", "jpg").lower()  # jpg or webp
+THUMB_SPRITE_COLS = int(os.getenv("THUMB_SPRITE_COLS", "10"))
+THUMB_SPRITE_ROWS = int(os.getenv("THUMB_SPRITE_ROWS", "10"))
 
 # OpenAI for prompt improvement (GPT-3.5)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     # Prompt endpoints will return an error if this is missing — we allow the rest of the service to run.
-    print("Warning: OPENAI_API_KEY not set — /api/improve and /api/compose will fail until set.")
-else:
-    openai.api_key = OPENAI_API_KEY
+    log.warning("[openai] OPENAI_API_KEY not set — /api/improve and /api/compose will fail until set.")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_TIMEOUT_SEC = int(os.getenv("OPENAI_TIMEOUT_SEC", "30"))
+# Prompt helper response cache (in-memory LRU in front of Mongo)
+LLM_CACHE_ENABLED = (os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"))
+LLM_CACHE_TTL_SEC = int(os.getenv("LLM_CACHE_TTL_SEC", str(24 * 3600)))
+LLM_CACHE_MEM_ENTRIES = int(os.getenv("LLM_CACHE_MEM_ENTRIES", "512"))
+
+# Generation cache (reuse identical prompt/config generations)
+GEN_CACHE_ENABLED = (os.getenv("GEN_CACHE_ENABLED", "false").lower() in ("1", "true", "yes"))
+GEN_CACHE_TTL_SEC = int(os.getenv("GEN_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+GEN_CACHE_MAX_ENTRIES = int(os.getenv("GEN_CACHE_MAX_ENTRIES", "10000"))
+
+# Job state cache / write-behind
+JOB_CACHE_TTL_SEC = float(os.getenv("JOB_CACHE_TTL_SEC", "2"))
+JOB_FLUSH_SEC = float(os.getenv("JOB_FLUSH_SEC", "3"))
+# Fields whose updates may be batched instead of written through
+JOB_DEFERRABLE_FIELDS = {"progress", "timings"}
+TERMINAL_STATUSES = ("done", "error")
+# Status streaming (SSE / long-poll)
+JOB_EVENTS_POLL_SEC = float(os.getenv("JOB_EVENTS_POLL_SEC", "1"))
+SSE_MAX_SEC = int(os.getenv("SSE_MAX_SEC", "120"))
+SSE_KEEPALIVE_SEC = int(os.getenv("SSE_KEEPALIVE_SEC", "15"))
+LONG_POLL_MAX_SEC = int(os.getenv("LONG_POLL_MAX_SEC", "25"))
+# Idle streams and long-polls each hold a server thread; past this many per process
+# they are answered right away and the client comes back after STATUS_BUSY_RETRY_SEC
+STATUS_WAITERS_MAX = int(os.getenv("STATUS_WAITERS_MAX", "8"))
+STATUS_BUSY_RETRY_SEC = int(os.getenv("STATUS_BUSY_RETRY_SEC", "5"))
+# JSON bodies (history pages) at least this large are gzip/brotli encoded when the client accepts it
+JSON_COMPRESS_MIN_BYTES = int(os.getenv("JSON_COMPRESS_MIN_BYTES", "1024"))
+# History total is an estimate refreshed at most this often
+VIDEO_COUNT_TTL_SEC = int(os.getenv("VIDEO_COUNT_TTL_SEC", "60"))
+
+# Once ready, how often each process re-checks its Mongo connection for /readyz
+READINESS_RECHECK_SEC = int(os.getenv("READINESS_RECHECK_SEC", "30"))
+
+# Batch generation (/api/generate/batch)
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "8"))
+# Jobs of one batch queued/running at a time (clients may ask for fewer)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "2"))
+
+# Shared rate limiting / upstream quotas
+# Where flask-limiter keeps its counters; defaults to MONGODB_URI ("memory://" = per process)
+RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI") or os.getenv("MONGODB_URI") or "memory://"
+# Token buckets shared through the quotas collection ("memory" = per process)
+QUOTA_BACKEND = os.getenv("QUOTA_BACKEND", "mongo").lower()
+# Requests per minute across all workers; 0 disables the bucket
+VEO_QUOTA_PER_MIN = float(os.getenv("VEO_QUOTA_PER_MIN", "10"))
+OPENAI_QUOTA_PER_MIN = float(os.getenv("OPENAI_QUOTA_PER_MIN", "60"))
+# How long a prompt-helper request may wait for an OpenAI token before 429
+OPENAI_QUOTA_WAIT_SEC = float(os.getenv("OPENAI_QUOTA_WAIT_SEC", "5"))
+
+# Process roles: "all" serves the API and runs jobs (the default), "api" only
+# serves HTTP, "worker" only runs jobs (`python app.py worker` implies it)
+PROCESS_ROLE = "worker" if __name__ == "__main__" and sys.argv[1:2] == ["worker"] else os.getenv("PROCESS_ROLE", "all").lower()
+# Where workers find queued jobs: "mongo" (shared by every process) or "memory" (this process only)
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "mongo").lower()
+if JOB_QUEUE_BACKEND == "memory" and PROCESS_ROLE != "all":
+    raise RuntimeError("JOB_QUEUE_BACKEND=memory only works with PROCESS_ROLE=all")
+# On SIGTERM a worker stops claiming and waits this long for running jobs
+WORKER_DRAIN_SEC = int(os.getenv("WORKER_DRAIN_SEC", "120"))
+# Serve /metrics from `python app.py worker` on this port (0 = off)
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+# Job scheduler
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", "50"))
+JOB_LEASE_SEC = int(os.getenv("JOB_LEASE_SEC", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SEC = float(os.getenv("JOB_POLL_SEC", "2"))
+# Rough wall-clock per job, only used to estimate queue wait for clients
+JOB_AVG_SEC = int(os.getenv("JOB_AVG_SEC", "120"))
+# Veo operation polling: expected generation time per model drives the poll schedule
+VEO_EXPECTED_DEFAULT_SEC = int(os.getenv("VEO_EXPECTED_SEC", "60"))
+MODEL_EXPECTED_SEC = {
+    "veo-2.0-generate-001": VEO_EXPECTED_DEFAULT_SEC,
+    "veo-3.0-generate-preview": 90,
+    "veo-3.0-fast-generate-preview": 45,
+}
+VEO_POLL_MIN_SEC = float(os.getenv("VEO_POLL_MIN_SEC", "2"))
+VEO_POLL_MAX_SEC = float(os.getenv("VEO_POLL_MAX_SEC", "30"))
+VEO_POLL_MAX_ERRORS = int(os.getenv("VEO_POLL_MAX_ERRORS", "5"))
+VEO_TIMEOUT_SEC = int(os.getenv("VEO_TIMEOUT_SEC", "900"))
+# Per-stage concurrency caps (per process)
+STAGE_LIMITS = {
+    "veo": int(os.getenv("VEO_CONCURRENCY", "2")),
+    "ffmpeg": int(os.getenv("FFMPEG_CONCURRENCY", "1")),
+    "upload": int(os.getenv("UPLOAD_CONCURRENCY", "4")),
+}
+
+# Local media lifecycle: byte quota (0 = unlimited) for copies kept for local
+# serving, LRU-evicted; unreferenced leftovers are removed after LOCAL_ORPHAN_SEC
+LOCAL_STORAGE_QUOTA_MB = int(os.getenv("LOCAL_STORAGE_QUOTA_MB", "2048"))
+LOCAL_ORPHAN_SEC = int(os.getenv("LOCAL_ORPHAN_SEC", "3600"))
+LOCAL_JANITOR_SEC = int(os.getenv("LOCAL_JANITOR_SEC", "300"))
+LOCAL_TOUCH_SEC = 60
+
+# Local media serving (/videos, /hls)
+MEDIA_CACHE_MB = int(os.getenv("MEDIA_CACHE_MB", "64"))
+MEDIA_CACHE_MAX_FILE_KB = int(os.getenv("MEDIA_CACHE_MAX_FILE_KB", "2048"))
+MEDIA_MANIFEST_MAX_AGE = int(os.getenv("MEDIA_MANIFEST_MAX_AGE", "60"))
+# Internal nginx location; when set, responses carry X-Accel-Redirect and nginx sends the file
+MEDIA_ACCEL_REDIRECT = os.getenv("MEDIA_ACCEL_REDIRECT", "").rstrip("/")
 
 # Paths
 BASE_DIR = Path(__file__).parent.resolve()
-VIDEO_DIR = BASE_DIR / "videos"
+VIDEO_DIR = Path(os.getenv("VIDEO_DIR") or BASE_DIR / "videos")
 VIDEO_DIR.mkdir(exist_ok=True, parents=True)
-HLS_DIR = BASE_DIR / "hls"
+HLS_DIR = Path(os.getenv("HLS_DIR") or BASE_DIR / "hls")
 HLS_DIR.mkdir(exist_ok=True, parents=True)
 
-# Clients
-genai_client = genai.Client(api_key=GOOGLE_API_KEY)
-storage_client = storage.Client()
+# -----------------------
+# Metrics (Prometheus, exported at /metrics)
+# -----------------------
+# Under gunicorn, set PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py) so the
+# samples of every worker process are aggregated into one scrape.
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    # prometheus_client fails at the first metric if the directory is missing;
+    # gunicorn.conf.py creates it, but `python app.py worker` runs without gunicorn
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+JOB_STAGE_SECONDS = Histogram(
+    "job_stage_seconds", "Wall time of each job pipeline stage", ["stage"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 90, 120, 180, 300, 600, 900),
+)
+STAGE_WAIT_SECONDS = Histogram("stage_slot_wait_seconds", "Time spent waiting for a stage slot", ["stage"])
+STAGE_ACTIVE = Gauge("stage_active", "Jobs holding a stage slot", ["stage"], multiprocess_mode="livesum")
+JOBS_FINISHED = Counter("jobs_finished_total", "Jobs that reached a terminal status", ["status"])
+FFMPEG_CPU_SECONDS = Counter("ffmpeg_cpu_seconds_total", "User + system CPU time used by ffmpeg")
+UPLOAD_BYTES = Counter("gcs_upload_bytes_total", "Bytes uploaded to GCS", ["kind"])
+UPLOAD_SECONDS = Counter("gcs_upload_seconds_total", "Wall time spent uploading to GCS", ["kind"])
+MONGO_OP_SECONDS = Histogram(
+    "mongo_op_seconds", "MongoDB command latency", ["command"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+LLM_SECONDS = Histogram("llm_request_seconds", "OpenAI chat completion latency", ["mode"])
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+STATUS_WAITERS = Gauge("status_waiters", "SSE streams and long-polls holding a thread", multiprocess_mode="livesum")
+MEDIA_CACHE_BYTES = Gauge("media_cache_bytes", "Bytes held by the media cache", multiprocess_mode="livesum")
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_OP_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_OP_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+@contextmanager
+def timed(histogram, *labels):
+    # Failed calls are observed too; their latency matters as much
+    start = time.time()
+    try:
+        yield
+    finally:
+        histogram.labels(*labels).observe(time.time() - start)
+
+# -----------------------
+# Clients (lazy, per process)
+# -----------------------
+# Each client is built on first use instead of at import, so a worker answers
+# /healthz before the SDKs are even loaded, and is rebuilt in a forked child
+# (e.g. gunicorn --preload) rather than sharing the parent's sockets and locks.
+class LazyClient:
+    def __init__(self, name: str, factory):
+        self.name = name
+        self._factory = factory
+        self._client = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._client is not None and self._pid == os.getpid()
+
+    def get(self):
+        if not self.ready:
+            with self._lock:
+                if not self.ready:
+                    self._client = self._factory()
+                    self._pid = os.getpid()
+        return self._client
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+def _make_genai_client():
+    from google import genai
+    return genai.Client(api_key=GOOGLE_API_KEY)
+
+def _make_storage_client():
+    from google.cloud import storage
+    import requests
+    if not GCS_BUCKET:
+        raise RuntimeError("Please set GCS_BUCKET_NAME in your environment or .env file")
+    client = storage.Client()
+    # Let every upload thread keep its own pooled connection to GCS
+    http = getattr(client, "_http", None)
+    if isinstance(http, requests.Session):
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=GCS_UPLOAD_WORKERS * 2)
+        http.mount("https://", adapter)
+    return client
+
+def _load_openai():
+    import openai as openai_sdk
+    openai_sdk.api_key = OPENAI_API_KEY
+    return openai_sdk
+
+genai_client = LazyClient("genai", _make_genai_client)
+storage_client = LazyClient("storage", _make_storage_client)
+# The openai 0.28 SDK is module-level; this proxies the module itself
+openai = LazyClient("openai", _load_openai)
 MONGO_URI = os.getenv("MONGODB_URI")
 MONGO_DB = os.getenv("MONGODB_DB")
-mongo_client = MongoClient(MONGO_URI)
-db = mongo_client[MONGO_DB]
-videos_col = db["videos"]
+mongo_client = LazyClient("mongo", lambda: MongoClient(MONGO_URI, event_listeners=[MongoCommandMetrics()]))
+
+def mongo_collection(name: str) -> LazyClient:
+    return LazyClient(name, lambda: mongo_client.get()[MONGO_DB][name])
+
+videos_col = mongo_collection("videos")
+gen_cache_col = mongo_collection("generation_cache")
+batches_col = mongo_collection("batches")
+quotas_col = mongo_collection("quotas")
+llm_cache_col = mongo_collection("llm_cache")
 
 app = Flask(__name__)
 
@@ -85,10 +350,15 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
 # -----------------------
 # Rate Limiting (per-IP)
 # -----------------------
-# Default: 100/hour per IP; in-memory storage (sufficient for single-instance)
+# Counters live in RATELIMIT_STORAGE_URI (Mongo by default) so limits hold across
+# gunicorn workers and replicas; if the store is unreachable each process falls
+# back to in-memory counters rather than failing requests.
+_limiter_options = {"database_name": MONGO_DB} if RATELIMIT_STORAGE_URI.startswith("mongodb") else {}
 limiter = Limiter(
     key_func=get_remote_address,
-    storage_uri="memory://",
+    storage_uri=RATELIMIT_STORAGE_URI,
+    storage_options=_limiter_options,
+    in_memory_fallback_enabled=True,
 )
 limiter.init_app(app)
 
@@ -96,6 +366,124 @@ limiter.init_app(app)
 def ratelimit_handler(e):
     return jsonify({"error": "Too many requests", "details": str(getattr(e, "description", "rate limit exceeded"))}), 429
 
+# -----------------------
+# Upstream Quotas (Veo / OpenAI)
+# -----------------------
+class QuotaExhausted(Exception):
+    """No upstream quota left; retry_after is the number of seconds until there is."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} quota exhausted, retry in {int(math.ceil(retry_after))}s")
+        self.retry_after = retry_after
+
+# Token bucket refilled at `per_min` tokens per minute with a burst of one
+# minute's worth. With a collection the bucket is one document shared by every
+# process (optimistic compare-and-swap on its "v" field); without one it is
+# local to this process (QUOTA_BACKEND=memory, for tests and single workers).
+class TokenBucket:
+    def __init__(self, name: str, per_min: float, col=None):
+        self.name = name
+        self.rate = per_min / 60.0
+        self.capacity = float(per_min)
+        self._col = col
+        self._lock = threading.Lock()
+        self._local = {"tokens": self.capacity, "updated_at": time.time(), "v": 0}
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _read(self) -> Dict[str, Any]:
+        if self._col is None:
+            return dict(self._local)
+        doc = self._col.find_one({"_id": self.name})
+        if doc is None:
+            doc = {"_id": self.name, "tokens": self.capacity, "updated_at": time.time(), "v": 0}
+            try:
+                self._col.insert_one(doc)
+            except DuplicateKeyError:
+                doc = self._col.find_one({"_id": self.name})
+        return doc
+
+    def _write(self, old: Dict[str, Any], tokens: float, now: float) -> bool:
+        if self._col is None:
+            if self._local["v"] != old["v"]:
+                return False
+            self._local = {"tokens": tokens, "updated_at": now, "v": old["v"] + 1}
+            return True
+        res = self._col.update_one(
+            {"_id": self.name, "v": old["v"]},
+            {"$set": {"tokens": tokens, "updated_at": now}, "$inc": {"v": 1}},
+        )
+        return res.modified_count == 1
+
+    def _change(self, fn) -> float:
+        """Apply fn(tokens) -> (new_tokens, result) to the refilled bucket atomically."""
+        for _ in range(10):
+            with self._lock:
+                doc = self._read()
+                now = time.time()
+                tokens = min(self.capacity, doc["tokens"] + max(0.0, now - doc["updated_at"]) * self.rate)
+                new_tokens, result = fn(tokens)
+                if self._write(doc, new_tokens, now):
+                    return result
+        # Heavy contention: report a short wait rather than spinning
+        return 1.0 / max(self.rate, 1e-6)
+
+    def try_acquire(self, cost: float = 1.0) -> float:
+        """Take `cost` tokens if available; returns 0, or the seconds until they would be."""
+        if self.unlimited:
+            return 0.0
+
+        def take(tokens):
+            if tokens >= cost:
+                return tokens - cost, 0.0
+            return tokens, (cost - tokens) / self.rate
+        return self._change(take)
+
+    def acquire(self, cost: float = 1.0, timeout: float = 0.0):
+        """Block up to `timeout` seconds for `cost` tokens, else raise QuotaExhausted."""
+        deadline = time.time() + timeout
+        while True:
+            wait = self.try_acquire(cost)
+            if wait <= 0:
+                return
+            if time.time() + wait > deadline:
+                raise QuotaExhausted(self.name, wait)
+            time.sleep(wait)
+
+    def refund(self, cost: float = 1.0):
+        if not self.unlimited:
+            self._change(lambda tokens: (min(self.capacity, tokens + cost), None))
+
+    def drain(self):
+        """Empty the bucket, e.g. after the provider answered 429 anyway."""
+        if not self.unlimited:
+            self._change(lambda tokens: (0.0, None))
+
+_quota_col = quotas_col if QUOTA_BACKEND == "mongo" else None
+VEO_QUOTA = TokenBucket("veo", VEO_QUOTA_PER_MIN, _quota_col)
+OPENAI_QUOTA = TokenBucket("openai", OPENAI_QUOTA_PER_MIN, _quota_col)
+
+def is_not_found_error(e: Exception) -> bool:
+    """True for provider 404s, e.g. a Veo operation that no longer exists."""
+    code = getattr(e, "code", None) or getattr(e, "http_status", None) or getattr(e, "status_code", None)
+    return code == 404 or "NOT_FOUND" in str(e)
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """True for provider-side quota errors (HTTP 429 / RESOURCE_EXHAUSTED)."""
+    code = getattr(e, "code", None) or getattr(e, "http_status", None) or getattr(e, "status_code", None)
+    if code == 429 or "RESOURCE_EXHAUSTED" in str(e):
+        return True
+    # Nothing can have raised an openai error before the SDK was loaded
+    return openai.ready and isinstance(e, openai.error.RateLimitError)
+
+def quota_exhausted_response(e: QuotaExhausted):
+    retry_after = int(math.ceil(e.retry_after))
+    resp = jsonify({"error": str(e), "retry_after": retry_after})
+    resp.headers["Retry-After"] = str(retry_after)
+    return resp, 429
+
 # CORS configuration: allow specific origins in production via CORS_ORIGINS
 cors_origins = os.getenv("CORS_ORIGINS")
 if cors_origins:
@@ -108,16 +496,19 @@ app.config["VIDEO_DIR"] = str(VIDEO_DIR)
 app.config["HLS_DIR"] = str(HLS_DIR)
 
 # -----------------------
-# In-memory Job Store
+# Job Store
 # -----------------------
+# Jobs live in Mongo; JOBS only tracks the ones this process currently holds a lease on.
 JOBS: Dict[str, Dict[str, Any]] = {}
 JOBS_LOCK = threading.Lock()
 
-def make_job(prompt: str, negative_prompt: Optional[str], prompt_source: Optional[str]) -> str:
+def new_job_doc(prompt: str, negative_prompt: Optional[str], prompt_source: Optional[str],
+                status: str = "queued", **fields) -> Dict[str, Any]:
     job_id = uuid.uuid4().hex
-    job_doc = {
+    now = time.time()
+    return {
         "job_id": job_id,
-        "status": "queued",
+        "status": status,
         "progress": 0,
         "prompt": prompt,
         "negative_prompt": negative_prompt,
@@ -127,36 +518,364 @@ def make_job(prompt: str, negative_prompt: Optional[str], prompt_source: Optiona
         "mp4_url": None,
         "local_mp4": None,
         "hls_url": None,
-        "created_at": time.time(),
+        "attempts": 0,
+        "version": 0,
+        "lease_owner": None,
+        "lease_until": None,
+        "created_at": now,
+        "updated_at": now,
+        **fields,
     }
+
+def make_job(prompt: str, negative_prompt: Optional[str], prompt_source: Optional[str],
+             status: str = "queued", **fields) -> str:
+    job_doc = new_job_doc(prompt, negative_prompt, prompt_source, status, **fields)
+    job_id = job_doc["job_id"]
     try:
         videos_col.insert_one(job_doc)
-        print(f"[make_job] Job created: {job_id}")
+        log.info(f"[make_job] Job created: {job_id}")
     except Exception as e:
-        print(f"[make_job][ERROR] Failed to insert job {job_id}: {e}")
+        log.error(f"[make_job] Failed to insert job {job_id}: {e}")
     return job_id
 
+def apply_fields(doc: Dict[str, Any], fields: Dict[str, Any]):
+    """Apply $set-style fields (dotted paths like "timings.download" included) to a cached doc."""
+    for key, value in fields.items():
+        *parents, leaf = key.split(".")
+        target = doc
+        for part in parents:
+            # Copy on the way down: readers may hold the previous nested dicts
+            if isinstance(target, list):
+                target[int(part)] = dict(target[int(part)] or {})
+                target = target[int(part)]
+            else:
+                child = target.get(part)
+                target[part] = list(child) if isinstance(child, list) else dict(child or {})
+                target = target[part]
+        if isinstance(target, list):
+            target[int(leaf)] = value
+        else:
+            target[leaf] = value
+
+# Job state cache: status reads are served from memory for JOB_CACHE_TTL_SEC, and
+# progress/timings-only updates are merged per job and flushed with one bulk_write
+# every JOB_FLUSH_SEC. Everything else (status changes, URLs, errors) is written through.
+#
+# Every update bumps the job's "version" and sets "updated_at"; pending (unflushed)
+# bumps are counted so the version served from cache always matches what Mongo
+# will hold after a flush. Status ETags are derived from the version.
+class JobStateCache:
+    def __init__(self, ttl_sec: float, flush_sec: float, max_entries: int = 5000):
+        self.ttl_sec = ttl_sec
+        self.flush_sec = flush_sec
+        self.max_entries = max_entries
+        self._docs: Dict[str, Any] = {}      # job_id -> (doc, fetched_at)
+        self._pending: Dict[str, Dict[str, Any]] = {}  # job_id -> {"fields": {...}, "bumps": n}
+        self._lock = threading.Lock()
+        self._flusher_pid: Optional[int] = None
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            hit = self._docs.get(job_id)
+            if hit and now - hit[1] < self.ttl_sec:
+                CACHE_LOOKUPS.labels("job_state", "hit").inc()
+                return dict(hit[0])
+        CACHE_LOOKUPS.labels("job_state", "miss").inc()
+        doc = videos_col.find_one({"job_id": job_id})
+        if doc is None:
+            return None
+        with self._lock:
+            self._overlay_pending(doc)
+            self._store(job_id, doc, now)
+        return dict(doc)
+
+    def get_many(self, job_ids: List[str]) -> List[Dict[str, Any]]:
+        """Like get() for several jobs, fetching all cache misses with one query (input order kept)."""
+        now = time.time()
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for job_id in job_ids:
+                hit = self._docs.get(job_id)
+                if hit and now - hit[1] < self.ttl_sec:
+                    found[job_id] = dict(hit[0])
+        missing = [j for j in job_ids if j not in found]
+        CACHE_LOOKUPS.labels("job_state", "hit").inc(len(found))
+        CACHE_LOOKUPS.labels("job_state", "miss").inc(len(missing))
+        if missing:
+            for doc in videos_col.find({"job_id": {"$in": missing}}):
+                with self._lock:
+                    self._overlay_pending(doc)
+                    self._store(doc["job_id"], doc, now)
+                found[doc["job_id"]] = dict(doc)
+        return [found[j] for j in job_ids if j in found]
+
+    def put(self, doc: Dict[str, Any]):
+        """Cache a document read elsewhere, unless we already hold a newer version."""
+        doc = dict(doc)
+        with self._lock:
+            self._overlay_pending(doc)
+            hit = self._docs.get(doc["job_id"])
+            if hit and hit[0].get("version", 0) > doc.get("version", 0):
+                return
+            self._store(doc["job_id"], doc, time.time())
+
+    def update(self, job_id: str, fields: Dict[str, Any]) -> bool:
+        """Apply an update; returns False if a write-through matched no document."""
+        version = None
+        deferrable = all(k.split(".", 1)[0] in JOB_DEFERRABLE_FIELDS for k in fields)
+        fields = {**fields, "updated_at": time.time()}
+        with self._lock:
+            if deferrable:
+                pending = self._pending.setdefault(job_id, {"fields": {}, "bumps": 0})
+                pending["fields"].update(fields)
+                pending["bumps"] += 1
+                hit = self._docs.get(job_id)
+                if hit:
+                    apply_fields(hit[0], fields)
+                    hit[0]["version"] = hit[0].get("version", 0) + 1
+                    version = hit[0]["version"]
+                deferred = True
+            else:
+                pending = self._pending.pop(job_id, {"fields": {}, "bumps": 0})
+                fields = {**pending["fields"], **fields}
+                bumps = pending["bumps"] + 1
+                deferred = False
+        if deferred:
+            self._ensure_flusher()
+            # Reading the version of an uncached job costs a Mongo read; only pay it
+            # when someone here waits on the job. Other processes' watchers see the
+            # change once it is flushed.
+            if version is None and JOB_EVENTS.watching(job_id):
+                doc = self.get(job_id)
+                version = doc.get("version", 0) if doc else None
+            if version is not None:
+                JOB_EVENTS.publish(job_id, version)
+            return True
+        doc = videos_col.find_one_and_update(
+            {"job_id": job_id},
+            {"$set": fields, "$inc": {"version": bumps}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            return False
+        with self._lock:
+            self._overlay_pending(doc)
+            self._store(job_id, doc, time.time())
+        JOB_EVENTS.publish(job_id, doc["version"])
+        return True
+
+    def version(self, job_id: str) -> Optional[int]:
+        doc = self.get(job_id)
+        return doc.get("version", 0) if doc else None
+
+    def invalidate(self, job_id: str):
+        with self._lock:
+            self._docs.pop(job_id, None)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._evict(time.time())
+        if not pending:
+            return
+        ops = [
+            UpdateOne({"job_id": jid}, {"$set": p["fields"], "$inc": {"version": p["bumps"]}})
+            for jid, p in pending.items()
+        ]
+        try:
+            videos_col.bulk_write(ops, ordered=False)
+        except Exception as e:
+            log.error(f"[job_cache] Flush of {len(ops)} updates failed: {e}")
+            with self._lock:
+                for jid, p in pending.items():
+                    newer = self._pending.get(jid, {"fields": {}, "bumps": 0})
+                    self._pending[jid] = {
+                        "fields": {**p["fields"], **newer["fields"]},
+                        "bumps": p["bumps"] + newer["bumps"],
+                    }
+
+    def _overlay_pending(self, doc: Dict[str, Any]):
+        # Unflushed local updates are newer than what Mongo has
+        pending = self._pending.get(doc["job_id"])
+        if pending:
+            apply_fields(doc, pending["fields"])
+            doc["version"] = doc.get("version", 0) + pending["bumps"]
+
+    def _store(self, job_id: str, doc: Dict[str, Any], ts: float):
+        self._docs[job_id] = (doc, ts)
+        if len(self._docs) > self.max_entries:
+            self._evict(ts)
+
+    def _evict(self, now: float):
+        stale = [jid for jid, (_, ts) in self._docs.items() if now - ts >= self.ttl_sec]
+        for jid in stale:
+            del self._docs[jid]
+
+    def _ensure_flusher(self):
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name="job-state-flusher", daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_sec)
+            self.flush()
+
+# Job change notifications for streaming/long-poll status. Updates made in this
+# process are published directly; jobs being watched here but run by another
+# process are picked up by one watcher thread that re-reads them all in a single
+# query every JOB_EVENTS_POLL_SEC, so idle connections cost no Mongo reads.
+class JobEvents:
+    def __init__(self, poll_sec: float):
+        self.poll_sec = poll_sec
+        self._cv = threading.Condition()
+        self._versions: Dict[str, int] = {}
+        self._watchers: Dict[str, int] = {}
+        self._watcher_pid: Optional[int] = None
+
+    def publish(self, job_id: str, version: int):
+        with self._cv:
+            if job_id in self._watchers and version > self._versions.get(job_id, -1):
+                self._versions[job_id] = version
+                self._cv.notify_all()
+
+    def watching(self, job_id: str) -> bool:
+        with self._cv:
+            return job_id in self._watchers
+
+    def wait_for_change(self, job_id: str, since: int, timeout: float) -> bool:
+        with self._cv:
+            return self._cv.wait_for(lambda: self._versions.get(job_id, -1) > since, timeout)
+
+    @contextmanager
+    def watch(self, job_id: str):
+        self._ensure_watcher()
+        with self._cv:
+            self._watchers[job_id] = self._watchers.get(job_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cv:
+                self._watchers[job_id] -= 1
+                if self._watchers[job_id] <= 0:
+                    del self._watchers[job_id]
+                    self._versions.pop(job_id, None)
+
+    def _ensure_watcher(self):
+        with self._cv:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch_loop, name="job-events-watcher", daemon=True).start()
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(self.poll_sec)
+            with self._cv:
+                ids = list(self._watchers)
+            if not ids:
+                continue
+            try:
+                for doc in videos_col.find({"job_id": {"$in": ids}}):
+                    JOB_STATE.put(doc)
+                    self.publish(doc["job_id"], doc.get("version", 0))
+            except Exception as e:
+                log.error(f"[job_events] Watch query failed: {e}")
+
+JOB_STATE = JobStateCache(JOB_CACHE_TTL_SEC, JOB_FLUSH_SEC)
+JOB_EVENTS = JobEvents(JOB_EVENTS_POLL_SEC)
+atexit.register(JOB_STATE.flush)
+
 def get_job(job_id: str) -> Optional[Dict[str, Any]]:
     try:
-        job = videos_col.find_one({"job_id": job_id})
-        print(f"[get_job] Fetched job {job_id}: {bool(job)}")
-        return job
+        return JOB_STATE.get(job_id)
     except Exception as e:
-        print(f"[get_job][ERROR] Failed to fetch job {job_id}: {e}")
+        log.error(f"[get_job] Failed to fetch job {job_id}: {e}")
         return None
 
 def update_job(job_id: str, **kwargs):
     try:
-        result = videos_col.update_one({"job_id": job_id}, {"$set": kwargs})
-        print(f"[update_job] Updated job {job_id} with {kwargs}. Matched: {result.matched_count}, Modified: {result.modified_count}")
-        if result.matched_count == 0:
-            print(f"[update_job][WARN] No job found with job_id {job_id}")
+        if not JOB_STATE.update(job_id, kwargs):
+            log.warning(f"[update_job] No job found with job_id {job_id}")
     except Exception as e:
-        print(f"[update_job][ERROR] Failed to update job {job_id}: {e}")
+        log.error(f"[update_job] Failed to update job {job_id}: {e}")
+
+def record_stage(job_id: str, stage: str, seconds: float, sample: int = 0):
+    """
+    Export a stage's duration and keep it under the job's `timings` (seconds per
+    stage, "<stage>[<n>]" for sample n > 0 of a multi-sample job).
+    """
+    JOB_STAGE_SECONDS.labels(stage).observe(seconds)
+    key = f"{stage}[{sample}]" if sample else stage
+    # One dotted $set per stage: concurrent stages and samples never overwrite each other
+    update_job(job_id, **{f"timings.{key}": round(seconds, 3)})
+
+@contextmanager
+def job_stage(job_id: str, stage: str, sample: int = 0):
+    """Time the enclosed block as `stage` of the job (only recorded if it succeeds)."""
+    start = time.time()
+    yield
+    record_stage(job_id, stage, time.time() - start, sample)
+
+# Stage checkpoints live on the job document: checkpoints.<name> is when the
+# stage completed, except "operation", which holds the Veo operation name. A
+# retried or reclaimed job resumes after its last checkpoint (see
+# generate_video_job) instead of paying for a new generation.
+CHECKPOINTS = ("operation", "downloaded", "uploaded", "packaged", "thumbnails", "published")
+
+def checkpoint_fields(*reached: str, **values) -> Dict[str, Any]:
+    """update_job() fields recording checkpoints reached now (or explicit values, None to clear)."""
+    now = time.time()
+    return {**{f"checkpoints.{name}": now for name in reached},
+            **{f"checkpoints.{name}": value for name, value in values.items()}}
+
+def last_checkpoint(job: Dict[str, Any]) -> Optional[str]:
+    checkpoints = job.get("checkpoints") or {}
+    return next((name for name in reversed(CHECKPOINTS) if checkpoints.get(name)), None)
+
+def ensure_video_indexes():
+    """Indexes behind job lookups, history pagination, batches and the scheduler's claim query."""
+    for keys, opts in (
+        ("job_id", {"unique": True}),
+        ([("created_at", -1), ("job_id", -1)], {}),
+        ([("status", 1), ("created_at", 1)], {}),
+        ([("batch_id", 1), ("created_at", 1)], {"sparse": True}),
+    ):
+        try:
+            videos_col.create_index(keys, **opts)
+        except Exception as e:
+            log.error(f"[videos] Failed to create index {keys}: {e}")
+    try:
+        batches_col.create_index("batch_id", unique=True)
+    except Exception as e:
+        log.error(f"[batches] Failed to create index: {e}")
+
+# The history total is only informational, so an estimate refreshed now and then is enough
+_video_count = {"value": 0, "at": 0.0}
+_video_count_lock = threading.Lock()
+
+def estimated_video_count() -> int:
+    with _video_count_lock:
+        if time.time() - _video_count["at"] >= VIDEO_COUNT_TTL_SEC:
+            try:
+                _video_count["value"] = videos_col.estimated_document_count()
+                _video_count["at"] = time.time()
+            except Exception as e:
+                log.warning(f"[videos] Count failed: {e}")
+        return _video_count["value"]
 
 # -----------------------
 # GCS Helpers
 # -----------------------
+_upload_executor: Optional[ThreadPoolExecutor] = None
+_upload_executor_pid: Optional[int] = None
+_upload_executor_lock = threading.Lock()
+
 def gcs_blob(bucket_name: str, object_name: str):
     bucket = storage_client.bucket(bucket_name)
     return bucket.blob(object_name)
@@ -173,63 +892,441 @@ def gcs_signed_url(bucket_name: str, object_name: str, ttl_min: int, method: str
         method=method,
     )
 
-def upload_file_to_gcs(local_path: Path, object_name: str, content_type: str) -> str:
-    blob = gcs_blob(GCS_BUCKET, object_name)
-    blob.upload_from_filename(str(local_path), content_type=content_type)
-    blob.cache_control = "public, max-age=31536000, immutable"
-    blob.patch()
-    if GCS_PUBLIC:
-        return gcs_public_url(GCS_BUCKET, object_name)
-    else:
-        return gcs_signed_url(GCS_BUCKET, object_name, SIGNED_URL_TTL_MIN, method="GET")
-
-def upload_directory_to_gcs(local_dir: Path, prefix: str, content_type_map: Dict[str, str]):
+def gcs_retry():
+    from google.cloud.storage.retry import DEFAULT_RETRY
+    return DEFAULT_RETRY
+
+def _upload_tier(path: Path) -> int:
+    """Upload order: media first, then playlists/VTT, then the master playlist."""
+    if path.name == "master.m3u8":
+        return 2
+    if path.suffix.lower() in MANIFEST_SUFFIXES:
+        return 1
+    return 0
+
+def _upload_one(local_path: Path, object_name: str, content_type: str):
+    size = local_path.stat().st_size
+    # Files above the threshold go through a chunked resumable upload, so a
+    # transient failure only retries the current chunk
+    chunk_size = GCS_CHUNK_SIZE if size > GCS_RESUMABLE_THRESHOLD else None
+    blob = storage_client.bucket(GCS_BUCKET).blob(object_name, chunk_size=chunk_size)
+    # Sent with the upload request itself; no follow-up patch() round-trip
+    blob.cache_control = IMMUTABLE_CACHE_CONTROL
+    start = time.time()
+    blob.upload_from_filename(str(local_path), content_type=content_type, retry=gcs_retry())
+    kind = "hls" if object_name.startswith("hls/") else "mp4"
+    UPLOAD_SECONDS.labels(kind).inc(time.time() - start)
+    UPLOAD_BYTES.labels(kind).inc(size)
+    return object_name
+
+def _get_upload_executor() -> ThreadPoolExecutor:
+    global _upload_executor, _upload_executor_pid
+    with _upload_executor_lock:
+        if _upload_executor is None or _upload_executor_pid != os.getpid():
+            _upload_executor = ThreadPoolExecutor(max_workers=GCS_UPLOAD_WORKERS, thread_name_prefix="gcs-upload")
+            _upload_executor_pid = os.getpid()
+        return _upload_executor
+
+def upload_files_to_gcs(files: List[Tuple[Path, str, str]]) -> List[str]:
+    """Upload (local_path, object_name, content_type) tuples concurrently.
+
+    Files are uploaded in tiers (see _upload_tier) and each tier must finish
+    before the next starts, so a playlist never becomes visible before the
+    segments it references.
+    """
+    executor = _get_upload_executor()
     uploaded = []
-    for root, _, files in os.walk(local_dir):
-        for fname in files:
+    for tier in sorted({_upload_tier(f[0]) for f in files}):
+        batch = [f for f in files if _upload_tier(f[0]) == tier]
+        futures = [executor.submit(_upload_one, *f) for f in batch]
+        for fut in futures:
+            uploaded.append(fut.result())
+    return uploaded
+
+class SignedUrlCache:
+    """
+    Signed GET URLs for objects in the private bucket, built when a response
+    needs them rather than stored. Each URL is cached (LRU, max_entries) until
+    3/4 of its TTL has passed, so a client always gets at least a quarter of
+    the lifetime. get_many() serves a whole page from one cache pass and
+    signs only its misses (duplicates once).
+    """
+
+    def __init__(self, ttl_min: int, max_entries: int):
+        self._ttl_min = ttl_min
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get_many(self, object_names: List[str]) -> Dict[str, Optional[str]]:
+        """{object_name: signed URL}; None for objects that could not be signed."""
+        now = time.time()
+        urls: Dict[str, Optional[str]] = {}
+        with self._lock:
+            for name in object_names:
+                hit = self._mem.get(name)
+                if hit and hit[0] > now:
+                    self._mem.move_to_end(name)
+                    urls[name] = hit[1]
+        hits = len(urls)
+        misses = [n for n in dict.fromkeys(object_names) if n not in urls]
+        CACHE_LOOKUPS.labels("signed_url", "hit").inc(hits)
+        CACHE_LOOKUPS.labels("signed_url", "miss").inc(len(misses))
+        if not misses:
+            return urls
+
+        signed = {}
+        for name in misses:
+            try:
+                signed[name] = gcs_signed_url(GCS_BUCKET, name, self._ttl_min)
+            except Exception as e:
+                log.warning(f"[signed_url] Failed to sign {name}: {e}")
+                urls[name] = None
+        fresh_until = now + self._ttl_min * 60 * 0.75
+        with self._lock:
+            for name, url in signed.items():
+                self._mem[name] = (fresh_until, url)
+                self._mem.move_to_end(name)
+            while len(self._mem) > self._max_entries:
+                self._mem.popitem(last=False)
+        urls.update(signed)
+        return urls
+
+SIGNED_URLS = SignedUrlCache(SIGNED_URL_TTL_MIN, SIGNED_URL_CACHE_ENTRIES)
+
+def stored_object_url(object_name: str) -> Optional[str]:
+    """URL to persist for an uploaded object. Public URLs never change; private
+    ones are not stored at all but signed per response (with_signed_urls)."""
+    return gcs_public_url(GCS_BUCKET, object_name) if GCS_PUBLIC else None
+
+def with_signed_urls(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copies of job/video docs with mp4_url (their own and their assets') signed from mp4_gcs_path (private bucket only)."""
+    if GCS_PUBLIC:
+        return docs
+    names = [d["mp4_gcs_path"] for d in docs if d.get("mp4_gcs_path")]
+    names += [a["mp4_gcs_path"] for d in docs for a in d.get("assets") or () if a.get("mp4_gcs_path")]
+    urls = SIGNED_URLS.get_many(names)
+
+    def signed(d):
+        return {**d, "mp4_url": urls[d["mp4_gcs_path"]]} if d.get("mp4_gcs_path") else d
+
+    return [{**signed(d), "assets": [signed(a) for a in d["assets"]]} if d.get("assets") else signed(d)
+            for d in docs]
+
+def upload_file_to_gcs(local_path: Path, object_name: str, content_type: str) -> Optional[str]:
+    upload_files_to_gcs([(local_path, object_name, content_type)])
+    return stored_object_url(object_name)
+
+def open_gcs_writer(object_name: str, content_type: str):
+    """Writable file object backed by a chunked resumable upload (GCS_CHUNK_SIZE buffered)."""
+    blob = storage_client.bucket(GCS_BUCKET).blob(object_name)
+    blob.cache_control = IMMUTABLE_CACHE_CONTROL
+    return blob.open("wb", chunk_size=GCS_CHUNK_SIZE, content_type=content_type, retry=gcs_retry())
+
+def upload_directory_to_gcs(local_dir: Path, prefix: str, content_type_map: Dict[str, str], skip=()):
+    files = []
+    for root, _, names in os.walk(local_dir):
+        for fname in names:
             fpath = Path(root) / fname
+            if fpath in skip:
+                continue
             rel = fpath.relative_to(local_dir)
-            object_name = f"{prefix}/{rel.as_posix()}"
-            ext = fpath.suffix.lower()
-            ctype = content_type_map.get(ext, "application/octet-stream")
-            blob = gcs_blob(GCS_BUCKET, object_name)
-            blob.upload_from_filename(str(fpath), content_type=ctype)
-            blob.cache_control = "public, max-age=31536000, immutable"
-            blob.patch()
-            uploaded.append(object_name)
-    return uploaded
+            ctype = content_type_map.get(fpath.suffix.lower(), "application/octet-stream")
+            files.append((fpath, f"{prefix}/{rel.as_posix()}", ctype))
+    return upload_files_to_gcs(files)
+
+# -----------------------
+# Media Packaging (ffmpeg)
+# -----------------------
+HLS_CONTENT_TYPES = {
+    ".ts": "video/MP2T",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".m3u8": "application/x-mpegURL",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".vtt": "text/vtt",
+}
+
+# Files ffmpeg writes one after another, each finished once the next one exists
+INCREMENTAL_SUFFIXES = (".ts", ".m4s", ".jpg", ".jpeg", ".webp")
+
+class SegmentUploader:
+    """
+    Uploads an HLS tree to GCS while ffmpeg is still writing it. A background
+    thread polls every HLS_UPLOAD_POLL_SEC and uploads each segment or
+    thumbnail once ffmpeg has started the next file of the same kind in that
+    directory. finish() uploads whatever is left (init segments, playlists,
+    VTT) in the usual tier order once packaging is done.
+    """
+
+    def __init__(self, hls_path: Path, hls_object: str):
+        self.hls_path = hls_path
+        self.hls_object = hls_object
+        self._submitted = set()
+        self._futures = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"hls-upload-{self.hls_path.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(HLS_UPLOAD_POLL_SEC):
+            try:
+                self._scan()
+            except Exception as e:
+                log.warning(f"[HLS] Incremental upload scan failed for {self.hls_path}: {e}")
+
+    def _scan(self):
+        if not self.hls_path.is_dir():
+            return
+        executor = _get_upload_executor()
+        for directory in [self.hls_path, *(p for p in self.hls_path.iterdir() if p.is_dir())]:
+            by_kind: Dict[str, List[Path]] = {}
+            for f in directory.iterdir():
+                if f.suffix.lower() in INCREMENTAL_SUFFIXES:
+                    by_kind.setdefault(f.suffix.lower(), []).append(f)
+            for files in by_kind.values():
+                # The newest file of each kind may still be open in ffmpeg
+                for f in sorted(files)[:-1]:
+                    if f not in self._submitted:
+                        self._submitted.add(f)
+                        ctype = HLS_CONTENT_TYPES.get(f.suffix.lower(), "application/octet-stream")
+                        rel = f.relative_to(self.hls_path).as_posix()
+                        self._futures.append(executor.submit(_upload_one, f, f"{self.hls_object}/{rel}", ctype))
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def finish(self) -> str:
+        """Upload the rest of the tree; returns the master playlist URL."""
+        self.stop()
+        for fut in self._futures:
+            fut.result()
+        upload_directory_to_gcs(self.hls_path, self.hls_object, HLS_CONTENT_TYPES, skip=self._submitted)
+        # Note: Signed URLs are impractical for HLS segments; require public bucket for HLS
+        return gcs_public_url(GCS_BUCKET, f"{self.hls_object}/master.m3u8")
+
+def _ffprobe(args: List[str], src, data: Optional[bytes]) -> str:
+    return subprocess.run(
+        [FFPROBE_BIN, "-v", "error", *args, "pipe:0" if data is not None else str(src)],
+        input=data, check=True, capture_output=True,
+    ).stdout.decode("utf-8", "replace")
+
+def probe_media(local_mp4: Optional[Path], data: Optional[bytes] = None) -> Dict[str, Any]:
+    """Codec and keyframe layout of the first video/audio streams (packet-level, no decode).
+
+    With `data` (the head of a file still downloading) the bytes are probed over
+    stdin instead, and the keyframe layout only covers that prefix.
+    """
+    out = _ffprobe(["-show_entries", "stream=codec_type,codec_name,pix_fmt,width,height", "-of", "json"],
+                   local_mp4, data)
+    streams = json.loads(out).get("streams", [])
+    video = next((st for st in streams if st.get("codec_type") == "video"), None)
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
+
+    out = _ffprobe(["-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0"],
+                   local_mp4, data)
+    keyframes = []
+    for line in out.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                keyframes.append(float(pts))
+            except ValueError:
+                pass
+    keyframes.sort()
+    gaps = [b - a for a, b in zip(keyframes, keyframes[1:])]
+    return {
+        "video_codec": video and video.get("codec_name"),
+        "pix_fmt": video and video.get("pix_fmt"),
+        "width": video and video.get("width"),
+        "height": video and video.get("height"),
+        "audio_codec": audio and audio.get("codec_name"),
+        "max_gop_sec": max(gaps) if gaps else None,
+    }
+
+def can_stream_copy(info: Dict[str, Any]) -> bool:
+    """True if the source can be segmented into HLS/TS without re-encoding."""
+    if info.get("video_codec") != "h264" or info.get("pix_fmt") not in ("yuv420p", "yuvj420p"):
+        return False
+    if info.get("audio_codec") not in (None, "aac"):
+        return False
+    # Segments can only be cut on keyframes; keep them close to the target length
+    gop = info.get("max_gop_sec")
+    return gop is not None and gop <= HLS_SEGMENT_SEC * 1.5
+
+def parse_ladder(spec: str) -> List[Tuple[int, int]]:
+    """"720:2800k,360:800k" -> [(720, 2800), (360, 800)] as (height, kbps), tallest first."""
+    rungs = []
+    for part in spec.split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        height, _, rate = part.partition(":")
+        rungs.append((int(height.rstrip("p")), int(rate.rstrip("k") or "0")))
+    return sorted(rungs, reverse=True)
+
+HLS_LADDER = parse_ladder(HLS_LADDER_SPEC)
+
+def ladder_for_source(info: Dict[str, Any]) -> List[Tuple[int, int]]:
+    # Never upscale: drop rungs taller than the source, but always keep one
+    rungs = HLS_LADDER
+    src_h = info.get("height")
+    if src_h:
+        fitting = [r for r in rungs if r[0] <= src_h]
+        rungs = fitting or [(src_h, rungs[-1][1])]
+    return rungs
+
+def package_media(local_mp4: Path, hls_dir: Path):
+    """Produce the HLS renditions, master playlist and thumbnails from a single ffmpeg run.
+
+    The input is decoded once and fanned out with a split filter: one branch per
+    ABR rung (HLS_LADDER, keyframes forced on segment boundaries so renditions
+    stay aligned) and one for thumbnails. With an empty ladder a single rendition
+    is written, stream-copied when the source is already HLS-compatible.
+    Renditions are written to v<N>/index.m3u8 under a master.m3u8.
+    Returns (hls_path, vtt_path).
+    """
+    hls_path = hls_dir / local_mp4.stem
+    # A failed probe fails packaging: without it we cannot tell whether there is an
+    # audio track, and guessing "none" would silently drop the audio
+    info = probe_media(local_mp4)
+    cmd, thumb_size = packaging_command(str(local_mp4), hls_path, info)
+    rc = wait_ffmpeg(subprocess.Popen(cmd))
+    if rc:
+        raise subprocess.CalledProcessError(rc, cmd)
+    return hls_path, finish_packaging(hls_path, thumb_size)
+
+def wait_ffmpeg(proc: subprocess.Popen) -> int:
+    """Reap an ffmpeg process, counting its CPU time; returns the exit code."""
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    FFMPEG_CPU_SECONDS.inc(usage.ru_utime + usage.ru_stime)
+    return proc.returncode
+
+def packaging_command(input_arg: str, hls_path: Path, info: Dict[str, Any]):
+    """ffmpeg argv for package_media reading from `input_arg` (a path or pipe:0)."""
+    thumbs_dir = hls_path / "thumbs"
+    thumbs_dir.mkdir(exist_ok=True, parents=True)
+    has_audio = bool(info.get("audio_codec"))
+    rungs = ladder_for_source(info) if HLS_LADDER else []
+    copy = not rungs and can_stream_copy(info)
+    # A top rung at the source height is the source itself: copy it and encode only
+    # the rungs below, with keyframes where the source has them so segments align
+    copy_top = bool(rungs) and rungs[0][0] == info.get("height") and can_stream_copy(info)
+
+    thumb_w, thumb_h = thumbnail_size(info)
+    thumb_filter = f"fps=1/{THUMB_INTERVAL_SEC},scale={thumb_w}:{thumb_h}"
+    if THUMB_MODE == "sprite":
+        thumb_filter += f",tile={THUMB_SPRITE_COLS}x{THUMB_SPRITE_ROWS}"
+        thumb_pattern = f"sprite-%03d.{THUMB_FORMAT}"
+    else:
+        thumb_pattern = f"thumb-%04d.{THUMB_FORMAT}"
+
+    x264_args = [
+        "-preset", X264_PRESET,
+        "-threads", str(X264_THREADS),
+        "-pix_fmt", "yuv420p",
+        # Keyframe at every segment boundary (and nowhere else) so segments are
+        # exactly HLS_SEGMENT_SEC and line up across renditions
+        "-force_key_frames", "source" if copy_top else f"expr:gte(t,n_forced*{HLS_SEGMENT_SEC})",
+        "-sc_threshold", "0",
+    ]
+    if rungs:
+        encoded = [i for i in range(len(rungs)) if not (i == 0 and copy_top)]
+        branches = "".join(f"[s{i}]" for i in encoded)
+        graph = [f"[0:v]split={len(encoded) + 1}{branches}[t]"]
+        graph += [f"[s{i}]scale=-2:{rungs[i][0]}[v{i}]" for i in encoded]
+        video_args = ["-map", "0:v:0", "-c:v:0", "copy"] if copy_top else []
+        for i in encoded:
+            kbps = rungs[i][1]
+            video_args += [
+                "-map", f"[v{i}]",
+                f"-c:v:{i}", "libx264",
+                f"-b:v:{i}", f"{kbps}k",
+                f"-maxrate:v:{i}", f"{int(kbps * 1.07)}k",
+                f"-bufsize:v:{i}", f"{kbps * 2}k",
+            ]
+        video_args += x264_args
+    else:
+        graph = ["[0:v]null[t]"]
+        video_args = ["-map", "0:v:0"]
+        if copy:
+            video_args += ["-c:v", "copy"]
+        else:
+            # A rate cap is also what lets ffmpeg put BANDWIDTH into the master playlist
+            video_args += [
+                "-c:v", "libx264", "-crf", "23",
+                "-maxrate", f"{HLS_MAXRATE_KBPS}k", "-bufsize", f"{HLS_MAXRATE_KBPS * 2}k",
+                *x264_args,
+            ]
+    graph.append(f"[t]{thumb_filter}[th]")
+
+    audio_args = []
+    if has_audio:
+        for _ in range(max(1, len(rungs))):
+            audio_args += ["-map", "0:a:0"]
+        audio_args += ["-c:a", "copy"] if copy or copy_top else ["-c:a", "aac", "-b:a", "128k"]
+    stream_map = " ".join(
+        f"v:{i},a:{i}" if has_audio else f"v:{i}" for i in range(max(1, len(rungs)))
+    )
 
-# HLS packaging
-def package_hls(local_mp4: Path, hls_dir: Path):
-    hls_name = local_mp4.stem
-    hls_path = hls_dir / hls_name
-    hls_path.mkdir(exist_ok=True, parents=True)
+    seg_ext = "m4s" if HLS_SEGMENT_TYPE == "fmp4" else "ts"
     cmd = [
-        FFMPEG_BIN,
-        "-i", str(local_mp4),
-        "-c:v", "libx264",
-        "-c:a", "aac",
+        FFMPEG_BIN, "-y", "-v", "error",
+        "-i", input_arg,
+        "-filter_complex", ";".join(graph),
+        # Output 1: HLS renditions + master playlist
+        *video_args,
+        *audio_args,
         "-f", "hls",
-        "-hls_time", "2",
+        "-hls_time", str(HLS_SEGMENT_SEC),
         "-hls_list_size", "0",
-        "-hls_segment_filename", str(hls_path / "%03d.ts"),
-        str(hls_path / "index.m3u8"),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_type", HLS_SEGMENT_TYPE,
+        *(["-hls_fmp4_init_filename", "init.mp4"] if HLS_SEGMENT_TYPE == "fmp4" else []),
+        "-master_pl_name", "master.m3u8",
+        "-var_stream_map", stream_map,
+        "-hls_segment_filename", str(hls_path / "v%v" / f"%03d.{seg_ext}"),
+        str(hls_path / "v%v" / "index.m3u8"),
+        # Output 2: thumbnails (individual frames or tiled sprite sheets)
+        "-map", "[th]",
+        # -q:v is a JPEG qscale; libwebp takes a 0-100 quality instead
+        *(["-c:v", "libwebp", "-quality", "75"] if THUMB_FORMAT == "webp" else ["-q:v", "3"]),
+        "-f", "image2",
+        str(thumbs_dir / thumb_pattern),
     ]
-    subprocess.run(cmd, check=True)
-    return hls_path
-
-def upload_hls_to_gcs(hls_dir: Path, hls_object: str):
-    content_type_map = {
-        ".ts": "video/MP2T",
-        ".m3u8": "application/x-mpegURL",
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".webp": "image/webp",
-        ".vtt": "text/vtt",
-    }
-    upload_directory_to_gcs(hls_dir, hls_object, content_type_map)
-    # Note: Signed URLs are impractical for HLS segments; require public bucket for HLS
-    return gcs_public_url(GCS_BUCKET, f"{hls_object}/index.m3u8")
+    return cmd, (thumb_w, thumb_h)
+
+def finish_packaging(hls_path: Path, thumb_size: Tuple[int, int]) -> Path:
+    """Write the thumbnail VTT once ffmpeg has finished; returns its path."""
+    thumbs_dir = hls_path / "thumbs"
+    if THUMB_MODE == "sprite":
+        duration = playlist_duration(hls_path / "v0" / "index.m3u8")
+        return write_sprite_vtt(thumbs_dir, duration, *thumb_size)
+    return write_thumbnail_vtt(thumbs_dir, THUMB_INTERVAL_SEC)
+
+def thumbnail_size(info: Dict[str, Any]):
+    """Exact (even) thumbnail dimensions; sprite cue coordinates depend on them."""
+    w, h = info.get("width"), info.get("height")
+    if not w or not h:
+        w, h = 16, 9  # Veo is requested at 16:9
+    height = max(2, int(round(THUMB_WIDTH * h / w / 2)) * 2)
+    return THUMB_WIDTH, height
+
+def playlist_duration(playlist: Path) -> float:
+    total = 0.0
+    for line in playlist.read_text(encoding="utf-8").splitlines():
+        if line.startswith("#EXTINF:"):
+            total += float(line[len("#EXTINF:"):].split(",")[0])
+    return total
 
 def _format_ts(seconds: float) -> str:
     ms = int(round((seconds - int(seconds)) * 1000))
@@ -239,126 +1336,1458 @@ def _format_ts(seconds: float) -> str:
     s = total % 60
     return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
 
-def generate_thumbnails_per_image(local_mp4: Path, thumbs_dir: Path, fps: int = 1, width: int = 160) -> Path:
-    thumbs_dir.mkdir(exist_ok=True, parents=True)
-    # Generate JPEG thumbnails at 1 fps
-    out_pattern = thumbs_dir / "thumb-%04d.jpg"
-    cmd = [
-        FFMPEG_BIN,
-        "-i", str(local_mp4),
-        "-vf", f"fps={fps},scale={width}:-1",
-        "-q:v", "3",
-        str(out_pattern),
-    ]
-    subprocess.run(cmd, check=True)
-
-    # Build a simple VTT with 1s cues mapping to each image
+def write_thumbnail_vtt(thumbs_dir: Path, interval: float = 1.0) -> Path:
+    # Build a simple VTT with one cue per image, `interval` seconds each
     images = sorted([p for p in thumbs_dir.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".webp")])
     vtt_path = thumbs_dir / "thumbs.vtt"
     with open(vtt_path, "w", encoding="utf-8") as f:
         f.write("WEBVTT\n\n")
         for i, img in enumerate(images):
-            start = _format_ts(i * (1.0 / fps))
-            end = _format_ts((i + 1) * (1.0 / fps))
+            start = _format_ts(i * interval)
+            end = _format_ts((i + 1) * interval)
             # Reference image by filename relative to VTT file location
             f.write(f"{start} --> {end}\n")
             f.write(f"{img.name}\n\n")
     return vtt_path
 
+def write_sprite_vtt(thumbs_dir: Path, duration: float, tile_w: int, tile_h: int) -> Path:
+    # One cue per THUMB_INTERVAL_SEC pointing at its tile: sprite-NNN.jpg#xywh=x,y,w,h
+    per_sheet = THUMB_SPRITE_COLS * THUMB_SPRITE_ROWS
+    count = max(1, math.ceil(duration / THUMB_INTERVAL_SEC - 1e-6))
+    vtt_path = thumbs_dir / "thumbs.vtt"
+    with open(vtt_path, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n")
+        for i in range(count):
+            sheet, pos = divmod(i, per_sheet)
+            x = (pos % THUMB_SPRITE_COLS) * tile_w
+            y = (pos // THUMB_SPRITE_COLS) * tile_h
+            start = _format_ts(i * THUMB_INTERVAL_SEC)
+            end = _format_ts(min((i + 1) * THUMB_INTERVAL_SEC, max(duration, THUMB_INTERVAL_SEC)))
+            f.write(f"{start} --> {end}\n")
+            f.write(f"sprite-{sheet + 1:03d}.{THUMB_FORMAT}#xywh={x},{y},{tile_w},{tile_h}\n\n")
+    return vtt_path
+
+def mp4_moov_first(head: bytes) -> Optional[bool]:
+    """Walk the top-level MP4 boxes in `head`: True if moov precedes mdat (the file
+    can be demuxed from a pipe), False if mdat comes first, None if undecided."""
+    pos = 0
+    while pos + 8 <= len(head):
+        size = int.from_bytes(head[pos:pos + 4], "big")
+        box = head[pos + 4:pos + 8]
+        if box == b"moov":
+            return True
+        if box == b"mdat":
+            return False
+        if size == 1 and pos + 16 <= len(head):
+            size = int.from_bytes(head[pos + 8:pos + 16], "big")
+        if size < 8:
+            return None
+        pos += size
+    return None
+
+class TeeWriter:
+    """File-like sink forwarding every chunk to several writers in order."""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+        self.bytes_written = 0
+
+    def write(self, chunk: bytes) -> int:
+        for sink in self.sinks:
+            sink.write(chunk)
+        self.bytes_written += len(chunk)
+        return len(chunk)
+
+class StreamPackager:
+    """
+    Write sink that packages an MP4 while it is still downloading. The first
+    STREAM_PROBE_BYTES are held back and probed; if moov precedes mdat, ffmpeg
+    is started on stdin and fed chunk by chunk (the pipe buffer bounds memory).
+    Otherwise the download is spooled to `spool_path` and packaged from disk
+    once complete (also when the head cannot be probed). Packaging errors are
+    kept until close() so they never interrupt the other sinks.
+    """
+
+    def __init__(self, hls_dir: Path, spool_path: Path):
+        self.hls_dir = hls_dir
+        self.spool_path = spool_path
+        self.hls_path = hls_dir / spool_path.stem
+        self._head = bytearray()
+        self._proc: Optional[subprocess.Popen] = None
+        self._spool = None
+        self._thumb_size: Optional[Tuple[int, int]] = None
+        self._error: Optional[Exception] = None
+
+    @property
+    def spooled(self) -> bool:
+        return self._spool is not None
+
+    def write(self, chunk: bytes) -> int:
+        if self._error is None:
+            try:
+                if self._proc:
+                    self._proc.stdin.write(chunk)
+                elif self._spool:
+                    self._spool.write(chunk)
+                else:
+                    self._head += chunk
+                    if len(self._head) >= STREAM_PROBE_BYTES:
+                        self._start()
+            except Exception as e:
+                self._error = e
+                self.abort()
+        return len(chunk)
+
+    def _start(self):
+        head = bytes(self._head)
+        self._head = bytearray()
+        info = None
+        if mp4_moov_first(head):
+            try:
+                info = probe_media(None, data=head)
+            except Exception as e:
+                # package_media probes the whole file once it is spooled
+                log.warning(f"[package_media] ffprobe of the stream head failed, spooling instead: {e}")
+        if info is not None:
+            cmd, self._thumb_size = packaging_command("pipe:0", self.hls_path, info)
+            self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            self._proc.stdin.write(head)
+        else:
+            self._spool = open(self.spool_path, "wb")
+            self._spool.write(head)
+
+    def close(self) -> Tuple[Path, Path]:
+        """Finish packaging; returns (hls_path, vtt_path) like package_media."""
+        if self._error is None and not (self._proc or self._spool):
+            self._start()  # whole file fit in the probe window
+        if self._error is not None:
+            raise self._error
+        if self._spool:
+            self._spool.close()
+            return package_media(self.spool_path, self.hls_dir)
+        self._proc.stdin.close()
+        rc = wait_ffmpeg(self._proc)
+        if rc:
+            raise subprocess.CalledProcessError(rc, FFMPEG_BIN)
+        return self.hls_path, finish_packaging(self.hls_path, self._thumb_size)
+
+    def abort(self):
+        if self._proc and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+        if self._spool and not self._spool.closed:
+            self._spool.close()
+
+# -----------------------
+# Local Storage (VIDEO_DIR / HLS_DIR lifecycle)
+# -----------------------
+# Local media is tracked in "units": one file per MP4 under VIDEO_DIR and one
+# directory per job under HLS_DIR/<safe_uid>. A unit's mtime doubles as its last
+# access time (touched when served), so every process sharing the disk agrees on
+# the LRU order without shared state. Only names job_paths() produces count as
+# units; anything else under the roots (e.g. a .gitkeep) is never touched.
+HLS_UNIT_RE = re.compile(r"[0-9a-f]{8}")
+MP4_UNIT_RE = re.compile(r"[A-Za-z0-9_.-]+-([0-9a-f]{8})\.mp4")
+
+class LocalStorage:
+    def __init__(self, roots: List[Path], quota_bytes: int, orphan_sec: int):
+        self.roots = roots
+        self.quota_bytes = quota_bytes
+        self.orphan_sec = orphan_sec
+        self._lock = threading.Lock()
+        # unit -> bytes, for units whose job is finished (their size no longer changes)
+        self._settled: Dict[Path, int] = {}
+        self._janitor_pid: Optional[int] = None
+        self.stats = {"bytes_used": 0, "units": 0, "evictions": 0, "evicted_bytes": 0, "orphans_removed": 0}
+
+    def unit_for(self, path: Path) -> Optional[Path]:
+        path = Path(path).resolve()
+        for root in self.roots:
+            try:
+                rel = path.relative_to(root.resolve())
+            except ValueError:
+                continue
+            return root / rel.parts[0] if rel.parts else None
+        return None
+
+    @staticmethod
+    def _uid(unit: Path) -> Optional[str]:
+        """safe_uid of HLS_DIR/<safe_uid> or VIDEO_DIR/<name>[-<sample>]-<safe_uid>.mp4; None for other names."""
+        if unit.is_dir():
+            return unit.name if HLS_UNIT_RE.fullmatch(unit.name) else None
+        match = MP4_UNIT_RE.fullmatch(unit.name)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def _size(unit: Path) -> int:
+        if unit.is_file():
+            return unit.stat().st_size
+        total = 0
+        for root, _, names in os.walk(unit):
+            for name in names:
+                try:
+                    total += (Path(root) / name).stat().st_size
+                except OSError:
+                    pass
+        return total
+
+    def touch(self, path: Path):
+        """Mark the unit containing `path` as recently used (throttled to one utime per LOCAL_TOUCH_SEC)."""
+        unit = self.unit_for(path)
+        try:
+            if unit and time.time() - unit.stat().st_mtime > LOCAL_TOUCH_SEC:
+                os.utime(unit)
+        except OSError:
+            pass
+
+    def remove(self, path: Path) -> int:
+        unit = self.unit_for(path)
+        if unit is None or not unit.exists():
+            return 0
+        size = self._settled.get(unit) or self._size(unit)
+        if unit.is_dir():
+            shutil.rmtree(unit, ignore_errors=True)
+        else:
+            unit.unlink(missing_ok=True)
+        with self._lock:
+            self._settled.pop(unit, None)
+        return size
+
+    def _job_for(self, uid: str) -> Optional[Dict[str, Any]]:
+        with JOBS_LOCK:
+            if any(job_id.startswith(uid) for job_id in JOBS):
+                return {"status": "running", "lease_until": time.time() + JOB_LEASE_SEC}
+        # Anchored prefix regex is served by the unique job_id index
+        return videos_col.find_one({"job_id": {"$regex": f"^{re.escape(uid)}"}},
+                                   {"job_id": 1, "status": 1, "hls_url": 1, "lease_until": 1})
+
+    def _classify(self, unit: Path) -> str:
+        """
+        "active" (a job may still write it), "served" (needed for local serving),
+        "stale" or "foreign" (not named like a unit; left alone).
+        """
+        uid = self._uid(unit)
+        if uid is None:
+            return "foreign"
+        job = self._job_for(uid)
+        if job and job.get("status") not in TERMINAL_STATUSES:
+            if (job.get("lease_until") or 0) > time.time() or job.get("status") in ("queued", "waiting"):
+                return "active"
+        if unit.is_dir() and job and not GCS_PUBLIC and (job.get("hls_url") or "").startswith(f"/hls/{unit.name}/"):
+            return "served"
+        return "stale"
+
+    def _forget_urls(self, unit: Path):
+        # Evicted private-bucket HLS: drop the dangling URLs so clients fall back to the MP4
+        prefix = {"$regex": f"^/hls/{re.escape(unit.name)}/"}
+        update = {"$set": {"hls_url": None, "thumb_vtt_url": None}}
+        try:
+            videos_col.update_many({"hls_url": prefix}, {**update, "$inc": {"version": 1}})
+            gen_cache_col.update_many({"hls_url": prefix}, update)
+        except Exception as e:
+            log.warning(f"[storage] Failed to clear URLs for {unit.name}: {e}")
+
+    def sweep(self):
+        """Delete stale and orphaned units, then evict served units LRU-first down to the quota."""
+        now = time.time()
+        for root in self.roots:
+            for unit in list(root.iterdir()):
+                try:
+                    mtime = unit.stat().st_mtime
+                except OSError:
+                    continue
+                if unit in self._settled:
+                    continue
+                try:
+                    state = self._classify(unit)
+                except Exception as e:
+                    log.warning(f"[storage] Could not classify {unit}: {e}")
+                    continue
+                if state == "served":
+                    self.keep(unit, enforce=False)
+                elif state == "stale" and now - mtime > self.orphan_sec:
+                    self.remove(unit)
+                    self.stats["orphans_removed"] += 1
+                    log.info(f"[storage] Removed orphaned {unit}")
+        self.enforce_quota()
+
+    def keep(self, path: Path, enforce: bool = True):
+        """Account a finished unit that must stay on disk for local serving."""
+        unit = self.unit_for(path)
+        if unit is None or not unit.exists():
+            return
+        size = self._size(unit)
+        with self._lock:
+            self._settled[unit] = size
+        if enforce:
+            self.enforce_quota()
+
+    def enforce_quota(self):
+        served = []
+        with self._lock:
+            for unit, size in list(self._settled.items()):
+                try:
+                    served.append((unit.stat().st_mtime, unit, size))
+                except OSError:
+                    # Removed by another process
+                    del self._settled[unit]
+        used = sum(size for _, _, size in served)
+        if self.quota_bytes > 0 and used > self.quota_bytes:
+            for _, unit, size in sorted(served):
+                if used <= self.quota_bytes:
+                    break
+                self.remove(unit)
+                self._forget_urls(unit)
+                used -= size
+                self.stats["evictions"] += 1
+                self.stats["evicted_bytes"] += size
+                log.info(f"[storage] Evicted {unit} ({size} bytes)")
+        self.stats["bytes_used"] = used
+        self.stats["units"] = len(self._settled)
+
+    def metrics(self) -> Dict[str, Any]:
+        disk = shutil.disk_usage(self.roots[0])
+        return {**self.stats, "quota_bytes": self.quota_bytes,
+                "disk_free_bytes": disk.free, "disk_total_bytes": disk.total}
+
+    def _janitor_loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                log.error(f"[storage] Janitor sweep failed: {e}")
+            time.sleep(LOCAL_JANITOR_SEC)
+
+    def start_janitor(self):
+        with self._lock:
+            if self._janitor_pid == os.getpid() or LOCAL_JANITOR_SEC <= 0:
+                return
+            self._janitor_pid = os.getpid()
+        threading.Thread(target=self._janitor_loop, name="storage-janitor", daemon=True).start()
+
+LOCAL_STORAGE = LocalStorage([VIDEO_DIR, HLS_DIR], LOCAL_STORAGE_QUOTA_MB * 1024 * 1024, LOCAL_ORPHAN_SEC)
+
+# -----------------------
+# Generation Cache
+# -----------------------
+# Opt-in (GEN_CACHE_ENABLED). Entries in generation_cache are keyed by a hash of the
+# normalized prompt and GenerateVideosConfig parameters. A "pending" entry names the
+# leader job actually generating and the follower jobs waiting on it; once the
+# leader is done the entry holds its assets and later requests reuse them.
+CACHED_ASSET_FIELDS = ("mp4_gcs_path", "mp4_url", "local_mp4", "hls_url", "thumb_vtt_url", "assets")
+
+def generation_params(prompt: str, negative_prompt: Optional[str], samples: int = 1) -> Dict[str, Any]:
+    """Model, prompt and GenerateVideosConfig fields for a generation."""
+    params = {
+        "model": MODEL_NAME,
+        "prompt": prompt,
+        "person_generation": "allow_adult",
+        "aspect_ratio": "16:9",
+        "duration_seconds": 6,
+        "negative_prompt": negative_prompt,
+    }
+    if samples > 1:
+        # Only set when asked for, so single-sample cache keys stay what they were
+        params["number_of_videos"] = samples
+    return params
+
+def generation_cache_key(params: Dict[str, Any]) -> str:
+    norm = dict(params)
+    for field in ("prompt", "negative_prompt"):
+        norm[field] = " ".join((norm.get(field) or "").split()).lower()
+    return hashlib.sha256(json.dumps(norm, sort_keys=True).encode("utf-8")).hexdigest()
+
+def ensure_generation_cache_indexes():
+    try:
+        gen_cache_col.create_index("key", unique=True)
+        gen_cache_col.create_index("last_used_at", expireAfterSeconds=GEN_CACHE_TTL_SEC)
+    except Exception as e:
+        log.error(f"[gen_cache] Failed to create indexes: {e}")
+
+def attach_to_generation(job_id: str, key: str) -> str:
+    """Attach a new (status "waiting") job to the cache entry for `key`.
+
+    Returns "hit" (assets copied, job done), "follower" (waiting on an in-flight
+    leader), "leader" (this job must generate) or "uncached".
+    """
+    for _ in range(3):
+        # BSON date, not epoch seconds: the TTL index only expires date fields
+        now = datetime.now(timezone.utc)
+        entry = gen_cache_col.find_one_and_update(
+            {"key": key},
+            {"$set": {"last_used_at": now}, "$inc": {"hits": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if entry is None:
+            try:
+                gen_cache_col.insert_one({
+                    "key": key,
+                    "status": "pending",
+                    "leader_job_id": job_id,
+                    "followers": [],
+                    "hits": 0,
+                    "created_at": time.time(),
+                    "last_used_at": now,
+                })
+                CACHE_LOOKUPS.labels("generation", "leader").inc()
+                return "leader"
+            except DuplicateKeyError:
+                continue
+        if entry["status"] == "done":
+            apply_cached_assets(job_id, entry)
+            CACHE_LOOKUPS.labels("generation", "hit").inc()
+            return "hit"
+        joined = gen_cache_col.update_one(
+            {"key": key, "status": "pending"},
+            {"$addToSet": {"followers": job_id}},
+        )
+        if joined.matched_count:
+            CACHE_LOOKUPS.labels("generation", "follower").inc()
+            return "follower"
+        # The leader finished between our two reads; look again
+    CACHE_LOOKUPS.labels("generation", "uncached").inc()
+    return "uncached"
+
+def apply_cached_assets(job_id: str, entry: Dict[str, Any]):
+    assets = {k: entry.get(k) for k in CACHED_ASSET_FIELDS}
+    if not GCS_PUBLIC:
+        # Entries from before URLs were signed per response may hold an expired one
+        assets["mp4_url"] = None
+        if assets["assets"]:
+            assets["assets"] = [{**a, "mp4_url": None} for a in assets["assets"]]
+    update_job(job_id, status="done", progress=100, cache_source_job_id=entry.get("leader_job_id"), **assets)
+
+def settle_generation(job_id: str):
+    """Publish a finished job's assets to its cache entry, or hand leadership on after a failure."""
+    job = get_job(job_id)
+    if not job or not job.get("cache_key") or job.get("cache_source_job_id"):
+        return
+    key = job["cache_key"]
+    if job.get("status") == "done":
+        assets = {k: job.get(k) for k in CACHED_ASSET_FIELDS}
+        update = {"$set": {"status": "done", "leader_job_id": job_id, "followers": [],
+                           "last_used_at": datetime.now(timezone.utc), **assets}}
+        entry = gen_cache_col.find_one_and_update({"key": key, "leader_job_id": job_id}, update)
+        if entry is None:
+            # Not the leader (e.g. a ?fresh=1 run): refresh the entry unless another
+            # generation for the key is in flight
+            try:
+                gen_cache_col.update_one({"key": key, "status": "done"}, update, upsert=True)
+            except DuplicateKeyError:
+                pass
+            return
+        for follower in entry.get("followers", []):
+            apply_cached_assets(follower, {**assets, "leader_job_id": job_id})
+        trim_generation_cache()
+    elif job.get("status") == "error":
+        entry = gen_cache_col.find_one({"key": key, "leader_job_id": job_id, "status": "pending"})
+        if not entry:
+            return
+        followers = entry.get("followers", [])
+        if not followers:
+            gen_cache_col.delete_one({"_id": entry["_id"], "leader_job_id": job_id})
+            return
+        # Promote the oldest follower to generate instead
+        promoted = gen_cache_col.update_one(
+            {"_id": entry["_id"], "leader_job_id": job_id},
+            {"$set": {"leader_job_id": followers[0]}, "$pull": {"followers": followers[0]}},
+        )
+        if promoted.matched_count:
+            follower = get_job(followers[0]) or {}
+            if follower.get("batch_id"):
+                # Batch children are admitted under their batch's concurrency budget
+                update_job(followers[0], status="batched")
+                promote_batch(follower["batch_id"])
+            else:
+                update_job(followers[0], status="queued")
+                JOB_QUEUE.notify(followers[0])
+
+def trim_generation_cache():
+    excess = gen_cache_col.estimated_document_count() - GEN_CACHE_MAX_ENTRIES
+    if excess <= 0:
+        return
+    oldest = gen_cache_col.find({"status": "done"}, {"_id": 1}).sort("last_used_at", 1).limit(excess)
+    gen_cache_col.delete_many({"_id": {"$in": [d["_id"] for d in oldest]}})
+
 # -----------------------
 # Background Job Worker
 # -----------------------
-def generate_video_job(job_id: str):
+def job_paths(job: Dict[str, Any], index: int = 0):
+    filename_base = secure_filename(job["prompt"])[:40] or "video"
+    safe_uid = job["job_id"][:8]
+    # Sample 0 keeps the single-sample name; the others are numbered from 2. The
+    # uid stays last, which is where LocalStorage looks for it
+    mp4_name = f"{filename_base}-{safe_uid}.mp4" if not index else f"{filename_base}-{index + 1}-{safe_uid}.mp4"
+    return safe_uid, VIDEO_DIR / mp4_name, f"videos/{mp4_name}"
+
+# Multi-sample jobs ("samples" > 1) get every video of their Veo operation. Each
+# one is an entry of the job's "assets" list ({"index", "mp4_url", "hls_url",
+# ..., "checkpoints"}); sample 0 is also mirrored into the job's own fields, so
+# clients that only know one video per job keep working.
+def sample_job_fields(samples: int) -> Dict[str, Any]:
+    """make_job() fields for a job asking for `samples` videos."""
+    if samples <= 1:
+        return {}
+    return {"samples": samples, "assets": [{"index": i} for i in range(samples)]}
+
+def job_samples(job: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per-sample views of a job, shaped like a single-sample job (job_id, prompt, checkpoints, ...)."""
+    assets = job.get("assets") or []
+    return [job] + [{**a, "job_id": job["job_id"], "prompt": job["prompt"]} for a in assets[1:]]
+
+def sample_updater(job_id: str, index: int, multi: bool):
+    """
+    update_job() for one sample. Sample 0 writes the job's own fields (and
+    reports progress); with several samples its fields are also set under
+    assets.<index>, where the other samples keep theirs.
+    """
+    def update(**fields):
+        progress = fields.pop("progress", None)
+        out: Dict[str, Any] = {}
+        if index == 0:
+            out.update(fields)
+            if progress is not None:
+                out["progress"] = progress
+        if multi:
+            out.update({f"assets.{index}.{k}": v for k, v in fields.items()})
+        if out:
+            update_job(job_id, **out)
+    return update
+
+def sample_saved(view: Dict[str, Any], local_mp4: Path) -> bool:
+    """Whether a sample's MP4 survives without the Veo operation (uploaded, or downloaded here)."""
+    checkpoints = view.get("checkpoints") or {}
+    return bool(checkpoints.get("uploaded") or (checkpoints.get("downloaded") and local_mp4.exists()))
+
+def generate_video_job(job_id: str) -> bool:
+    """Submit the Veo operation and hand it to the poller.
+
+    A job with checkpoints (retried, or reclaimed after a worker died) skips
+    what is already done: with the MP4 of every sample saved it goes straight to
+    finish_video_job, and with an operation name it re-attaches the poller to
+    that operation instead of submitting a new one.
+
+    Returns True when the job was handed off (the poller or task queue will
+    run finish_video_job), False when it ended here.
+    """
     job = get_job(job_id)
     if not job:
-        return
+        return False
 
-    prompt = job["prompt"]
-    negative_prompt = job["negative_prompt"]
+    from google.genai import types
 
-    filename_base = secure_filename(prompt)[:40] or "video"
-    safe_uid = job_id[:8]
-    mp4_name = f"{filename_base}-{safe_uid}.mp4"
-    local_mp4 = VIDEO_DIR / mp4_name
-    mp4_object = f"videos/{mp4_name}"
+    params = generation_params(job["prompt"], job["negative_prompt"], job.get("samples") or 1)
+    config = {k: v for k, v in params.items() if k not in ("model", "prompt")}
+    checkpoints = job.get("checkpoints") or {}
+    saved = [sample_saved(view, job_paths(job, i)[1]) for i, view in enumerate(job_samples(job))]
 
     try:
+        if all(saved):
+            # No Veo request this time; give back the token the worker took for it
+            VEO_QUOTA.refund()
+            update_job(job_id, status="running")
+            log.info(f"[scheduler] Resuming job {job_id} after checkpoint {last_checkpoint(job)}")
+            enqueue_task(finish_video_job, job_id, None)
+            return True
+
+        # Held until the operation completes; released by the poller
+        acquire_stage("veo")
+        if checkpoints.get("operation"):
+            VEO_QUOTA.refund()
+            update_job(job_id, status="running")
+            log.info(f"[scheduler] Re-attaching job {job_id} to {checkpoints['operation']}")
+            operation = types.GenerateVideosOperation(name=checkpoints["operation"])
+            OPERATION_POLLER.watch(job_id, operation, params["model"])
+            return True
+
         update_job(job_id, status="running", progress=5)
+        try:
+            with job_stage(job_id, "veo_submit"):
+                operation = genai_client.models.generate_videos(
+                    model=params["model"],
+                    prompt=params["prompt"],
+                    config=types.GenerateVideosConfig(**config),
+                )
+        except Exception:
+            release_stage("veo")
+            raise
+        if operation.name:
+            update_job(job_id, **checkpoint_fields(operation=operation.name))
+        OPERATION_POLLER.watch(job_id, operation, params["model"])
+        return True
 
-        operation = genai_client.models.generate_videos(
-            model=MODEL_NAME,
-            prompt=prompt,
-            config=types.GenerateVideosConfig(
-                person_generation="allow_adult",
-                aspect_ratio="16:9",
-                duration_seconds=6,
-                negative_prompt=negative_prompt,
-            ),
-        )
+    except Exception as e:
+        if is_rate_limit_error(e):
+            # Our bucket was optimistic; empty it so every worker backs off, and retry later
+            VEO_QUOTA.drain()
+            defer_for_quota(job_id, 60.0 / max(VEO_QUOTA_PER_MIN, 1))
+            log.warning(f"[scheduler] Veo rate limited job {job_id}, requeued: {e}")
+            return False
+        update_job(job_id, status="error", error=str(e))
+        return False
+
+def download_generated_video(video, sink):
+    """Write the generated MP4 into `sink` (anything with write()) in chunks."""
+    data = getattr(video, "video_bytes", None)
+    if data is not None:
+        # Already inline in the operation response (nothing left to download)
+        for i in range(0, len(data), STREAM_CHUNK_SIZE):
+            sink.write(data[i:i + STREAM_CHUNK_SIZE])
+        return
+    genai_client.files.download(file=video, destination=sink)
+
+_stage_executor: Optional[ThreadPoolExecutor] = None
+_stage_executor_pid: Optional[int] = None
+_stage_executor_lock = threading.Lock()
+
+def _get_stage_executor() -> ThreadPoolExecutor:
+    global _stage_executor, _stage_executor_pid
+    with _stage_executor_lock:
+        if _stage_executor is None or _stage_executor_pid != os.getpid():
+            # At most two stages of a sample run at once (MP4 upload next to packaging).
+            # Stages block on stage slots while holding a thread, so the pool must fit
+            # every sample of every job or slot holders could starve for a thread.
+            workers = max(2, JOB_WORKERS * 2 * max(1, VEO_MAX_SAMPLES))
+            _stage_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-stage")
+            _stage_executor_pid = os.getpid()
+        return _stage_executor
+
+def run_stage_graph(job_id: str, stages: Dict[str, Tuple[Tuple[str, ...], Any]],
+                    done: Optional[Dict[str, Any]] = None, sample: int = 0) -> Dict[str, Any]:
+    """Run a job's stages, each as soon as the stages it depends on have finished.
+
+    `stages` maps name -> (dependencies, fn). fn(results) runs under
+    job_stage(job_id, name, sample) and can read the results of its dependencies, so
+    independent stages overlap. A stage that raises is recorded as its
+    exception, and everything depending on it is skipped with that exception.
+    Stages in `done` (name -> result, e.g. from checkpoints) are not run.
+    Returns {name: result or exception}.
+    """
+    executor = _get_stage_executor()
+    results: Dict[str, Any] = dict(done or {})
+    pending = {name: stage for name, stage in stages.items() if name not in results}
+    running = {}
+
+    def run(name, fn):
+        with job_stage(job_id, name, sample):
+            return fn(results)
+
+    while pending or running:
+        for name, (deps, fn) in list(pending.items()):
+            if not all(d in results for d in deps):
+                continue
+            del pending[name]
+            failed = next((results[d] for d in deps if isinstance(results[d], Exception)), None)
+            if failed is not None:
+                results[name] = failed
+            else:
+                running[executor.submit(run, name, fn)] = name
+        if not running:
+            if pending and not any(all(d in results for d in deps) for deps, _ in pending.values()):
+                raise ValueError(f"Unsatisfiable stage dependencies: {sorted(pending)}")
+            continue
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for fut in done:
+            name = running.pop(fut)
+            try:
+                results[name] = fut.result()
+            except Exception as e:
+                results[name] = e
+    return results
+
+def stream_stages(update, video, local_mp4: Path, mp4_object: str, hls_dir: Path):
+    """
+    Stages for VEO_TRANSFER_MODE=stream. The MP4 is downloaded once, teeing each
+    chunk into a resumable GCS upload and into ffmpeg (StreamPackager), so
+    nothing holds more than a chunk of the file in memory. The upload and
+    ffmpeg consume the download as it arrives: "download" covers all three,
+    then "mp4_upload" (the final flush) and "package" finish side by side.
+    """
+    def download(results):
+        # Released by mp4_upload and package respectively
+        acquire_stage("ffmpeg")
+        acquire_stage("upload")
+        packager = StreamPackager(hls_dir, local_mp4)
+        start = time.time()
+        try:
+            writer = open_gcs_writer(mp4_object, "video/mp4")
+            tee = TeeWriter(writer, packager)
+            download_generated_video(video, tee)
+        except Exception:
+            packager.abort()
+            release_stage("upload")
+            release_stage("ffmpeg")
+            raise
+        return writer, packager, tee, start
+
+    def mp4_upload(results):
+        writer, _, tee, start = results["download"]
+        try:
+            writer.close()
+        finally:
+            release_stage("upload")
+        UPLOAD_SECONDS.labels("mp4").inc(time.time() - start)
+        UPLOAD_BYTES.labels("mp4").inc(tee.bytes_written)
+        update(progress=88, mp4_url=stored_object_url(mp4_object), mp4_gcs_path=mp4_object,
+               **checkpoint_fields("uploaded"))
+
+    def package(results):
+        _, packager, _, _ = results["download"]
+        try:
+            packaged = packager.close()
+        finally:
+            release_stage("ffmpeg")
+            if packager.spooled:
+                update(local_mp4=str(local_mp4), **checkpoint_fields("downloaded"))
+        update(**checkpoint_fields("packaged", thumbnails=packaged[1].name))
+        return packaged
+
+    return {
+        "download": ((), download),
+        "mp4_upload": (("download",), mp4_upload),
+        "package": (("download",), package),
+    }
 
-        prog = 5
-        while not operation.done:
-            time.sleep(5)
-            prog = min(prog + 10, 70)
-            update_job(job_id, progress=prog)
-            operation = genai_client.operations.get(operation)
+def file_stages(update, video, local_mp4: Path, mp4_object: str, hls_dir: Path):
+    """
+    Stages for VEO_TRANSFER_MODE=file (and for resumed jobs): download to disk,
+    then upload the MP4 while ffmpeg packages it. With `video` None the MP4 is
+    fetched back from GCS instead of Veo.
+    """
+    def download(results):
+        with open(local_mp4, "wb") as f:
+            if video is not None:
+                download_generated_video(video, f)
+            else:
+                gcs_blob(GCS_BUCKET, mp4_object).download_to_file(f, retry=gcs_retry())
+        update(progress=80, local_mp4=str(local_mp4), **checkpoint_fields("downloaded"))
+
+    def mp4_upload(results):
+        with stage_slot("upload"):
+            mp4_url = upload_file_to_gcs(local_mp4, mp4_object, content_type="video/mp4")
+        update(progress=88, mp4_url=mp4_url, mp4_gcs_path=mp4_object, **checkpoint_fields("uploaded"))
+
+    def package(results):
+        # Leftovers of an interrupted run must not end up in the upload
+        shutil.rmtree(hls_dir / local_mp4.stem, ignore_errors=True)
+        with stage_slot("ffmpeg"):
+            # HLS + per-image thumbnails/VTT (under packaged_dir/thumbs) in one pass
+            packaged = package_media(local_mp4, hls_dir)
+        update(**checkpoint_fields("packaged", thumbnails=packaged[1].name))
+        return packaged
+
+    return {
+        "download": ((), download),
+        "mp4_upload": (("download",), mp4_upload),
+        "package": (("download",), package),
+    }
 
-        if getattr(operation, "error", None):
-            raise RuntimeError(str(operation.error))
+def completed_stages(job: Dict[str, Any], local_mp4: Path, hls_dir: Path) -> Dict[str, Any]:
+    """
+    run_stage_graph results for the stages a job's checkpoints show as done and
+    still usable here. Local files (the MP4, the packaged tree) only count if
+    they exist on this host; the janitor removes them LOCAL_ORPHAN_SEC after a failure.
+    """
+    checkpoints = job.get("checkpoints") or {}
+    hls_path = hls_dir / local_mp4.stem
+    vtt_path = hls_path / "thumbs" / (checkpoints.get("thumbnails") or "thumbs.vtt")
+    done: Dict[str, Any] = {}
+    if checkpoints.get("uploaded") and job.get("mp4_gcs_path"):
+        done["mp4_upload"] = None
+    packaged_here = (hls_path / "master.m3u8").exists() and vtt_path.exists()
+    if checkpoints.get("published") and job.get("hls_url") and (GCS_PUBLIC or packaged_here):
+        done["package"] = (hls_path, vtt_path)
+        done["hls_upload"] = job["hls_url"]
+    elif checkpoints.get("packaged") and packaged_here:
+        done["package"] = (hls_path, vtt_path)
+    if ("mp4_upload" in done and "package" in done) or (checkpoints.get("downloaded") and local_mp4.exists()):
+        done["download"] = None
+    return done
+
+def finish_sample(job_id: str, view: Dict[str, Any], index: int, video, multi: bool) -> bool:
+    """
+    Download, upload and package one sample (`view` from job_samples).
+
+    The work runs as a stage graph (run_stage_graph): download -> {mp4_upload,
+    package -> hls_upload}. The sample is playable (mp4_url set) as soon as the
+    MP4 upload lands, while packaging may still be running; HLS segments and
+    thumbnails of public buckets are uploaded as ffmpeg writes them.
+    Stages behind a checkpoint are skipped; `video` is None when the MP4 was
+    already saved (locally or in GCS). Raises if the MP4 could not be stored.
+    Returns whether the HLS tree is served from this host.
+    """
+    safe_uid, local_mp4, mp4_object = job_paths(view, index)
+    update = sample_updater(job_id, index, multi)
+    hls_dir = HLS_DIR / safe_uid
+    # Compute common relative dir for local and GCS (include stem)
+    rel_dir = f"{safe_uid}/{local_mp4.stem}"
+    hls_object = f"hls/{rel_dir}"
+    segments = None
+    try:
+        done = completed_stages(view, local_mp4, hls_dir)
+        if done:
+            log.info(f"[resume] Job {job_id} sample {index} skips completed stages: {', '.join(sorted(done))}")
+        if VEO_TRANSFER_MODE == "stream" and video is not None and not done:
+            stages = stream_stages(update, video, local_mp4, mp4_object, hls_dir)
+        else:
+            stages = file_stages(update, video, local_mp4, mp4_object, hls_dir)
+        if GCS_PUBLIC and "hls_upload" not in done:
+            # Upload the packaged dir (HLS + thumbs) under hls/<safe_uid>/<stem>
+            segments = SegmentUploader(hls_dir / local_mp4.stem, hls_object)
+            segments.start()
+
+            def hls_upload(results):
+                with stage_slot("upload"):
+                    return segments.finish()
+
+            stages["hls_upload"] = (("package",), hls_upload)
+        results = run_stage_graph(job_id, stages, done, index)
+    finally:
+        if segments:
+            segments.stop()
+
+    for name in ("download", "mp4_upload"):
+        if isinstance(results[name], Exception):
+            raise results[name]
+
+    # HLS and thumbnails are optional; do not fail the sample if they errored
+    try:
+        for name in ("package", "hls_upload"):
+            if isinstance(results.get(name), Exception):
+                raise results[name]
+        _, vtt_path = results["package"]
+        if GCS_PUBLIC:
+            hls_url = results["hls_upload"]
+            thumb_vtt_url = gcs_public_url(GCS_BUCKET, f"{hls_object}/thumbs/{vtt_path.name}")
+        else:
+            # Serve locally when bucket is private
+            hls_url = f"/hls/{rel_dir}/master.m3u8"
+            thumb_vtt_url = f"/hls/{rel_dir}/thumbs/{vtt_path.name}"
+        update(hls_url=hls_url, thumb_vtt_url=thumb_vtt_url, **checkpoint_fields("published"))
+        return not GCS_PUBLIC
+    except Exception as e_hls:
+        log.warning(f"[HLS] Failed to package/upload HLS for {job_id} sample {index}: {e_hls}")
+        return False
+
+def finish_video_job(job_id: str, operation):
+    """
+    Store and package every video of a completed Veo operation (finish_sample).
 
-        generated_videos = operation.result.generated_videos
-        if not generated_videos:
-            raise RuntimeError("No videos returned by model")
+    Samples are processed side by side: sample 0 on this thread, the others on
+    their own. The job fails only if sample 0 does; another failed sample is
+    marked with an error on its asset and keeps its local MP4, so
+    requeue_failed_job can run the job again for it. `operation` is None when a resumed job
+    already saved the MP4 of each sample.
+    """
+    job = get_job(job_id)
+    try:
+        if not job:
+            return
+        views = job_samples(job)
+        videos: List[Any] = [None] * len(views)
+        if operation is not None:
+            if getattr(operation, "error", None):
+                # The generation itself failed; a retry has to submit a new one
+                update_job(job_id, **checkpoint_fields(operation=None))
+                raise RuntimeError(str(operation.error))
+
+            generated_videos = operation.result.generated_videos
+            if not generated_videos:
+                update_job(job_id, **checkpoint_fields(operation=None))
+                raise RuntimeError("No videos returned by model")
+            videos = [g.video for g in generated_videos[:len(views)]]
+            if len(videos) < len(views):
+                # e.g. samples dropped by safety filters; the job holds what came back
+                log.warning(f"[finish] Job {job_id} got {len(videos)} of {len(views)} samples")
+                views = views[:len(videos)]
+                update_job(job_id, samples=len(views), assets=job["assets"][:len(views)])
+        multi = len(views) > 1
+
+        serve_locally = [False] * len(views)
+        finished = [False] * len(views)
+
+        def run_sample(i: int):
+            try:
+                serve_locally[i] = finish_sample(job_id, views[i], i, videos[i], multi)
+                finished[i] = True
+                if views[i].get("error"):
+                    update_job(job_id, **{f"assets.{i}.error": None})
+            except Exception as e:
+                log.warning(f"[finish] Job {job_id} sample {i} failed: {e}")
+                update_job(job_id, **{f"assets.{i}.error": str(e)})
+
+        others = [threading.Thread(target=run_sample, args=(i,), name=f"sample-{job_id[:8]}-{i}", daemon=True)
+                  for i in range(1, len(views))]
+        for t in others:
+            t.start()
+        try:
+            serve_locally[0] = finish_sample(job_id, views[0], 0, videos[0], multi)
+            finished[0] = True
+        finally:
+            for t in others:
+                t.join()
+
+        # GCS has the finished MP4s (and the HLS trees for public buckets); keep only
+        # what is served from here. A failed sample keeps its MP4 for /retry.
+        for i in range(len(views)):
+            if finished[i]:
+                LOCAL_STORAGE.remove(job_paths(job, i)[1])
+        hls_dir = HLS_DIR / job_paths(job)[0]
+        if any(serve_locally):
+            LOCAL_STORAGE.keep(hls_dir)
+        else:
+            LOCAL_STORAGE.remove(hls_dir)
+        cleared = {f"assets.{i}.local_mp4": None for i in range(len(views)) if finished[i]} if multi else {}
+        if not all(finished):
+            log.warning(f"[finish] Job {job_id} done with {finished.count(False)} failed samples (retryable)")
+        update_job(job_id, status="done", progress=100, local_mp4=None, **cleared)
 
-        generated_video = generated_videos[0]
+    except Exception as e:
+        update_job(job_id, status="error", error=str(e))
+    finally:
+        release_job(job_id)
 
-        genai_client.files.download(file=generated_video.video)
+# -----------------------
+# Job Scheduler
+# -----------------------
+# Jobs are queued in videos_col and claimed by a fixed pool of worker threads per
+# process. A claim is a lease: the owning process keeps extending it while the job
+# runs, so jobs left "running" by a dead worker are picked up again once it expires.
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+# Replaced in each process that starts the scheduler; a preloaded module is
+# imported once, before the fork, so every worker would share this one
+WORKER_ID = new_worker_id()
+STAGE_SEMAPHORES = {name: threading.BoundedSemaphore(max(1, n)) for name, n in STAGE_LIMITS.items()}
+# Slots held per stage (BoundedSemaphore has no public counter)
+_stage_held = {name: 0 for name in STAGE_LIMITS}
+_stage_held_lock = threading.Lock()
+_job_wakeup = threading.Event()
+# Set when a worker process is shutting down: finish running jobs, claim no more
+_draining = threading.Event()
+# Continuations (e.g. post-processing after a Veo operation completes) run on the
+# same worker pool and take priority over claiming new jobs.
+_task_queue: "queue.Queue" = queue.Queue()
+_scheduler_pid: Optional[int] = None
+_scheduler_lock = threading.Lock()
+
+def acquire_stage(stage: str):
+    start = time.time()
+    STAGE_SEMAPHORES[stage].acquire()
+    with _stage_held_lock:
+        _stage_held[stage] += 1
+    STAGE_WAIT_SECONDS.labels(stage).observe(time.time() - start)
+    STAGE_ACTIVE.labels(stage).inc()
+
+def release_stage(stage: str):
+    STAGE_ACTIVE.labels(stage).dec()
+    with _stage_held_lock:
+        _stage_held[stage] -= 1
+    STAGE_SEMAPHORES[stage].release()
+
+@contextmanager
+def stage_slot(stage: str):
+    acquire_stage(stage)
+    try:
+        yield
+    finally:
+        release_stage(stage)
+
+def stage_has_capacity(stage: str) -> bool:
+    # Advisory only: another thread may take the free slot first
+    with _stage_held_lock:
+        return _stage_held[stage] < max(1, STAGE_LIMITS[stage])
+
+def _claim(match: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Lease the oldest claimable job matching `match` to this worker."""
+    now = time.time()
+    job = videos_col.find_one_and_update(
+        {**match, "$or": [
+            {"status": "queued"},
+            # Lease expired (or a pre-scheduler job that never had one)
+            {"status": "running", "lease_until": {"$lt": now}},
+            {"status": "running", "lease_until": None},
+        ]},
+        {
+            "$set": {"status": "running", "lease_owner": WORKER_ID, "lease_until": now + JOB_LEASE_SEC},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+    if job:
+        JOB_STATE.put(job)
+    return job
+
+# Job documents always live in videos_col; the queue backend decides how a
+# worker finds the next one. Whoever makes a job "queued" calls notify().
+class MongoJobQueue:
+    """Claims straight from the collection, so API and worker processes on any node share one queue."""
+
+    def notify(self, job_id: str, front: bool = False):
+        # Wakes this process's workers; workers elsewhere find it on their next poll
+        _job_wakeup.set()
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        return _claim({})
+
+    def depth(self) -> int:
+        return videos_col.count_documents({"status": "queued"})
+
+    def recover(self):
+        pass  # Expired leases are claimable as they are
+
+class InProcessJobQueue:
+    """Job ids queued in this process (PROCESS_ROLE=all only, e.g. local development)."""
+
+    def __init__(self):
+        self._ids: "deque[str]" = deque()
+        self._lock = threading.Lock()
+
+    def notify(self, job_id: str, front: bool = False):
+        with self._lock:
+            if front:
+                self._ids.appendleft(job_id)
+            else:
+                self._ids.append(job_id)
+        _job_wakeup.set()
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        while True:
+            with self._lock:
+                if not self._ids:
+                    return None
+                job_id = self._ids.popleft()
+            # Skips ids whose job was meanwhile claimed or finished elsewhere
+            job = _claim({"job_id": job_id})
+            if job:
+                return job
+
+    def depth(self) -> int:
+        return len(self._ids)
+
+    def recover(self):
+        """Queue jobs left over from before this process started (oldest first)."""
+        now = time.time()
+        leftover = videos_col.find(
+            {"$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_until": {"$lt": now}},
+                {"status": "running", "lease_until": None},
+            ]},
+            {"job_id": 1},
+        ).sort("created_at", 1)
+        for doc in leftover:
+            self.notify(doc["job_id"])
+
+JOB_QUEUE = InProcessJobQueue() if JOB_QUEUE_BACKEND == "memory" else MongoJobQueue()
+
+def queue_depth() -> int:
+    try:
+        return JOB_QUEUE.depth()
+    except Exception as e:
+        log.error(f"[queue_depth] {e}")
+        return 0
+
+def estimate_wait_sec(depth: int) -> int:
+    slots = max(1, min(JOB_WORKERS, STAGE_LIMITS["veo"]))
+    return int((depth / slots + 1) * JOB_AVG_SEC)
+
+def queue_full_response(depth: int):
+    wait = estimate_wait_sec(depth)
+    resp = jsonify({
+        "error": "Generation queue is full, try again later",
+        "queue_depth": depth,
+        "estimated_wait_sec": wait,
+    })
+    resp.headers["Retry-After"] = str(wait)
+    return resp, 503
+
+def claim_next_job() -> Optional[Dict[str, Any]]:
+    return JOB_QUEUE.claim()
+
+# Set when the Veo quota ran out; this process's workers stop claiming until then
+_veo_quota_wait = {"until": 0.0}
+
+def defer_for_quota(job_id: str, wait: float):
+    """Put a claimed job back in the queue without counting the attempt."""
+    doc = videos_col.find_one_and_update(
+        {"job_id": job_id, "lease_owner": WORKER_ID},
+        {
+            "$set": {"status": "queued", "lease_owner": None, "lease_until": None},
+            "$inc": {"attempts": -1, "version": 1},
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc:
+        JOB_STATE.put(doc)
+        JOB_EVENTS.publish(job_id, doc["version"])
+        JOB_QUEUE.notify(job_id, front=True)
+    _veo_quota_wait["until"] = max(_veo_quota_wait["until"], time.time() + wait)
+
+def requeue_failed_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Queue a job in "error", or a "done" one with failed samples, again with a
+    fresh attempt budget; None if it is neither.
+    """
+    doc = videos_col.find_one_and_update(
+        {"job_id": job_id, "$or": [{"status": "error"}, {"status": "done", "assets.error": {"$type": "string"}}]},
+        {
+            "$set": {"status": "queued", "error": None, "attempts": 0, "lease_owner": None, "lease_until": None,
+                     "updated_at": time.time()},
+            "$inc": {"version": 1},
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc:
+        JOB_STATE.put(doc)
+        JOB_EVENTS.publish(job_id, doc["version"])
+        JOB_QUEUE.notify(job_id)
+    return doc
+
+def renew_leases():
+    with JOBS_LOCK:
+        held = list(JOBS.keys())
+    if not held:
+        return
+    try:
+        videos_col.update_many(
+            {"job_id": {"$in": held}, "lease_owner": WORKER_ID},
+            {"$set": {"lease_until": time.time() + JOB_LEASE_SEC}},
+        )
+    except Exception as e:
+        log.error(f"[renew_leases] {e}")
+
+def release_job(job_id: str):
+    with JOBS_LOCK:
+        JOBS.pop(job_id, None)
+    if GEN_CACHE_ENABLED:
+        try:
+            settle_generation(job_id)
+        except Exception as e:
+            log.error(f"[gen_cache] Failed to settle job {job_id}: {e}")
+    job = get_job(job_id)
+    if job and job.get("status") in TERMINAL_STATUSES:
+        JOBS_FINISHED.labels(job["status"]).inc()
+        if job["status"] == "done":
+            record_stage(job_id, "total", time.time() - job["created_at"])
+    if job and job.get("batch_id"):
+        try:
+            promote_batch(job["batch_id"])
+        except Exception as e:
+            log.error(f"[batch] Failed to advance batch {job['batch_id']}: {e}")
+
+def enqueue_task(fn, *args):
+    _task_queue.put((fn, args))
+    _job_wakeup.set()
+
+def run_claimed_job(job: Dict[str, Any]):
+    job_id = job["job_id"]
+    if job.get("attempts", 0) > JOB_MAX_ATTEMPTS:
+        update_job(job_id, status="error", error=f"Gave up after {JOB_MAX_ATTEMPTS} attempts")
+        release_job(job_id)
+        return
+    with JOBS_LOCK:
+        JOBS[job_id] = {"claimed_at": time.time()}
+    if job.get("attempts") == 1 and "queue" not in (job.get("timings") or {}):
+        record_stage(job_id, "queue", time.time() - job["created_at"])
+    handed_off = False
+    try:
+        handed_off = generate_video_job(job_id)
+    finally:
+        if not handed_off:
+            release_job(job_id)
+
+def _job_worker_loop():
+    while True:
         try:
-            generated_video.video.save(str(local_mp4))
-        except AttributeError:
-            content = getattr(generated_video.video, "content", None)
-            if content is None:
-                raise RuntimeError("SDK returned unexpected video object; cannot save")
-            with open(local_mp4, "wb") as f:
-                f.write(content)
+            fn, args = _task_queue.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            try:
+                fn(*args)
+            except Exception as e:
+                log.exception(f"[scheduler] Task {getattr(fn, '__name__', fn)} crashed: {e}")
+            continue
+
+        job = None
+        quota_wait = _veo_quota_wait["until"] - time.time()
+        if stage_has_capacity("veo") and quota_wait <= 0 and not _draining.is_set():
+            try:
+                job = claim_next_job()
+            except Exception as e:
+                log.error(f"[scheduler] Failed to claim job: {e}")
+        if job:
+            # Veo requests per minute are shared by every worker process
+            wait = VEO_QUOTA.try_acquire()
+            if wait > 0:
+                defer_for_quota(job["job_id"], wait)
+                job = None
+                quota_wait = wait
+        if not job:
+            _job_wakeup.wait(min(JOB_POLL_SEC, quota_wait) if quota_wait > 0 else JOB_POLL_SEC)
+            _job_wakeup.clear()
+            continue
+        try:
+            run_claimed_job(job)
+        except Exception as e:
+            log.exception(f"[scheduler] Job {job.get('job_id')} crashed: {e}")
 
-        update_job(job_id, progress=80, local_mp4=str(local_mp4))
+def _lease_heartbeat_loop():
+    while True:
+        time.sleep(max(1, JOB_LEASE_SEC // 3))
+        renew_leases()
 
-        mp4_url = upload_file_to_gcs(local_mp4, mp4_object, content_type="video/mp4")
-        update_job(job_id, progress=88, mp4_url=mp4_url, mp4_gcs_path=mp4_object)
+# -----------------------
+# Batches
+# -----------------------
+# A batch is one document in batches_col plus child jobs (batch_id set) inserted
+# together. Children start as "batched" and only up to the batch's concurrency
+# budget are queued at a time; each child that finishes queues the next one.
+def create_batch(prompts: List[Tuple[str, str]], negative_prompt: Optional[str], concurrency: int) -> Dict[str, Any]:
+    """Insert the batch and its jobs; `prompts` are (prompt, prompt_source) pairs."""
+    batch_id = uuid.uuid4().hex
+    docs = []
+    for prompt, source in prompts:
+        cache_key = generation_cache_key(generation_params(prompt, negative_prompt)) if GEN_CACHE_ENABLED else None
+        docs.append(new_job_doc(prompt, negative_prompt, source, status="batched",
+                                batch_id=batch_id, cache_key=cache_key))
+    batch = {
+        "batch_id": batch_id,
+        "job_ids": [d["job_id"] for d in docs],
+        "concurrency": concurrency,
+        "created_at": time.time(),
+    }
+    batches_col.insert_one(batch)
+    videos_col.insert_many(docs, ordered=False)
+    log.info(f"[batch] Batch {batch_id} created with {len(docs)} jobs")
+
+    if GEN_CACHE_ENABLED:
+        for doc in docs:
+            # Hits finish immediately; followers wait on the in-flight generation
+            if attach_to_generation(doc["job_id"], doc["cache_key"]) == "follower":
+                update_job(doc["job_id"], status="waiting")
+    promote_batch(batch_id)
+    return batch
+
+def promote_batch(batch_id: str):
+    """Queue "batched" children until the batch has `concurrency` jobs queued or running."""
+    batch = batches_col.find_one({"batch_id": batch_id}, {"concurrency": 1})
+    if not batch:
+        return
+    active = videos_col.count_documents({"batch_id": batch_id, "status": {"$in": ["queued", "running"]}})
+    promoted = 0
+    for _ in range(max(0, batch.get("concurrency", BATCH_CONCURRENCY) - active)):
+        job = videos_col.find_one_and_update(
+            {"batch_id": batch_id, "status": "batched"},
+            {"$set": {"status": "queued"}, "$inc": {"version": 1}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if not job:
+            break
+        JOB_STATE.put(job)
+        JOB_QUEUE.notify(job["job_id"])
+        promoted += 1
+    if promoted:
+        start_scheduler()
+
+def batch_status_payload(batch: Dict[str, Any], jobs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate status of a batch; `jobs` are its jobs, signed (with_signed_urls)."""
+    counts: Dict[str, int] = {}
+    for job in jobs:
+        counts[job.get("status")] = counts.get(job.get("status"), 0) + 1
+    finished = sum(counts.get(s, 0) for s in TERMINAL_STATUSES)
+    if finished < len(jobs):
+        status = "running"
+    elif not counts.get("error"):
+        status = "done"
+    elif counts.get("error") == len(jobs):
+        status = "error"
+    else:
+        status = "partial"
+    return {
+        "batch_id": batch["batch_id"],
+        "status": status,
+        "progress": sum(j.get("progress") or 0 for j in jobs) / max(1, len(jobs)),
+        "counts": counts,
+        "created_at": batch.get("created_at"),
+        "jobs": [{"job_id": j["job_id"], **job_status_payload(j)} for j in jobs],
+    }
 
-        # Try to produce HLS and thumbnails, but do not fail the job if it errors
+# -----------------------
+# Veo Operation Poller
+# -----------------------
+# One thread per process tracks every in-flight Veo operation. Each operation is
+# polled on its own schedule: sparsely while well inside the model's expected
+# duration, tightly around it, then backing off as it runs late.
+class OperationPoller:
+    def __init__(self):
+        self._heap = []
+        self._seq = 0
+        self._cv = threading.Condition()
+
+    def watch(self, job_id: str, operation, model: str):
+        now = time.time()
+        entry = {
+            "job_id": job_id,
+            "operation": operation,
+            "expected": MODEL_EXPECTED_SEC.get(model, VEO_EXPECTED_DEFAULT_SEC),
+            "started": now,
+            "progress": 5,
+            "errors": 0,
+        }
+        self._push(now + poll_delay(0, entry["expected"]), entry)
+
+    def pending(self) -> int:
+        with self._cv:
+            return len(self._heap)
+
+    def _push(self, due: float, entry: Dict[str, Any]):
+        with self._cv:
+            self._seq += 1
+            heapq.heappush(self._heap, (due, self._seq, entry))
+            self._cv.notify()
+
+    def _pop_due(self):
+        with self._cv:
+            while True:
+                if self._heap:
+                    wait = self._heap[0][0] - time.time()
+                    if wait <= 0:
+                        return heapq.heappop(self._heap)[2]
+                    self._cv.wait(wait)
+                else:
+                    self._cv.wait()
+
+    def run(self):
+        while True:
+            entry = self._pop_due()
+            try:
+                self._poll(entry)
+            except Exception as e:
+                log.exception(f"[poller] Job {entry['job_id']}: {e}")
+
+    def _poll(self, entry: Dict[str, Any]):
+        job_id = entry["job_id"]
+        elapsed = time.time() - entry["started"]
         try:
-            hls_dir = HLS_DIR / safe_uid
-            packaged_dir = package_hls(local_mp4, hls_dir)
-            # Generate per-image thumbnails + VTT under packaged_dir/thumbs
-            thumbs_dir = packaged_dir / "thumbs"
-            vtt_path = generate_thumbnails_per_image(local_mp4, thumbs_dir, fps=1, width=160)
-
-            # Compute common relative dir for local and GCS (include stem)
-            rel_dir = f"{safe_uid}/{local_mp4.stem}"
-
-            if GCS_PUBLIC:
-                # Upload entire packaged_dir (HLS + thumbs) under hls/<safe_uid>/<stem>
-                hls_object = f"hls/{rel_dir}"
-                hls_url = upload_hls_to_gcs(packaged_dir, hls_object)
-                thumb_vtt_url = gcs_public_url(GCS_BUCKET, f"{hls_object}/thumbs/{vtt_path.name}")
-            else:
-                # Serve locally when bucket is private
-                hls_url = f"/hls/{rel_dir}/index.m3u8"
-                thumb_vtt_url = f"/hls/{rel_dir}/thumbs/{vtt_path.name}"
-            update_job(job_id, hls_url=hls_url, thumb_vtt_url=thumb_vtt_url)
-        except Exception as e_hls:
-            print(f"[HLS][WARN] Failed to package/upload HLS for {job_id}: {e_hls}")
+            entry["operation"] = genai_client.operations.get(entry["operation"])
+            entry["errors"] = 0
+        except Exception as e:
+            entry["errors"] += 1
+            if entry["errors"] >= VEO_POLL_MAX_ERRORS or is_not_found_error(e):
+                if is_not_found_error(e):
+                    # Gone (expired or never existed); a retry has to generate again
+                    update_job(job_id, **checkpoint_fields(operation=None))
+                self._fail(job_id, f"Polling operation failed: {e}")
+                return
+            log.warning(f"[poller] Poll failed for {job_id} ({entry['errors']}): {e}")
+            self._push(time.time() + VEO_POLL_MAX_SEC, entry)
+            return
+
+        if entry["operation"].done:
+            release_stage("veo")
+            record_stage(job_id, "veo_wait", elapsed)
+            enqueue_task(finish_video_job, job_id, entry["operation"])
+            return
+        if elapsed > VEO_TIMEOUT_SEC:
+            self._fail(job_id, f"Video generation timed out after {int(elapsed)}s")
+            return
+
+        prog = 5 + int(65 * min(elapsed / entry["expected"], 1.0))
+        if prog != entry["progress"]:
+            entry["progress"] = prog
+            update_job(job_id, progress=prog)
+        self._push(time.time() + poll_delay(elapsed, entry["expected"]), entry)
 
-        update_job(job_id, status="done", progress=100)
+    def _fail(self, job_id: str, error: str):
+        release_stage("veo")
+        update_job(job_id, status="error", error=error)
+        release_job(job_id)
 
-    except Exception as e:
-        update_job(job_id, status="error", error=str(e))
+def poll_delay(elapsed: float, expected: float) -> float:
+    remaining = expected - elapsed
+    if remaining > 0:
+        delay = remaining / 2
+    else:
+        # Overdue: keep lateness bounded to ~25% of the time already overdue
+        delay = -remaining / 4
+    return min(max(delay, VEO_POLL_MIN_SEC), VEO_POLL_MAX_SEC)
+
+OPERATION_POLLER = OperationPoller()
+
+def start_scheduler():
+    """Start the worker pool and operation poller once per process (safe to call repeatedly)."""
+    global _scheduler_pid, WORKER_ID
+    with _scheduler_lock:
+        if _scheduler_pid == os.getpid() or JOB_WORKERS <= 0 or PROCESS_ROLE == "api":
+            return
+        _scheduler_pid = os.getpid()
+        WORKER_ID = new_worker_id()
+        try:
+            JOB_QUEUE.recover()
+        except Exception as e:
+            log.error(f"[scheduler] Failed to recover queued jobs: {e}")
+        threading.Thread(target=OPERATION_POLLER.run, name="veo-poller", daemon=True).start()
+        for i in range(JOB_WORKERS):
+            threading.Thread(target=_job_worker_loop, name=f"job-worker-{i}", daemon=True).start()
+        threading.Thread(target=_lease_heartbeat_loop, name="job-lease-heartbeat", daemon=True).start()
+        log.info(f"[scheduler] Started {JOB_WORKERS} workers as {WORKER_ID}")
 
 # -----------------------
 # Prompt Improvement Helpers (OpenAI GPT-3.5)
 # -----------------------
+# System instruction for /api/improve: request concise+expanded variants
+IMPROVE_SYSTEM_PROMPT = (
+"You are a professional prompt engineer and creative director for short cinematic videos. "
+"Given a short user prompt, do two things:\n\n"
+"1) Produce 'auto_improved' — a polished, generation-ready full and detailed prompt suitable for text-to-video models. "
+"Make the auto_improved prompt vivid and self-contained: include shot type , camera movement and angle, framing, descriptive atmosphere (mood, weather, time of day), lighting mood and color grading, motion style (slow motion/real-time/tracking), and an optional sound cue or reference style (documentary, commercial, nostalgic, whimsical). "
+"When appropriate, add tasteful, scene-appropriate special effects (dirt, sparks, light flares, dust motes) to enhance the action; avoid prescribing technical specs for those effects. "
+"Keep it concise (about 1–3 sentences) and ready to paste into a generator.\n\n"
+"2) Produce EXACTLY 4 'variants'. Each variant must be an OBJECT with two fields:\n"
+" - 'concise': an extra short creative idea suitable for showing in a quick list on the frontend.\n"
+" - 'expanded': a full, polished prompt (like auto_improved) that incorporates the concise idea in cinematic detail.\n\n"
+"Variant content guidance (IMPORTANT):\n"
+"- Variants should be unique and MUST prioritize scene content: actors, actions, props, interactions, animals, or environmental elements (examples: owner throws frisbee, dog chases butterfly, two dogs play tug, retriever rolls in wildflowers). "
+"- DO NOT output pure technical/stylistic effects (for example: 'drone angle', 'slow motion', 'pan', 'color grade') as the 'concise' idea. Technical effects are NOT valid standalone variants. "
+"- Technical or stylistic elements may appear in 'expanded' only when they directly enhance the scene action (for example: 'leaping mid-air in slow motion' or 'wide shot from low angle as they run'). "
+"- If an idea is primarily a camera/effect idea, convert it into a content-focused variant (e.g., prefer 'frisbee catch mid-air' over 'slow motion').\n\n"
+"Creative choices guidance (when the user prompt lacks specifics):\n"
+"- Make confident, tasteful creative decisions rather than asking for clarification. Choose a clear cinematic tone (documentary, commercial, nostalgic, or whimsical), an appropriate shot scale (close-up/medium/wide), and a simple camera movement (dolly, pan, handheld, or static). "
+"- Suggest broad stylistic elements such as lighting mood (warm sunrise / soft overcast / golden hour), general color grading (warm, cool, or neutral), motion style (slow motion, real-time, or gentle tracking), and an optional sound cue (wind, laughter, distant music) without prescribing technical camera settings. "
+"- Avoid overly specific technical specs (exact focal lengths, frame rates, or codec choices); keep choices evocative and flexible so they can be adapted by different generators.\n\n"
+"Requirements and strict rules (must obey precisely):\n"
+"- Return ONLY a single valid JSON object with two keys: 'auto_improved' (string) and 'variants' (array of exactly 4 objects). Nothing else. No commentary, no markdown, no code fences. "
+"- Each 'variants' object must contain exactly the fields 'concise' and 'expanded'. No extra fields. The array length must be exactly 4. "
+"- 'concise' must be short and snappy (roughly 4–8 words) and describe scene content (actors/actions/props/environment). Do not place camera/effect-only phrases in 'concise'. "
+"- 'expanded' must be a complete, vivid prompt ready to send to a video generation model, approximately the same length and level of detail as 'auto_improved'. It's allowed to include tasteful stylistic touches tied to the content. "
+"- Order 'variants' from broadly accessible/conventional to more experimental/expressive. "
+"- If the user prompt lacks specifics, make confident creative choices; do not ask clarifying questions. "
+"- Do not include placeholders like <PROMPT> or metadata. Do not include comments or explanations. "
+"- Produce outputs that are cinematic, actionable, and immediately usable by a text-to-video model.\n"
+)
+COMPOSE_SYSTEM_PROMPTS = {
+    "merge": (
+        "You are a concise prompt polisher for text-to-video. Polishing must keep all details, "
+        "improve wording for clarity and cinematic descriptiveness, and return only the polished prompt as plain text."
+    ),
+    "auto_refine": (
+        "You are a professional prompt engineer. Given an improved base prompt (may be empty) and a single variant detail, "
+        "produce one polished, cinematic, generation-ready prompt that combines them clearly. Return only the final prompt as plain text."
+    ),
+}
+
+class LLMResponseError(Exception):
+    """The model answered, but not in the shape we asked for. ``raw`` is its reply."""
+
+    def __init__(self, message: str, raw: str):
+        super().__init__(message)
+        self.raw = raw
+
 def safe_parse_json_from_text(text: str):
     text = text.strip()
     try:
@@ -372,6 +2801,233 @@ def safe_parse_json_from_text(text: str):
         except Exception:
             return None
 
+def parse_improve_response(text: str) -> Dict[str, Any]:
+    """Validate the /api/improve model reply into {auto_improved, variants}."""
+    parsed = safe_parse_json_from_text(text)
+    if not parsed:
+        raise LLMResponseError("Model returned unparsable response", text)
+
+    ai = parsed.get("auto_improved")
+    variants = parsed.get("variants")
+    if not ai or not isinstance(ai, str):
+        raise LLMResponseError("Missing 'auto_improved' in model response", text)
+    if not variants or not isinstance(variants, list) or len(variants) != 4:
+        raise LLMResponseError("Expected exactly 4 variants (array) in response", text)
+
+    # Validate each variant object (no strict concise-length checks)
+    normalized_variants = []
+    for i, v in enumerate(variants):
+        if not isinstance(v, dict):
+            raise LLMResponseError(f"Variant #{i+1} is not an object", text)
+        concise = v.get("concise")
+        expanded = v.get("expanded")
+        if not concise or not isinstance(concise, str):
+            raise LLMResponseError(f"Variant #{i+1} missing 'concise' (string)", text)
+        if not expanded or not isinstance(expanded, str):
+            raise LLMResponseError(f"Variant #{i+1} missing 'expanded' (string)", text)
+        normalized_variants.append({"concise": concise.strip(), "expanded": expanded.strip()})
+
+    return {"auto_improved": ai.strip(), "variants": normalized_variants}
+
+_AUTO_IMPROVED_RE = re.compile(r'"auto_improved"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+def extract_auto_improved(partial_text: str) -> Optional[str]:
+    """Pull a complete "auto_improved" string out of a still-streaming JSON reply."""
+    m = _AUTO_IMPROVED_RE.search(partial_text)
+    if not m:
+        return None
+    try:
+        return json.loads(f'"{m.group(1)}"').strip() or None
+    except ValueError:
+        return None
+
+def chat_completion(system: str, user: str, temperature: float, max_tokens: int, stream: bool = False):
+    # Cache hits never get here, so only real upstream calls spend quota
+    OPENAI_QUOTA.acquire(timeout=OPENAI_QUOTA_WAIT_SEC)
+    try:
+        # A stream returns once the first chunk arrives; improve_stream times the whole reply
+        with timed(LLM_SECONDS, "stream_first_chunk" if stream else "complete"):
+            return openai.ChatCompletion.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": user},
+                ],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=stream,
+                request_timeout=OPENAI_TIMEOUT_SEC,
+            )
+    except Exception as e:
+        if is_rate_limit_error(e):
+            OPENAI_QUOTA.drain()
+            raise QuotaExhausted("openai", 60.0 / max(OPENAI_QUOTA_PER_MIN, 1)) from e
+        raise
+
+def llm_cache_key(kind: str, system: str, user: str, temperature: float) -> str:
+    norm = {
+        "kind": kind,
+        "model": OPENAI_MODEL,
+        # Editing a system prompt should not serve answers to the old one
+        "system": hashlib.sha256(system.encode("utf-8")).hexdigest(),
+        "user": " ".join(user.split()).lower(),
+        "temperature": round(temperature, 1),
+    }
+    return hashlib.sha256(json.dumps(norm, sort_keys=True).encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """
+    Two-tier cache for prompt-helper completions: a per-process LRU in front of
+    the llm_cache collection (TTL-indexed on expires_at). Concurrent misses for
+    the same key are coalesced so only one request calls OpenAI.
+    """
+
+    def __init__(self, col, ttl_sec: int, mem_entries: int):
+        self._col = col
+        self._ttl = ttl_sec
+        self._mem_entries = mem_entries
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+
+    def ensure_indexes(self):
+        try:
+            self._col.create_index("key", unique=True)
+            self._col.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            log.error(f"[llm_cache] Failed to create indexes: {e}")
+
+    def _remember(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._mem[key] = (expires_at, value)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self._mem_entries:
+                self._mem.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        if not LLM_CACHE_ENABLED:
+            return None
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit and hit[0] > now:
+                self._mem.move_to_end(key)
+                CACHE_LOOKUPS.labels("llm", "memory").inc()
+                return hit[1]
+            self._mem.pop(key, None)
+        try:
+            doc = self._col.find_one({"key": key})
+        except Exception as e:
+            log.warning(f"[llm_cache] Lookup failed: {e}")
+            return None
+        expires_at = doc["expires_at"] if doc else None
+        if expires_at is not None and expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        # Mongo's TTL monitor only sweeps once a minute
+        if expires_at is None or expires_at.timestamp() <= now:
+            CACHE_LOOKUPS.labels("llm", "miss").inc()
+            return None
+        CACHE_LOOKUPS.labels("llm", "mongo").inc()
+        self._remember(key, doc["value"], expires_at.timestamp())
+        return doc["value"]
+
+    def put(self, key: str, value: Any):
+        if not LLM_CACHE_ENABLED:
+            return
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self._ttl)
+        self._remember(key, value, expires_at.timestamp())
+        try:
+            self._col.update_one(
+                {"key": key},
+                {"$set": {"value": value, "expires_at": expires_at}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            pass
+        except Exception as e:
+            log.warning(f"[llm_cache] Store failed: {e}")
+
+    @contextmanager
+    def single_flight(self, key: str):
+        """
+        Coalesce concurrent misses for ``key``. Yields the value another request
+        produced while we waited, or None when the caller should compute it and
+        ``put`` it. A leader's failure is re-raised in its followers.
+        """
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = {"done": threading.Event(), "error": None}
+        if not leader:
+            flight["done"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            # None if the leader went away (e.g. client disconnect): compute ourselves
+            yield self.get(key)
+            return
+        try:
+            yield None
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight["done"].set()
+
+    def get_or_compute(self, key: str, compute):
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self.single_flight(key) as value:
+            if value is None:
+                value = compute()
+                self.put(key, value)
+            return value
+
+LLM_CACHE = LLMCache(llm_cache_col, LLM_CACHE_TTL_SEC, LLM_CACHE_MEM_ENTRIES)
+
+def improve_prompt(prompt: str) -> Dict[str, Any]:
+    user_msg = f"User prompt: \"{prompt}\""
+    resp = chat_completion(IMPROVE_SYSTEM_PROMPT, user_msg, temperature=0.7, max_tokens=400)
+    return parse_improve_response(resp["choices"][0]["message"]["content"])
+
+def improve_stream(prompt: str, key: str):
+    """NDJSON lines for /api/improve?stream=1: auto_improved as soon as it is complete, then the result."""
+    def line(obj):
+        return json.dumps(obj) + "\n"
+
+    try:
+        result = LLM_CACHE.get(key)
+        if result is None:
+            with LLM_CACHE.single_flight(key) as result:
+                if result is None:
+                    text = ""
+                    sent = False
+                    start = time.time()
+                    user_msg = f"User prompt: \"{prompt}\""
+                    for chunk in chat_completion(IMPROVE_SYSTEM_PROMPT, user_msg, temperature=0.7, max_tokens=400, stream=True):
+                        text += chunk["choices"][0].get("delta", {}).get("content") or ""
+                        if not sent:
+                            partial = extract_auto_improved(text)
+                            if partial:
+                                sent = True
+                                yield line({"type": "auto_improved", "auto_improved": partial})
+                    LLM_SECONDS.labels("stream").observe(time.time() - start)
+                    result = parse_improve_response(text)
+                    LLM_CACHE.put(key, result)
+                    yield line({"type": "result", **result})
+                    return
+        yield line({"type": "auto_improved", "auto_improved": result["auto_improved"]})
+        yield line({"type": "result", **result})
+    except LLMResponseError as e:
+        yield line({"type": "error", "error": str(e), "raw": e.raw})
+    except QuotaExhausted as e:
+        yield line({"type": "error", "error": str(e), "retry_after": int(math.ceil(e.retry_after))})
+    except Exception as e:
+        yield line({"type": "error", "error": str(e)})
+
 @app.route("/api/improve", methods=["POST"])
 @limiter.limit("10 per minute")
 def api_improve():
@@ -386,7 +3042,8 @@ def api_improve():
       ]
     }
 
-    
+    With ?stream=1 (or "stream": true) the reply is NDJSON: an "auto_improved"
+    line as soon as the model has written it, then a "result" (or "error") line.
     """
     if not OPENAI_API_KEY:
         return jsonify({"error": "OPENAI_API_KEY not configured on server"}), 500
@@ -396,78 +3053,21 @@ def api_improve():
     if not prompt:
         return jsonify({"error": "Missing 'prompt'"}), 400
 
-    # System instruction updated to request concise+expanded variants
-    system = (
-"You are a professional prompt engineer and creative director for short cinematic videos. "
-"Given a short user prompt, do two things:\n\n"
-"1) Produce 'auto_improved' — a polished, generation-ready full and detailed prompt suitable for text-to-video models. "
-"Make the auto_improved prompt vivid and self-contained: include shot type , camera movement and angle, framing, descriptive atmosphere (mood, weather, time of day), lighting mood and color grading, motion style (slow motion/real-time/tracking), and an optional sound cue or reference style (documentary, commercial, nostalgic, whimsical). "
-"When appropriate, add tasteful, scene-appropriate special effects (dirt, sparks, light flares, dust motes) to enhance the action; avoid prescribing technical specs for those effects. "
-"Keep it concise (about 1–3 sentences) and ready to paste into a generator.\n\n"
-"2) Produce EXACTLY 4 'variants'. Each variant must be an OBJECT with two fields:\n"
-" - 'concise': an extra short creative idea suitable for showing in a quick list on the frontend.\n"
-" - 'expanded': a full, polished prompt (like auto_improved) that incorporates the concise idea in cinematic detail.\n\n"
-"Variant content guidance (IMPORTANT):\n"
-"- Variants should be unique and MUST prioritize scene content: actors, actions, props, interactions, animals, or environmental elements (examples: owner throws frisbee, dog chases butterfly, two dogs play tug, retriever rolls in wildflowers). "
-"- DO NOT output pure technical/stylistic effects (for example: 'drone angle', 'slow motion', 'pan', 'color grade') as the 'concise' idea. Technical effects are NOT valid standalone variants. "
-"- Technical or stylistic elements may appear in 'expanded' only when they directly enhance the scene action (for example: 'leaping mid-air in slow motion' or 'wide shot from low angle as they run'). "
-"- If an idea is primarily a camera/effect idea, convert it into a content-focused variant (e.g., prefer 'frisbee catch mid-air' over 'slow motion').\n\n"
-"Creative choices guidance (when the user prompt lacks specifics):\n"
-"- Make confident, tasteful creative decisions rather than asking for clarification. Choose a clear cinematic tone (documentary, commercial, nostalgic, or whimsical), an appropriate shot scale (close-up/medium/wide), and a simple camera movement (dolly, pan, handheld, or static). "
-"- Suggest broad stylistic elements such as lighting mood (warm sunrise / soft overcast / golden hour), general color grading (warm, cool, or neutral), motion style (slow motion, real-time, or gentle tracking), and an optional sound cue (wind, laughter, distant music) without prescribing technical camera settings. "
-"- Avoid overly specific technical specs (exact focal lengths, frame rates, or codec choices); keep choices evocative and flexible so they can be adapted by different generators.\n\n"
-"Requirements and strict rules (must obey precisely):\n"
-"- Return ONLY a single valid JSON object with two keys: 'auto_improved' (string) and 'variants' (array of exactly 4 objects). Nothing else. No commentary, no markdown, no code fences. "
-"- Each 'variants' object must contain exactly the fields 'concise' and 'expanded'. No extra fields. The array length must be exactly 4. "
-"- 'concise' must be short and snappy (roughly 4–8 words) and describe scene content (actors/actions/props/environment). Do not place camera/effect-only phrases in 'concise'. "
-"- 'expanded' must be a complete, vivid prompt ready to send to a video generation model, approximately the same length and level of detail as 'auto_improved'. It's allowed to include tasteful stylistic touches tied to the content. "
-"- Order 'variants' from broadly accessible/conventional to more experimental/expressive. "
-"- If the user prompt lacks specifics, make confident creative choices; do not ask clarifying questions. "
-"- Do not include placeholders like <PROMPT> or metadata. Do not include comments or explanations. "
-"- Produce outputs that are cinematic, actionable, and immediately usable by a text-to-video model.\n"
-)
-    
-    user_msg = f"User prompt: \"{prompt}\""
-
-    try:
-        resp = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user_msg},
-            ],
-            temperature=0.7,
-            max_tokens=400,
+    key = llm_cache_key("improve", IMPROVE_SYSTEM_PROMPT, prompt, 0.7)
+    stream = str(request.args.get("stream", data.get("stream", ""))).lower() in ("1", "true", "yes")
+    if stream:
+        return Response(
+            stream_with_context(improve_stream(prompt, key)),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
-        text = resp["choices"][0]["message"]["content"]
-        parsed = safe_parse_json_from_text(text)
-
-        # Validate shape
-        if not parsed:
-            return jsonify({"error": "Model returned unparsable response", "raw": text}), 500
-
-        ai = parsed.get("auto_improved")
-        variants = parsed.get("variants")
-        if not ai or not isinstance(ai, str):
-            return jsonify({"error": "Missing 'auto_improved' in model response", "raw": text}), 500
-        if not variants or not isinstance(variants, list) or len(variants) != 4:
-            return jsonify({"error": "Expected exactly 4 variants (array) in response", "raw": text}), 500
-
-        # Validate each variant object (no strict concise-length checks)
-        normalized_variants = []
-        for i, v in enumerate(variants):
-            if not isinstance(v, dict):
-                return jsonify({"error": f"Variant #{i+1} is not an object", "raw": text}), 500
-            concise = v.get("concise")
-            expanded = v.get("expanded")
-            if not concise or not isinstance(concise, str):
-                return jsonify({"error": f"Variant #{i+1} missing 'concise' (string)", "raw": text}), 500
-            if not expanded or not isinstance(expanded, str):
-                return jsonify({"error": f"Variant #{i+1} missing 'expanded' (string)", "raw": text}), 500
-            normalized_variants.append({"concise": concise.strip(), "expanded": expanded.strip()})
-
-        return jsonify({"auto_improved": ai.strip(), "variants": normalized_variants}), 200
 
+    try:
+        return jsonify(LLM_CACHE.get_or_compute(key, lambda: improve_prompt(prompt))), 200
+    except LLMResponseError as e:
+        return jsonify({"error": str(e), "raw": e.raw}), 500
+    except QuotaExhausted as e:
+        return quota_exhausted_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -493,47 +3093,85 @@ def api_compose():
     if mode == "merge" and not base_improved:
         return jsonify({"error": "mode 'merge' requires base_improved field"}), 400
 
-    try:
-        if mode == "merge":
-            combined = f"{base_improved.rstrip('. ')}. {variant.strip()}"
-            system = (
-                "You are a concise prompt polisher for text-to-video. Polishing must keep all details, "
-                "improve wording for clarity and cinematic descriptiveness, and return only the polished prompt as plain text."
-            )
-            user = f"Polish this prompt to be concise and cinematic:\n\n{combined}"
-            resp = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system},
-                    {"role": "user", "content": user},
-                ],
-                temperature=0.6,
-                max_tokens=200,
-            )
-            out = resp["choices"][0]["message"]["content"].strip()
-            return jsonify({"composed": out}), 200
+    if mode == "merge":
+        combined = f"{base_improved.rstrip('. ')}. {variant.strip()}"
+        user = f"Polish this prompt to be concise and cinematic:\n\n{combined}"
+        max_tokens = 200
+    else:
+        user = f"Base improved prompt:\n{base_improved}\n\nVariant detail:\n{variant}\n\nCombine and produce a single polished prompt."
+        max_tokens = 220
+    system = COMPOSE_SYSTEM_PROMPTS[mode]
 
-        else:
-            system = (
-                "You are a professional prompt engineer. Given an improved base prompt (may be empty) and a single variant detail, "
-                "produce one polished, cinematic, generation-ready prompt that combines them clearly. Return only the final prompt as plain text."
-            )
-            user = f"Base improved prompt:\n{base_improved}\n\nVariant detail:\n{variant}\n\nCombine and produce a single polished prompt."
-            resp = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system},
-                    {"role": "user", "content": user},
-                ],
-                temperature=0.6,
-                max_tokens=220,
-            )
-            out = resp["choices"][0]["message"]["content"].strip()
-            return jsonify({"composed": out}), 200
+    def compose():
+        resp = chat_completion(system, user, temperature=0.6, max_tokens=max_tokens)
+        return resp["choices"][0]["message"]["content"].strip()
 
+    try:
+        out = LLM_CACHE.get_or_compute(llm_cache_key(f"compose:{mode}", system, user, 0.6), compose)
+        return jsonify({"composed": out}), 200
+    except QuotaExhausted as e:
+        return quota_exhausted_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# -----------------------
+# Conditional & compressed JSON responses
+# -----------------------
+# Job and history responses carry a weak ETag derived from job versions, so
+# pollers and CDNs revalidate with If-None-Match and get a bodiless 304 until
+# something changes. Signed MP4 URLs are part of the ETag: they rotate while
+# the version stays put, and a client must not keep one past its expiry.
+def weak_etag(*parts) -> str:
+    return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:20]
+
+def not_modified(etag: str, last_modified: Optional[float]) -> bool:
+    # If-Modified-Since only counts when the client sent no ETag (RFC 9110)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return bool(since and last_modified and int(last_modified) <= since.timestamp())
+
+def compress_response(resp: Response) -> Response:
+    """Encode the body with brotli or gzip per Accept-Encoding (bodies under JSON_COMPRESS_MIN_BYTES are left alone)."""
+    resp.vary.add("Accept-Encoding")
+    data = resp.get_data()
+    if len(data) < JSON_COMPRESS_MIN_BYTES or resp.content_encoding:
+        return resp
+    if brotli is not None and request.accept_encodings["br"]:
+        resp.set_data(brotli.compress(data, quality=4))
+        resp.content_encoding = "br"
+    elif request.accept_encodings["gzip"]:
+        resp.set_data(gzip.compress(data, compresslevel=6))
+        resp.content_encoding = "gzip"
+    return resp
+
+def conditional_json(etag: str, last_modified: Optional[float], build, compress: bool = False) -> Response:
+    """
+    304 if the request's validators match, else jsonify(build()). build is only
+    called when a body is needed. Responses must be revalidated on every use.
+    """
+    if not_modified(etag, last_modified):
+        resp = Response(status=304)
+    else:
+        resp = jsonify(build())
+        if compress:
+            compress_response(resp)
+    resp.set_etag(etag, weak=True)
+    if last_modified:
+        resp.last_modified = datetime.fromtimestamp(int(last_modified), timezone.utc)
+    resp.cache_control.no_cache = True
+    return resp
+
+def job_validators(jobs: List[Dict[str, Any]]) -> Tuple[str, Optional[float]]:
+    """(ETag, Last-Modified) for signed job docs: versions and MP4 URLs, newest update."""
+    etag = weak_etag(*(
+        f"{j.get('job_id')}:{j.get('version', 0)}:{j.get('mp4_url')}"
+        + "".join(f":{a.get('mp4_url')}" for a in j.get("assets") or ())
+        for j in jobs
+    ))
+    modified = max((j.get("updated_at") or j.get("created_at") or 0 for j in jobs), default=0)
+    return etag, modified or None
+
 # -----------------------
 # Video generation endpoints (unchanged, but accepts composed_prompt)
 # -----------------------
@@ -542,8 +3180,12 @@ def api_compose():
 def api_generate():
     """
     Start a non-blocking generation job.
-    Body: { "prompt": "...", "composed_prompt": "...", "negative_prompt": "..." }
+    Body: { "prompt": "...", "composed_prompt": "...", "negative_prompt": "...", "samples": 1 }
     Returns: { "job_id": "..." }
+    "samples" (up to VEO_MAX_SAMPLES) asks one Veo operation for that many
+    videos; each becomes an entry of the job's "assets".
+    With the generation cache enabled, an identical earlier generation is reused
+    (200, "cached": true) or joined while in flight; pass ?fresh=1 to bypass it.
     """
     data = request.get_json(force=True, silent=True) or {}
     raw_prompt = (data.get("prompt") or "").strip()
@@ -557,89 +3199,529 @@ def api_generate():
 
     prompt_source = "composed_prompt" if composed_prompt else "user_prompt"
 
-    job_id = make_job(prompt_to_use, negative_prompt, prompt_source)
-    t = threading.Thread(target=generate_video_job, args=(job_id,), daemon=True)
-    t.start()
-    return jsonify({"job_id": job_id}), 202
+    try:
+        samples = int(data.get("samples") or 1)
+    except (TypeError, ValueError):
+        samples = 0
+    if not 1 <= samples <= VEO_MAX_SAMPLES:
+        return jsonify({"error": f"'samples' must be between 1 and {VEO_MAX_SAMPLES}"}), 400
+
+    # Checked before the cache too: a cache leader is queued like any other job
+    depth = queue_depth()
+    if depth >= JOB_MAX_QUEUE:
+        return queue_full_response(depth)
+
+    fresh = str(request.args.get("fresh", data.get("fresh", ""))).lower() in ("1", "true", "yes")
+    cache_key = None
+    if GEN_CACHE_ENABLED:
+        cache_key = generation_cache_key(generation_params(prompt_to_use, negative_prompt, samples))
+    if cache_key and not fresh:
+        # Held as "waiting" until we know whether it has to generate at all
+        job_id = make_job(prompt_to_use, negative_prompt, prompt_source, status="waiting", cache_key=cache_key,
+                          **sample_job_fields(samples))
+        outcome = attach_to_generation(job_id, cache_key)
+        if outcome == "hit":
+            return jsonify({"job_id": job_id, "cached": True}), 200
+        if outcome == "follower":
+            return jsonify({"job_id": job_id, "cached": True}), 202
+        update_job(job_id, status="queued")
+        start_scheduler()
+        JOB_QUEUE.notify(job_id)
+        depth = queue_depth()
+        return jsonify({
+            "job_id": job_id,
+            "queue_depth": depth,
+            "estimated_wait_sec": estimate_wait_sec(depth - 1),
+        }), 202
+
+    job_id = make_job(prompt_to_use, negative_prompt, prompt_source, cache_key=cache_key, **sample_job_fields(samples))
+    start_scheduler()
+    JOB_QUEUE.notify(job_id)
+    return jsonify({
+        "job_id": job_id,
+        "queue_depth": depth + 1,
+        "estimated_wait_sec": estimate_wait_sec(depth),
+    }), 202
+
+@app.route("/api/generate/batch", methods=["POST"])
+@limiter.limit("2 per minute; 1 per 5 seconds")
+def api_generate_batch():
+    """
+    Start several generations in one request.
+    Body: { "prompts": ["...", ...], "negative_prompt": "...", "concurrency": 2 }
+      or: { "improve": <an /api/improve result>, "variants": [0, 2], "include_auto_improved": false }
+    Returns: { "batch_id": "...", "job_ids": [...] }; follow it at /api/batch/<batch_id>.
+    At most `concurrency` (<= BATCH_CONCURRENCY) of its jobs are queued at once.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    negative_prompt = data.get("negative_prompt")
+
+    prompts: List[Tuple[str, str]] = []
+    if data.get("improve"):
+        improve = data["improve"] if isinstance(data["improve"], dict) else {}
+        variants = improve.get("variants") or []
+        if data.get("include_auto_improved") and improve.get("auto_improved"):
+            prompts.append((str(improve["auto_improved"]).strip(), "auto_improved"))
+        for idx in data.get("variants") or []:
+            if not isinstance(idx, int) or not 0 <= idx < len(variants):
+                return jsonify({"error": f"Invalid variant index {idx!r}"}), 400
+            expanded = variants[idx].get("expanded") if isinstance(variants[idx], dict) else None
+            if not expanded:
+                return jsonify({"error": f"Variant #{idx+1} has no 'expanded' prompt"}), 400
+            prompts.append((expanded.strip(), "variant"))
+    else:
+        for p in data.get("prompts") or []:
+            if isinstance(p, str) and p.strip():
+                prompts.append((p.strip(), "user_prompt"))
+
+    if not prompts:
+        return jsonify({"error": "Missing 'prompts' or 'improve' with selected 'variants'"}), 400
+    if len(prompts) > BATCH_MAX_JOBS:
+        return jsonify({"error": f"At most {BATCH_MAX_JOBS} prompts per batch"}), 400
+
+    depth = queue_depth()
+    if depth + len(prompts) > JOB_MAX_QUEUE:
+        return queue_full_response(depth)
+
+    try:
+        concurrency = int(data.get("concurrency") or BATCH_CONCURRENCY)
+    except (TypeError, ValueError):
+        return jsonify({"error": "'concurrency' must be an integer"}), 400
+    batch = create_batch(prompts, negative_prompt, max(1, min(concurrency, BATCH_CONCURRENCY)))
+    return jsonify({
+        "batch_id": batch["batch_id"],
+        "job_ids": batch["job_ids"],
+        "queue_depth": depth + len(prompts),
+        "estimated_wait_sec": estimate_wait_sec(depth + len(prompts) - 1),
+    }), 202
+
+@app.route("/api/jobs/<job_id>/retry", methods=["POST"])
+@limiter.limit("10 per minute")
+def api_retry_job(job_id: str):
+    """
+    Run a failed job again from its last checkpoint. A saved MP4 (local or in
+    GCS) skips Veo entirely, and a known operation is re-attached instead of
+    generating again. A done job with failed samples reprocesses just those.
+    409 unless the job is in "error" or has failed samples.
+    """
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": "job not found"}), 404
+
+    depth = queue_depth()
+    if depth >= JOB_MAX_QUEUE:
+        return queue_full_response(depth)
+
+    doc = requeue_failed_job(job_id)
+    if not doc:
+        return jsonify({"error": "Only failed jobs can be retried", "status": job.get("status")}), 409
+    start_scheduler()
+    return jsonify({
+        "job_id": job_id,
+        "resume_from": last_checkpoint(doc),
+        "queue_depth": depth + 1,
+        "estimated_wait_sec": estimate_wait_sec(depth),
+    }), 202
+
+STATUS_FIELDS = [
+    "id", "status", "progress", "prompt", "prompt_source", "error",
+    "mp4_url", "mp4_gcs_path", "hls_url", "thumb_vtt_url", "created_at", "version",
+]
+ASSET_FIELDS = ("index", "mp4_url", "mp4_gcs_path", "hls_url", "thumb_vtt_url", "error")
+
+def public_assets(doc: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """The samples of a multi-sample job as returned by the API (None for single-sample jobs)."""
+    if not doc.get("assets"):
+        return None
+    return [{k: a.get(k) for k in ASSET_FIELDS} for a in doc["assets"]]
+
+def job_status_payload(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Status fields of a job; pass it through with_signed_urls first."""
+    payload = {k: job.get(k) for k in STATUS_FIELDS}
+    payload["version"] = job.get("version", 0)
+    payload["samples"] = job.get("samples") or 1
+    payload["assets"] = public_assets(job)
+    return payload
+
+def job_status_response(job: Dict[str, Any]) -> Response:
+    job = with_signed_urls([job])[0]
+    etag, modified = job_validators([job])
+    return conditional_json(etag, modified, lambda: job_status_payload(job))
+
+# Caps the threads parked in status waits, so open viewers can never take every
+# gunicorn thread away from the rest of the API
+_status_waiter_slots = threading.BoundedSemaphore(max(1, STATUS_WAITERS_MAX))
+
+@contextmanager
+def status_waiter_slot():
+    """Yields True while holding a waiter slot, False (without waiting) when all are taken."""
+    if STATUS_WAITERS_MAX <= 0 or not _status_waiter_slots.acquire(blocking=False):
+        yield False
+        return
+    STATUS_WAITERS.inc()
+    try:
+        yield True
+    finally:
+        STATUS_WAITERS.dec()
+        _status_waiter_slots.release()
 
 @app.route("/api/status/<job_id>", methods=["GET"])
 @limiter.limit("60 per minute")
 def api_status(job_id: str):
-    job = get_job(job_id)
-    if not job:
+    """
+    GET /api/status/<job_id>[?since=<version>&wait=<sec>]
+    With `since`, long-polls until the job's version exceeds it (or `wait`
+    seconds pass) and then returns the current status. Either way a request
+    whose If-None-Match still matches gets a 304; it is answered from the job
+    state cache without a Mongo read while the cached version is fresh.
+    Past STATUS_WAITERS_MAX open waits the status is returned at once, with
+    a Retry-After header.
+    """
+    since = request.args.get("since", type=int)
+    if since is None:
+        job = get_job(job_id)
+        if not job:
+            return jsonify({"error": "job not found"}), 404
+        return job_status_response(job)
+
+    wait = min(request.args.get("wait", LONG_POLL_MAX_SEC, type=float), LONG_POLL_MAX_SEC)
+    with status_waiter_slot() as waiting, JOB_EVENTS.watch(job_id):
+        job = get_job(job_id)
+        if not job:
+            return jsonify({"error": "job not found"}), 404
+        if waiting and job.get("version", 0) <= since and job.get("status") not in TERMINAL_STATUSES:
+            if JOB_EVENTS.wait_for_change(job_id, job.get("version", 0), wait):
+                job = get_job(job_id) or job
+    resp = job_status_response(job)
+    if not waiting:
+        resp.headers["Retry-After"] = str(STATUS_BUSY_RETRY_SEC)
+    return resp
+
+@app.route("/api/batch/<batch_id>", methods=["GET"])
+@limiter.limit("60 per minute")
+def api_batch_status(batch_id: str):
+    """Aggregate status of a batch plus the status of each of its jobs."""
+    batch = batches_col.find_one({"batch_id": batch_id})
+    if not batch:
+        return jsonify({"error": "batch not found"}), 404
+    jobs = with_signed_urls(JOB_STATE.get_many(batch["job_ids"]))
+    etag, modified = job_validators(jobs)
+    return conditional_json(etag, modified, lambda: batch_status_payload(batch, jobs), compress=True)
+
+@app.route("/api/status/<job_id>/stream", methods=["GET"])
+@limiter.limit("30 per minute")
+def api_status_stream(job_id: str):
+    """
+    Server-Sent Events stream of job status. Emits a `status` event (id = job
+    version) whenever the job changes and an `end` event once it is done or
+    failed. Connections are closed after SSE_MAX_SEC; EventSource reconnects
+    with Last-Event-ID so no update is missed. Past STATUS_WAITERS_MAX open
+    streams, the current status is sent and the stream closed with a
+    STATUS_BUSY_RETRY_SEC reconnect delay (i.e. the client short-polls).
+    """
+    if not get_job(job_id):
         return jsonify({"error": "job not found"}), 404
-    fields = [
-        "id", "status", "progress", "prompt", "prompt_source", "error",
-        "mp4_url", "mp4_gcs_path", "hls_url", "thumb_vtt_url", "created_at"
-    ]
-    return jsonify({k: job.get(k) for k in fields})
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("since")
+    try:
+        since = int(last_id) if last_id is not None else -1
+    except ValueError:
+        since = -1
+
+    def events():
+        with status_waiter_slot() as streaming:
+            yield from stream(streaming)
+
+    def stream(streaming: bool):
+        deadline = time.time() + SSE_MAX_SEC
+        seen = since
+        yield f"retry: {2000 if streaming else STATUS_BUSY_RETRY_SEC * 1000}\n\n"
+        with JOB_EVENTS.watch(job_id):
+            while True:
+                job = get_job(job_id)
+                if not job:
+                    return
+                version = job.get("version", 0)
+                if version > seen:
+                    seen = version
+                    payload = job_status_payload(with_signed_urls([job])[0])
+                    yield f"id: {version}\nevent: status\ndata: {json.dumps(payload)}\n\n"
+                if job.get("status") in TERMINAL_STATUSES:
+                    yield "event: end\ndata: {}\n\n"
+                    return
+                remaining = deadline - time.time()
+                if remaining <= 0 or not streaming:
+                    return
+                if not JOB_EVENTS.wait_for_change(job_id, seen, min(remaining, SSE_KEEPALIVE_SEC)):
+                    yield ": keepalive\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+VIDEO_LIST_FIELDS = (
+    "job_id", "prompt", "status", "progress", "mp4_url", "mp4_gcs_path", "hls_url", "thumb_vtt_url", "created_at",
+    "error", "version", "updated_at", "samples", "assets",
+)
+
+def video_list_item(v: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": v.get("job_id"),
+        "prompt": v.get("prompt"),
+        "status": v.get("status"),
+        "progress": v.get("progress"),
+        "mp4_url": v.get("mp4_url"),
+        "hls_url": v.get("hls_url"),
+        "thumb_vtt_url": v.get("thumb_vtt_url"),
+        "created_at": v.get("created_at"),
+        "error": v.get("error"),
+        "samples": v.get("samples") or 1,
+        "assets": public_assets(v),
+    }
+
+def parse_video_cursor(after: str) -> Dict[str, Any]:
+    """Keyset filter for ?after=<created_at>,<job_id> (newest first)."""
+    created_at, _, job_id = after.partition(",")
+    ts = float(created_at)
+    if not job_id:
+        raise ValueError("cursor must be <created_at>,<job_id>")
+    return {"$or": [
+        {"created_at": {"$lt": ts}},
+        {"created_at": ts, "job_id": {"$lt": job_id}},
+    ]}
 
 @app.route("/api/videos", methods=["GET"])
 @limiter.limit("30 per minute")
 def api_list_videos():
-    page = int(request.args.get("page", 1))
-    per_page = int(request.args.get("per_page", 20))
-    total = videos_col.count_documents({})
-    cursor = videos_col.find().sort("created_at", -1).skip((page - 1) * per_page).limit(per_page)
-    items = []
-    for v in cursor:
-        items.append({
-            "id": v.get("job_id"),
-            "prompt": v.get("prompt"),
-            "status": v.get("status"),
-            "progress": v.get("progress"),
-            "mp4_url": v.get("mp4_url"),
-            "hls_url": v.get("hls_url"),
-            "thumb_vtt_url": v.get("thumb_vtt_url"),
-            "created_at": v.get("created_at"),
-            "error": v.get("error")
-        })
-    return jsonify({
-        "total": total,
-        "page": page,
-        "per_page": per_page,
-        "items": items
-    })
+    """
+    Newest-first history. Pass the returned next_cursor back as ?after= to get
+    the next page; next_cursor is null on the last page. ?page= (offset
+    pagination) still works for old clients but gets slower with depth.
+    Pages are gzip/brotli encoded and revalidate with a version-based ETag.
+    """
+    per_page = max(1, min(int(request.args.get("per_page", 20)), 100))
+    after = request.args.get("after")
+    query: Dict[str, Any] = {}
+    if after:
+        try:
+            query = parse_video_cursor(after)
+        except ValueError:
+            return jsonify({"error": "Invalid 'after' cursor"}), 400
+    projection = {f: 1 for f in VIDEO_LIST_FIELDS}
+    projection["_id"] = 0
+    cursor = videos_col.find(query, projection).sort([("created_at", -1), ("job_id", -1)])
+    page = request.args.get("page")
+    if page and not after:
+        cursor = cursor.skip((max(int(page), 1) - 1) * per_page)
+    # One extra row tells us whether there is another page
+    docs = list(cursor.limit(per_page + 1))
+    next_cursor = None
+    if len(docs) > per_page:
+        docs = docs[:per_page]
+        last = docs[-1]
+        next_cursor = f"{last.get('created_at')!r},{last.get('job_id')}"
+    # One signing pass for the whole page (cached URLs cost nothing)
+    docs = with_signed_urls(docs)
+    total = estimated_video_count()
+    etag, modified = job_validators(docs)
+
+    def build():
+        resp = {
+            "total": total,
+            "per_page": per_page,
+            "next_cursor": next_cursor,
+            "items": [video_list_item(v) for v in docs]
+        }
+        if page and not after:
+            resp["page"] = int(page)
+        return resp
+
+    return conditional_json(weak_etag(etag, total), modified, build, compress=True)
 
 @app.route("/api/videos/<string:video_id>", methods=["GET"])
 def api_get_video(video_id):
     try:
-        v = videos_col.find_one({"job_id": video_id})
+        # Shares the job state cache with /api/status, so repeat reads skip Mongo
+        v = JOB_STATE.get(video_id)
     except Exception as e:
         return jsonify({"error": f"db error: {e}"}), 500
     if not v:
         return jsonify({"error": "not found"}), 404
-    return jsonify({
-        "id": v.get("job_id"),
-        "prompt": v.get("prompt"),
-        "status": v.get("status"),
-        "progress": v.get("progress"),
-        "mp4_url": v.get("mp4_url"),
-        "hls_url": v.get("hls_url"),
-        "thumb_vtt_url": v.get("thumb_vtt_url"),
-        "created_at": v.get("created_at"),
-        "error": v.get("error")
-    })
+    v = with_signed_urls([v])[0]
+    etag, modified = job_validators([v])
+    return conditional_json(etag, modified, lambda: video_list_item(v))
+
+# -----------------------
+# Local media serving (/videos, /hls)
+# -----------------------
+# Byte-bounded LRU of small media files. Playlists are cached on first read;
+# segments and images only once they are requested again (hot), so one-off
+# playback does not churn the cache. Entries are validated against the file's
+# ETag (size + mtime), so a rewritten file is never served stale.
+class MediaCache:
+    def __init__(self, max_bytes: int, max_file_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._entries: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str, etag: str) -> Optional[bytes]:
+        with self._lock:
+            hit = self._entries.get(path)
+            if hit and hit[0] == etag:
+                self._entries.move_to_end(path)
+                CACHE_LOOKUPS.labels("media", "hit").inc()
+                return hit[1]
+        CACHE_LOOKUPS.labels("media", "miss").inc()
+        return None
+
+    def load(self, path: str, etag: str, size: int, manifest: bool) -> Optional[bytes]:
+        """Read `path` into the cache if it qualifies; None means stream it from disk."""
+        if size > self.max_file_bytes or size > self.max_bytes:
+            return None
+        if not manifest:
+            with self._lock:
+                if len(self._seen) > 10000:
+                    self._seen.clear()
+                self._seen[path] = self._seen.get(path, 0) + 1
+                if self._seen[path] < 2:
+                    return None
+        with open(path, "rb") as f:
+            data = f.read()
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old:
+                self._bytes -= len(old[1])
+            self._entries[path] = (etag, data)
+            self._bytes += len(data)
+            self._seen.pop(path, None)
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+            MEDIA_CACHE_BYTES.set(self._bytes)
+        return data
+
+MEDIA_CACHE = MediaCache(MEDIA_CACHE_MB * 1024 * 1024, MEDIA_CACHE_MAX_FILE_KB * 1024)
+
+def serve_media(root: Path, kind: str, filename: str):
+    """
+    Serve a file under `root` with a strong ETag, Range/206 and conditional
+    (304) handling. Segments, images and MP4s are immutable; playlists are
+    revalidated after MEDIA_MANIFEST_MAX_AGE. Full responses from disk go
+    through wsgi.file_wrapper (sendfile under gunicorn). With
+    MEDIA_ACCEL_REDIRECT set, nginx is told to send the bytes instead.
+    """
+    path = safe_join(str(root), filename)
+    if path is None:
+        abort(404)
+    try:
+        st = os.stat(path)
+    except OSError:
+        abort(404)
+    if not stat.S_ISREG(st.st_mode):
+        abort(404)
+    LOCAL_STORAGE.touch(Path(path))
+
+    suffix = os.path.splitext(path)[1].lower()
+    mimetype = HLS_CONTENT_TYPES.get(suffix) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    manifest = suffix in MANIFEST_SUFFIXES
+
+    if MEDIA_ACCEL_REDIRECT:
+        resp = Response(mimetype=mimetype)
+        resp.headers["X-Accel-Redirect"] = f"{MEDIA_ACCEL_REDIRECT}/{kind}/{filename}"
+    else:
+        etag = f"{st.st_size:x}-{st.st_mtime_ns:x}"
+        data = MEDIA_CACHE.get(path, etag) or MEDIA_CACHE.load(path, etag, st.st_size, manifest)
+        resp = send_file(
+            io.BytesIO(data) if data is not None else path,
+            mimetype=mimetype,
+            conditional=True,
+            etag=etag,
+            last_modified=st.st_mtime,
+            max_age=MEDIA_MANIFEST_MAX_AGE if manifest else None,
+        )
+    if not manifest:
+        resp.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        resp.headers.pop("Expires", None)
+    elif MEDIA_ACCEL_REDIRECT:
+        resp.headers["Cache-Control"] = f"public, max-age={MEDIA_MANIFEST_MAX_AGE}"
+    return resp
 
 # local fallback
 @app.route("/videos/<path:filename>")
 @limiter.exempt
 def serve_video(filename):
-    safe_name = secure_filename(filename)
-    fp = Path(app.config["VIDEO_DIR"]) / safe_name
-    if not fp.exists():
-        abort(404)
-    return send_from_directory(app.config["VIDEO_DIR"], safe_name, as_attachment=False)
+    return serve_media(VIDEO_DIR, "videos", secure_filename(filename))
 
 @app.route("/hls/<path:filename>")
 @limiter.exempt
 def serve_hls(filename):
-    base = Path(app.config["HLS_DIR"]).resolve()
-    fp = (base / filename).resolve()
-    # Prevent path traversal
-    if not str(fp).startswith(str(base)) or not fp.exists():
-        abort(404)
-    return send_from_directory(str(fp.parent), fp.name, as_attachment=False)
+    return serve_media(HLS_DIR, "hls", filename)
+
+# -----------------------
+# Warm-up & Readiness
+# -----------------------
+# Each process connects to its backends in the background after startup (or
+# after a fork). /healthz (liveness) never touches them; /readyz turns 200 once
+# the required ones are warm and keeps re-checking Mongo afterwards.
+READY_BACKENDS = ("mongo", "storage", "genai")
+_backend_state: Dict[str, Dict[str, Any]] = {}
+_warmup_pid: Optional[int] = None
+
+def ensure_indexes():
+    ensure_video_indexes()
+    if GEN_CACHE_ENABLED:
+        ensure_generation_cache_indexes()
+    if LLM_CACHE_ENABLED:
+        LLM_CACHE.ensure_indexes()
+
+def check_backend(name: str, fn) -> bool:
+    start = time.time()
+    try:
+        fn()
+    except Exception as e:
+        if _backend_state.get(name, {}).get("ready", True):
+            log.warning(f"[readiness] {name} not ready: {e}")
+        _backend_state[name] = {"ready": False, "error": str(e)}
+        return False
+    _backend_state[name] = {"ready": True, "checked_sec": round(time.time() - start, 3)}
+    return True
+
+def _warm_up_loop():
+    indexed = False
+    while True:
+        if check_backend("mongo", lambda: mongo_client.admin.command("ping")) and not indexed:
+            ensure_indexes()
+            indexed = True
+        for client in (storage_client, genai_client):
+            if not client.ready:
+                check_backend(client.name, client.get)
+        if OPENAI_API_KEY and not openai.ready:
+            check_backend("openai", openai.get)
+        ready = all(_backend_state.get(n, {}).get("ready") for n in READY_BACKENDS)
+        time.sleep(READINESS_RECHECK_SEC if ready else 2)
+
+def start_warm_up():
+    """Warm this process's clients in the background (once per process)."""
+    global _warmup_pid
+    with _scheduler_lock:
+        if _warmup_pid == os.getpid():
+            return
+        _warmup_pid = os.getpid()
+    threading.Thread(target=_warm_up_loop, name="warm-up", daemon=True).start()
+    LOCAL_STORAGE.start_janitor()
+
+# Nothing starts at import (a preloading master, bench.py or a test would run
+# jobs). gunicorn.conf.py starts both in each worker, run_worker() in the worker
+# role, and this hook covers any other server on its first request.
+@app.before_request
+def _start_background():
+    if _warmup_pid != os.getpid():
+        start_warm_up()
+        start_scheduler()
 
 @app.route("/")
 @limiter.exempt
@@ -651,8 +3733,78 @@ def health():
 @app.route("/api/health")
 @limiter.exempt
 def healthz():
-    return jsonify({"status": "healthy"})
+    """Liveness: the process is serving. Does not touch any backend."""
+    return jsonify({"status": "healthy", "storage": LOCAL_STORAGE.metrics()})
+
+@app.route("/readyz")
+@limiter.exempt
+def readyz():
+    """Readiness: 200 once Mongo, GCS and GenAI are warm in this process, else 503."""
+    backends = {n: _backend_state.get(n, {"ready": False}) for n in (*READY_BACKENDS, "openai")}
+    ready = all(backends[n]["ready"] for n in READY_BACKENDS)
+    return jsonify({"ready": ready, "worker": WORKER_ID, "backends": backends}), 200 if ready else 503
+
+class ScrapeTimeCollector:
+    """Gauges read when /metrics is scraped rather than tracked continuously."""
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        yield GaugeMetricFamily("job_queue_depth", "Jobs waiting to be claimed", value=queue_depth())
+        storage = GaugeMetricFamily("local_storage", "Local media storage as of the last janitor sweep", labels=["stat"])
+        for name, value in LOCAL_STORAGE.metrics().items():
+            storage.add_metric([name], value)
+        yield storage
+
+SCRAPE_COLLECTOR = ScrapeTimeCollector()
+REGISTRY.register(SCRAPE_COLLECTOR)
+
+@app.route("/metrics")
+@limiter.exempt
+def metrics():
+    """Prometheus exposition of the metrics defined at the top of this file."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(SCRAPE_COLLECTOR)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+def run_worker():
+    """`python app.py worker`: run jobs without serving HTTP until SIGTERM/SIGINT, then drain."""
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    if WORKER_METRICS_PORT:
+        start_http_server(WORKER_METRICS_PORT)
+    start_warm_up()
+    start_scheduler()
+    while not stop.wait(1):
+        pass
+
+    _draining.set()
+    log.info(f"[worker] Draining {len(JOBS)} running jobs (up to {WORKER_DRAIN_SEC}s)")
+    deadline = time.time() + WORKER_DRAIN_SEC
+    while time.time() < deadline:
+        with JOBS_LOCK:
+            if not JOBS:
+                break
+        time.sleep(1)
+    with JOBS_LOCK:
+        left = list(JOBS)
+    if left:
+        # Let other workers reclaim them now rather than after JOB_LEASE_SEC
+        videos_col.update_many({"job_id": {"$in": left}, "lease_owner": WORKER_ID}, {"$set": {"lease_until": 0}})
+        log.warning(f"[worker] Released {len(left)} unfinished jobs")
+    JOB_STATE.flush()
 
 if __name__ == "__main__":
-    debug = os.getenv("FLASK_DEBUG", "false").lower() in ("1", "true", "yes")
-    app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), debug=debug)
+    if PROCESS_ROLE == "worker":
+        run_worker()
+    else:
+        debug = os.getenv("FLASK_DEBUG", "false").lower() in ("1", "true", "yes")
+        start_warm_up()
+        start_scheduler()
+        app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), debug=debug)
@@ -0,0 +1,439 @@
+"""
+Offline benchmark for the generation pipeline and the status endpoint.
+
+    pip install mongomock            # or pass --mongo-uri for a local mongod
+    python bench.py --jobs 20 --veo-latency 10 --pollers 50 --json baseline.json
+    python bench.py --jobs 20 --veo-latency 10 --pollers 50 --baseline baseline.json
+
+Veo, GCS, MongoDB and OpenAI are replaced with local stand-ins *before* app is
+imported (it reads its settings at import time and its clients resolve the
+patched constructors on first use):
+- Veo: operations finish after --veo-latency seconds and return a synthetic MP4
+  rendered once with ffmpeg (testsrc2 + sine)
+- GCS: blobs are files under a temporary directory; with --private the bucket is
+  private, so status responses carry URLs signed in --sign-latency seconds each
+- MongoDB: mongomock, unless --mongo-uri is given
+- OpenAI: ChatCompletion.create sleeps --llm-latency and returns a fixed reply
+
+VIDEO_DIR and HLS_DIR point into the same temporary directory. Everything else
+(scheduler, poller, ffmpeg packaging, job state cache, Flask routes) is the
+real code, so jobs/minute, end-to-end latency, the per-stage
+breakdown from each job's `timings` and status-endpoint throughput reflect the
+pipeline itself. Scheduler knobs (JOB_WORKERS, VEO_CONCURRENCY, ...) are read
+from the environment as usual.
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+CHUNK_SIZE = 1024 * 1024
+# Report order for the job `timings` recorded by app.py
+STAGE_ORDER = ("queue", "veo_submit", "veo_wait", "download", "mp4_upload", "package", "hls_upload", "total")
+
+# -----------------------
+# Stand-ins
+# -----------------------
+def make_sample_mp4(path: Path, seconds: float, faststart: bool) -> Path:
+    """Render a 720p clip with audio, similar in shape to a Veo result."""
+    cmd = [
+        os.getenv("FFMPEG_BIN", "ffmpeg"), "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=24:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest",
+        *(["-movflags", "+faststart"] if faststart else []),
+        str(path),
+    ]
+    subprocess.run(cmd, check=True)
+    return path
+
+class FakeOperation:
+    def __init__(self, latency: float, video, count: int = 1):
+        self.name = f"operations/{uuid.uuid4().hex}"
+        self.error = None
+        self._ready_at = time.time() + latency
+        self._video = video
+        self._count = count
+
+    @property
+    def done(self) -> bool:
+        return time.time() >= self._ready_at
+
+    @property
+    def result(self):
+        return types.SimpleNamespace(generated_videos=[types.SimpleNamespace(video=self._video)] * self._count)
+
+class FakeGenaiClient:
+    """google.genai.Client with models.generate_videos, operations.get and files.download."""
+
+    latency = 10.0
+    sample: Optional[Path] = None
+
+    def __init__(self, **_):
+        cls = type(self)
+        video = types.SimpleNamespace(uri=str(cls.sample), video_bytes=None)
+        self.models = types.SimpleNamespace(generate_videos=self._generate)
+        self._video = video
+        self.operations = types.SimpleNamespace(get=lambda operation: operation)
+        self.files = types.SimpleNamespace(download=self._download)
+
+    def _generate(self, config=None, **_):
+        # One video per requested sample (GenerateVideosConfig.number_of_videos)
+        count = getattr(config, "number_of_videos", None) or 1
+        return FakeOperation(type(self).latency, self._video, count)
+
+    @staticmethod
+    def _download(file, destination):
+        with open(file.uri, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                destination.write(chunk)
+
+class FakeBlob:
+    # Seconds per generate_signed_url (a v4 signature is an RSA sign, or an IAM round-trip)
+    sign_latency = 0.0
+
+    def __init__(self, root: Path, bucket: str, name: str):
+        self.path = root / bucket / name
+        self.name = name
+        self.cache_control = None
+
+    def upload_from_filename(self, filename: str, content_type: Optional[str] = None, **_):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(filename, self.path)
+
+    def open(self, mode: str = "rb", **_):
+        if "w" in mode:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        return open(self.path, mode)
+
+    def generate_signed_url(self, **_) -> str:
+        time.sleep(self.sign_latency)
+        return self.path.as_uri()
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+class FakeStorageClient:
+    """Filesystem-backed google.cloud.storage.Client."""
+
+    root: Optional[Path] = None
+
+    def __init__(self, *_, **__):
+        pass
+
+    def bucket(self, name: str):
+        root = type(self).root
+        return types.SimpleNamespace(blob=lambda object_name, **_: FakeBlob(root, name, object_name))
+
+IMPROVE_REPLY = json.dumps({
+    "auto_improved": "A slow dolly shot across a rain-soaked neon street at night, reflections shimmering.",
+    "variants": [
+        {"concise": f"variant {i}", "expanded": f"Variant {i}: a cinematic street scene, shot {i}."}
+        for i in range(4)
+    ],
+})
+
+def fake_chat_completion(latency: float):
+    def create(stream: bool = False, **_):
+        time.sleep(latency)
+        if not stream:
+            return {"choices": [{"message": {"content": IMPROVE_REPLY}}]}
+        step = 16
+        return iter(
+            {"choices": [{"delta": {"content": IMPROVE_REPLY[i:i + step]}}]}
+            for i in range(0, len(IMPROVE_REPLY), step)
+        )
+    return create
+
+def install_fakes(args, workdir: Path):
+    """Point every external client app.py uses at a stand-in, and its local media at workdir."""
+    # Not defaults: the run must never touch the real media directories or bucket mode
+    os.environ["VIDEO_DIR"] = str(workdir / "videos")
+    os.environ["HLS_DIR"] = str(workdir / "hls")
+    os.environ["GCS_PUBLIC"] = "false" if args.private else "true"
+    for key, value in {
+        "GOOGLE_API_KEY": "bench",
+        "OPENAI_API_KEY": "bench",
+        "GCS_BUCKET_NAME": "bench",
+        "MONGODB_URI": args.mongo_uri or "mongodb://bench",
+        "MONGODB_DB": f"bench_{uuid.uuid4().hex[:8]}",
+        "RATELIMIT_STORAGE_URI": "memory://",
+        "QUOTA_BACKEND": "memory",
+        "VEO_QUOTA_PER_MIN": "0",
+        "OPENAI_QUOTA_PER_MIN": "0",
+        "VEO_EXPECTED_SEC": str(max(1, round(args.veo_latency))),
+        "JOB_MAX_QUEUE": str(max(50, args.jobs)),
+        "LOCAL_JANITOR_SEC": "0",
+        "LOG_LEVEL": "WARNING",
+    }.items():
+        os.environ.setdefault(key, value)
+
+    import google.genai
+    import google.cloud.storage
+    import openai
+    import pymongo
+
+    FakeGenaiClient.latency = args.veo_latency
+    FakeGenaiClient.sample = make_sample_mp4(workdir / "sample.mp4", args.clip_sec, not args.moov_at_end)
+    google.genai.Client = FakeGenaiClient
+    FakeStorageClient.root = workdir / "gcs"
+    FakeBlob.sign_latency = args.sign_latency
+    google.cloud.storage.Client = FakeStorageClient
+    openai.ChatCompletion.create = staticmethod(fake_chat_completion(args.llm_latency))
+
+    if not args.mongo_uri:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("bench.py needs mongomock (pip install mongomock) or --mongo-uri")
+
+        def bulk_write(self, requests, ordered=True, **_):
+            # mongomock's bulk builder predates pymongo's `sort` argument; the
+            # job state flush only sends UpdateOne, so apply them one by one
+            for op in requests:
+                self.update_one(op._filter, op._doc, upsert=op._upsert)
+        mongomock.collection.Collection.bulk_write = bulk_write
+        pymongo.MongoClient = mongomock.MongoClient
+
+# -----------------------
+# Measurements
+# -----------------------
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    return {
+        "n": len(values),
+        "p50": percentile(values, 50),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+def poll_status(client, job_ids: List[str], stop: threading.Event, latencies: List[float], lock: threading.Lock):
+    """One status poller: GET /api/status/<id> round-robin until stopped."""
+    local = []
+    i = 0
+    while not stop.is_set():
+        job_id = job_ids[i % len(job_ids)]
+        i += 1
+        start = time.perf_counter()
+        resp = client.get(f"/api/status/{job_id}")
+        local.append(time.perf_counter() - start)
+        if resp.status_code != 200:
+            raise RuntimeError(f"status endpoint returned {resp.status_code}")
+    with lock:
+        latencies.extend(local)
+
+def run_pipeline(app, args) -> Dict[str, Any]:
+    client = app.app.test_client()
+    submitted: Dict[str, float] = {}
+    started = time.time()
+    for i in range(args.jobs):
+        # Distinct prompts so the generation cache (if enabled) never short-circuits a job
+        resp = client.post("/api/generate", json={"prompt": f"bench clip {i} {uuid.uuid4().hex[:6]}",
+                                                  "samples": args.samples})
+        if resp.status_code != 202:
+            raise RuntimeError(f"/api/generate returned {resp.status_code}: {resp.get_json()}")
+        submitted[resp.get_json()["job_id"]] = time.time()
+        if args.interval:
+            time.sleep(args.interval)
+
+    stop = threading.Event()
+    status_latencies: List[float] = []
+    lock = threading.Lock()
+    pollers = [
+        threading.Thread(
+            target=poll_status,
+            args=(app.app.test_client(), list(submitted), stop, status_latencies, lock),
+            daemon=True,
+        )
+        for _ in range(args.pollers)
+    ]
+    poll_started = time.perf_counter()
+    for t in pollers:
+        t.start()
+
+    finished: Dict[str, float] = {}
+    statuses: Dict[str, str] = {}
+    deadline = started + args.timeout
+    while len(finished) < len(submitted) and time.time() < deadline:
+        pending = [j for j in submitted if j not in finished]
+        for doc in app.videos_col.find({"job_id": {"$in": pending}}, {"job_id": 1, "status": 1}):
+            if doc["status"] in app.TERMINAL_STATUSES:
+                finished[doc["job_id"]] = time.time()
+                statuses[doc["job_id"]] = doc["status"]
+        time.sleep(0.05)
+    elapsed = time.time() - started
+
+    stop.set()
+    for t in pollers:
+        t.join()
+    poll_elapsed = time.perf_counter() - poll_started
+
+    app.JOB_STATE.flush()
+    stages: Dict[str, List[float]] = {}
+    for doc in app.videos_col.find({"job_id": {"$in": list(submitted)}}, {"timings": 1}):
+        for stage, seconds in (doc.get("timings") or {}).items():
+            stages.setdefault(stage, []).append(seconds)
+
+    done = [j for j, s in statuses.items() if s == "done"]
+    return {
+        "jobs": len(submitted),
+        "done": len(done),
+        "errors": sum(1 for s in statuses.values() if s == "error"),
+        "unfinished": len(submitted) - len(finished),
+        "elapsed_sec": elapsed,
+        "jobs_per_min": len(done) / elapsed * 60 if elapsed else 0.0,
+        "e2e_sec": summarize([finished[j] - submitted[j] for j in done]),
+        "stages_sec": {
+            stage: summarize(stages[stage])
+            for stage in sorted(stages, key=lambda s: (STAGE_ORDER + (s,)).index(s))
+        },
+        "status": {
+            "pollers": args.pollers,
+            "requests": len(status_latencies),
+            "req_per_sec": len(status_latencies) / poll_elapsed if poll_elapsed and status_latencies else 0.0,
+            "latency_sec": summarize(status_latencies),
+        },
+    }
+
+def run_improve(app, args) -> Dict[str, Any]:
+    """Fire --improve-requests /api/improve calls, --improve-unique distinct prompts, from 8 threads."""
+    client_local = threading.local()
+
+    def call(i: int) -> float:
+        if not hasattr(client_local, "client"):
+            client_local.client = app.app.test_client()
+        start = time.perf_counter()
+        resp = client_local.client.post("/api/improve", json={"prompt": f"neon street {i % args.improve_unique}"})
+        if resp.status_code != 200:
+            raise RuntimeError(f"/api/improve returned {resp.status_code}: {resp.get_json()}")
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        latencies = list(pool.map(call, range(args.improve_requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "unique_prompts": args.improve_unique,
+        "req_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_sec": summarize(latencies),
+    }
+
+# -----------------------
+# Report
+# -----------------------
+def _fmt(value: Optional[float], unit: str = "s") -> str:
+    return "-" if value is None else f"{value:.3f}{unit}"
+
+def _delta(current: Optional[float], base: Optional[float]) -> str:
+    if current is None or not base:
+        return ""
+    return f"  ({(current - base) / base * 100:+.1f}% vs baseline)"
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]):
+    pipe = results["pipeline"]
+    base_pipe = (baseline or {}).get("pipeline", {})
+    print(f"\n== Pipeline: {pipe['jobs']} jobs, veo latency {results['config']['veo_latency']}s ==")
+    print(f"done {pipe['done']}  error {pipe['errors']}  unfinished {pipe['unfinished']}  in {pipe['elapsed_sec']:.1f}s")
+    print(f"jobs/min      {pipe['jobs_per_min']:.2f}{_delta(pipe['jobs_per_min'], base_pipe.get('jobs_per_min'))}")
+    e2e, base_e2e = pipe["e2e_sec"], base_pipe.get("e2e_sec", {})
+    print(f"e2e p50       {_fmt(e2e['p50'])}{_delta(e2e['p50'], base_e2e.get('p50'))}")
+    print(f"e2e p99       {_fmt(e2e['p99'])}{_delta(e2e['p99'], base_e2e.get('p99'))}")
+
+    print(f"\n{'stage':<12} {'n':>4} {'p50':>10} {'p99':>10} {'max':>10}")
+    for stage, s in pipe["stages_sec"].items():
+        base_p50 = base_pipe.get("stages_sec", {}).get(stage, {}).get("p50")
+        print(f"{stage:<12} {s['n']:>4} {_fmt(s['p50']):>10} {_fmt(s['p99']):>10} {_fmt(s['max']):>10}{_delta(s['p50'], base_p50)}")
+
+    st, base_st = pipe["status"], base_pipe.get("status", {})
+    if st["requests"]:
+        print(f"\n== /api/status: {st['pollers']} concurrent pollers ==")
+        print(f"requests {st['requests']}  req/s {st['req_per_sec']:.1f}{_delta(st['req_per_sec'], base_st.get('req_per_sec'))}")
+        lat = st["latency_sec"]
+        print(f"p50 {lat['p50'] * 1000:.2f}ms  p99 {lat['p99'] * 1000:.2f}ms  max {lat['max'] * 1000:.2f}ms")
+
+    imp = results.get("improve")
+    if imp:
+        base_imp = (baseline or {}).get("improve", {})
+        print(f"\n== /api/improve: {imp['requests']} requests, {imp['unique_prompts']} unique prompts ==")
+        print(f"req/s {imp['req_per_sec']:.1f}{_delta(imp['req_per_sec'], base_imp.get('req_per_sec'))}  "
+              f"p50 {_fmt(imp['latency_sec']['p50'])}  p99 {_fmt(imp['latency_sec']['p99'])}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--jobs", type=int, default=10, help="generation jobs to submit")
+    parser.add_argument("--samples", type=int, default=1, help="videos per job (one Veo operation each)")
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds between submissions (0 = burst)")
+    parser.add_argument("--veo-latency", type=float, default=10.0, help="seconds until a fake Veo operation is done")
+    parser.add_argument("--clip-sec", type=float, default=8.0, help="duration of the synthetic MP4")
+    parser.add_argument("--moov-at-end", action="store_true", help="non-faststart MP4 (exercises the spooled path)")
+    parser.add_argument("--pollers", type=int, default=20, help="concurrent /api/status pollers during the run")
+    parser.add_argument("--private", action="store_true", help="private bucket: sign MP4 URLs per status response")
+    parser.add_argument("--sign-latency", type=float, default=0.002, help="seconds per fake signed URL (with --private)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per fake OpenAI call")
+    parser.add_argument("--improve-requests", type=int, default=0, help="/api/improve calls to make after the pipeline run")
+    parser.add_argument("--improve-unique", type=int, default=5, help="distinct prompts among those calls")
+    parser.add_argument("--mongo-uri", help="use this MongoDB instead of mongomock (a throwaway database is created)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="give up on unfinished jobs after this many seconds")
+    parser.add_argument("--json", help="write results to this file (use it later as --baseline)")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = Path(tempfile.mkdtemp(prefix="video-bench-"))
+    try:
+        install_fakes(args, workdir)
+        sys.path.insert(0, str(Path(__file__).parent))
+        import app
+
+        app.limiter.enabled = False
+        results = {
+            "config": {
+                **{k: v for k, v in vars(args).items() if k not in ("json", "baseline", "mongo_uri")},
+                "job_workers": app.JOB_WORKERS,
+                "stage_limits": app.STAGE_LIMITS,
+                "transfer_mode": app.VEO_TRANSFER_MODE,
+                "gcs_public": app.GCS_PUBLIC,
+            },
+            "pipeline": run_pipeline(app, args),
+        }
+        if args.improve_requests:
+            results["improve"] = run_improve(app, args)
+        if args.mongo_uri:
+            app.mongo_client.drop_database(app.MONGO_DB)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+# Gunicorn settings picked up automatically from the working directory.
+# Command-line flags in the Dockerfile (bind, workers, threads, timeout) take precedence.
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # Metric files from a previous run would be summed into the new one
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_worker_init(worker):
+    # Background threads (warm-up, janitor, job workers) start per worker, never in
+    # the master, even with --preload
+    import app
+
+    app.start_warm_up()
+    app.start_scheduler()
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges (e.g. stage_active) from /metrics
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
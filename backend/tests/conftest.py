@@ -0,0 +1,66 @@
+"""
+Test setup: app.py reads its settings at import, so the environment is fixed
+here first. MongoDB is mongomock; nothing else external is reached (no job
+workers, no warm-up thread, memory-backed quotas and rate limits).
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import mongomock
+import pytest
+
+_media = Path(tempfile.mkdtemp(prefix="video-tests-"))
+os.environ.update({
+    "MONGODB_URI": "mongodb://tests",
+    "MONGODB_DB": "tests",
+    "GCS_BUCKET_NAME": "tests",
+    "GCS_PUBLIC": "true",
+    "VIDEO_DIR": str(_media / "videos"),
+    "HLS_DIR": str(_media / "hls"),
+    "PROCESS_ROLE": "all",
+    "JOB_QUEUE_BACKEND": "mongo",
+    # No scheduler threads; tests drive claims and stages themselves
+    "JOB_WORKERS": "0",
+    # mongomock's bulk_write rejects pymongo's UpdateOne; never flush in the background
+    "JOB_FLUSH_SEC": "3600",
+    "VIDEO_COUNT_TTL_SEC": "0",
+    "GEN_CACHE_ENABLED": "false",
+    "QUOTA_BACKEND": "memory",
+    "VEO_QUOTA_PER_MIN": "0",
+    "RATELIMIT_STORAGE_URI": "memory://",
+    "LOCAL_JANITOR_SEC": "0",
+    "LOG_LEVEL": "WARNING",
+})
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import app as app_module  # noqa: E402
+
+app_module.MongoClient = mongomock.MongoClient
+app_module.limiter.enabled = False
+
+@pytest.fixture
+def app():
+    """The app module, with an empty database and cold caches."""
+    app_module.mongo_client.drop_database(app_module.MONGO_DB)
+    app_module.JOB_STATE._docs.clear()
+    app_module.JOB_STATE._pending.clear()
+    app_module.SIGNED_URLS._mem.clear()
+    app_module.JOBS.clear()
+    # Counts as warmed up, so the before_request hook starts nothing
+    app_module._warmup_pid = os.getpid()
+    yield app_module
+    # Nothing left for the atexit flush
+    app_module.JOB_STATE._pending.clear()
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+@pytest.fixture
+def full_queue(app, monkeypatch):
+    """Two queued jobs against a JOB_MAX_QUEUE of 2."""
+    monkeypatch.setattr(app, "JOB_MAX_QUEUE", 2)
+    for i in range(2):
+        app.make_job(f"queued {i}", None, None)
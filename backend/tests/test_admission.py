@@ -0,0 +1,24 @@
+def assert_queue_full(app, resp, depth):
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == str(app.estimate_wait_sec(depth))
+    body = resp.get_json()
+    assert body["queue_depth"] == depth
+    assert body["estimated_wait_sec"] == app.estimate_wait_sec(depth)
+
+def test_generate_is_admitted_below_the_limit(app, client, monkeypatch):
+    monkeypatch.setattr(app, "JOB_MAX_QUEUE", 2)
+    app.make_job("queued", None, None)
+    resp = client.post("/api/generate", json={"prompt": "a lighthouse in a storm"})
+    assert resp.status_code == 202
+    assert resp.get_json()["queue_depth"] == 2
+
+def test_generate_rejected_when_queue_is_full(app, client, full_queue):
+    resp = client.post("/api/generate", json={"prompt": "a lighthouse in a storm"})
+    assert_queue_full(app, resp, 2)
+    assert app.videos_col.count_documents({}) == 2
+
+def test_generate_rejected_before_joining_the_cache(app, client, full_queue, monkeypatch):
+    monkeypatch.setattr(app, "GEN_CACHE_ENABLED", True)
+    resp = client.post("/api/generate", json={"prompt": "a lighthouse in a storm"})
+    assert_queue_full(app, resp, 2)
+    assert app.gen_cache_col.count_documents({}) == 0
@@ -0,0 +1,55 @@
+PROMPT = "A red fox crossing a snowy field at dawn"
+
+def statuses(app, job_ids):
+    return [app.get_job(j)["status"] for j in job_ids]
+
+def test_batch_queues_up_to_its_concurrency(app, client):
+    resp = client.post("/api/generate/batch", json={"prompts": ["one", "two", "three"], "concurrency": 2})
+    assert resp.status_code == 202
+    job_ids = resp.get_json()["job_ids"]
+    assert statuses(app, job_ids) == ["queued", "queued", "batched"]
+
+def test_finished_child_queues_the_next(app):
+    batch = app.create_batch([("one", "user_prompt"), ("two", "user_prompt"), ("three", "user_prompt")], None, 1)
+    first = batch["job_ids"][0]
+    app.promote_batch(batch["batch_id"])
+    assert statuses(app, batch["job_ids"]) == ["queued", "batched", "batched"]
+
+    app.update_job(first, status="done")
+    app.promote_batch(batch["batch_id"])
+    assert statuses(app, batch["job_ids"]) == ["done", "queued", "batched"]
+
+def test_batch_status_aggregates_children(app, client):
+    batch = app.create_batch([("one", "user_prompt"), ("two", "user_prompt")], None, 2)
+    first, second = batch["job_ids"]
+    app.update_job(first, status="done", progress=100)
+    app.update_job(second, status="error", error="Veo failed")
+
+    body = client.get(f"/api/batch/{batch['batch_id']}").get_json()
+    assert body["status"] == "partial"
+    assert body["counts"] == {"done": 1, "error": 1}
+    assert [j["job_id"] for j in body["jobs"]] == batch["job_ids"]
+
+def test_batch_rejected_when_it_does_not_fit(app, client, monkeypatch):
+    monkeypatch.setattr(app, "JOB_MAX_QUEUE", 2)
+    app.make_job("queued", None, None)
+    resp = client.post("/api/generate/batch", json={"prompts": ["one", "two"]})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == str(app.estimate_wait_sec(1))
+    assert app.batches_col.count_documents({}) == 0
+
+def test_promoted_batch_follower_waits_for_its_batch(app, client, monkeypatch):
+    monkeypatch.setattr(app, "GEN_CACHE_ENABLED", True)
+    leader = client.post("/api/generate", json={"prompt": PROMPT}).get_json()["job_id"]
+    batch = app.create_batch([(PROMPT, "user_prompt"), ("another prompt", "user_prompt")], None, 1)
+    follower, other = batch["job_ids"]
+    assert statuses(app, batch["job_ids"]) == ["waiting", "queued"]
+
+    app.update_job(leader, status="error", error="Veo failed")
+    app.settle_generation(leader)
+    # The batch's one slot is taken, so the promoted follower is not queued yet
+    assert app.get_job(follower)["status"] == "batched"
+
+    app.update_job(other, status="done")
+    app.promote_batch(batch["batch_id"])
+    assert app.get_job(follower)["status"] == "queued"
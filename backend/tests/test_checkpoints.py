@@ -0,0 +1,70 @@
+import pytest
+
+def test_saved_mp4_resumes_without_veo(app, monkeypatch):
+    job_id = app.make_job("p", None, None, status="running", mp4_gcs_path="videos/p.mp4",
+                          checkpoints={"operation": "operations/1", "downloaded": 1.0, "uploaded": 2.0})
+    tasks = []
+    monkeypatch.setattr(app, "enqueue_task", lambda fn, *args: tasks.append((fn, args)))
+    monkeypatch.setattr(app.OPERATION_POLLER, "watch", lambda *a: pytest.fail("Veo operation polled"))
+
+    assert app.generate_video_job(job_id) is True
+    assert tasks == [(app.finish_video_job, (job_id, None))]
+
+def test_known_operation_is_reattached(app, monkeypatch):
+    job_id = app.make_job("p", None, None, status="running", checkpoints={"operation": "operations/1"})
+    watched = []
+    monkeypatch.setattr(app.OPERATION_POLLER, "watch", lambda jid, op, model: watched.append((jid, op.name)))
+    try:
+        assert app.generate_video_job(job_id) is True
+    finally:
+        # Normally released by the poller once the operation completes
+        app.release_stage("veo")
+    assert watched == [(job_id, "operations/1")]
+
+def test_completed_stages_skip_what_is_published(app, tmp_path):
+    job = {"job_id": "j", "mp4_gcs_path": "videos/p.mp4", "hls_url": "https://cdn/hls/master.m3u8",
+           "checkpoints": {"uploaded": 1.0, "packaged": 2.0, "published": 3.0}}
+    done = app.completed_stages(job, tmp_path / "p.mp4", tmp_path / "hls")
+    # GCS_PUBLIC: the published tree is usable without the local files
+    assert set(done) == {"download", "mp4_upload", "package", "hls_upload"}
+    assert done["hls_upload"] == job["hls_url"]
+
+def test_local_checkpoints_need_their_files(app, tmp_path):
+    job = {"job_id": "j", "checkpoints": {"downloaded": 1.0, "packaged": 2.0}}
+    assert app.completed_stages(job, tmp_path / "p.mp4", tmp_path / "hls") == {}
+    (tmp_path / "p.mp4").write_bytes(b"mp4")
+    assert set(app.completed_stages(job, tmp_path / "p.mp4", tmp_path / "hls")) == {"download"}
+
+def test_retry_resumes_from_last_checkpoint(app, client):
+    job_id = app.make_job("p", None, None, status="error", error="upload failed", attempts=3,
+                          mp4_gcs_path="videos/p.mp4", checkpoints={"operation": "operations/1", "downloaded": 1.0})
+    version = app.get_job(job_id)["version"]
+
+    resp = client.post(f"/api/jobs/{job_id}/retry")
+    assert resp.status_code == 202
+    assert resp.get_json()["resume_from"] == "downloaded"
+    job = app.get_job(job_id)
+    assert job["status"] == "queued"
+    assert job["error"] is None
+    assert job["attempts"] == 0
+    assert job["version"] == version + 1
+    # Checkpoints survive, so the worker skips what is already done
+    assert job["checkpoints"]["operation"] == "operations/1"
+    assert app.MongoJobQueue().claim()["job_id"] == job_id
+
+@pytest.mark.parametrize("status", ["queued", "running", "done"])
+def test_retry_only_failed_jobs(app, client, status):
+    job_id = app.make_job("p", None, None, status=status)
+    resp = client.post(f"/api/jobs/{job_id}/retry")
+    assert resp.status_code == 409
+    assert resp.get_json()["status"] == status
+
+def test_retry_unknown_job(client):
+    assert client.post("/api/jobs/nope/retry").status_code == 404
+
+def test_retry_rejected_when_queue_is_full(app, client, full_queue):
+    job_id = app.make_job("p", None, None, status="error")
+    resp = client.post(f"/api/jobs/{job_id}/retry")
+    assert resp.status_code == 503
+    assert "Retry-After" in resp.headers
+    assert app.get_job(job_id)["status"] == "error"
@@ -0,0 +1,59 @@
+import gzip
+import time
+
+def test_status_revalidates_with_etag(app, client):
+    job_id = app.make_job("p", None, None)
+    first = client.get(f"/api/status/{job_id}")
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "no-cache"
+    etag = first.headers["ETag"]
+
+    again = client.get(f"/api/status/{job_id}", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+    assert again.headers["ETag"] == etag
+
+    # A deferred progress update still changes the version served from the cache
+    app.update_job(job_id, progress=40)
+    changed = client.get(f"/api/status/{job_id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.get_json()["progress"] == 40
+    assert changed.headers["ETag"] != etag
+
+def test_status_revalidates_with_if_modified_since(app, client):
+    job_id = app.make_job("p", None, None, updated_at=time.time() - 60)
+    first = client.get(f"/api/status/{job_id}")
+    resp = client.get(f"/api/status/{job_id}", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert resp.status_code == 304
+
+def test_status_unknown_job(client):
+    assert client.get("/api/status/nope").status_code == 404
+
+def test_history_revalidates_with_etag(app, client):
+    job_ids = [app.make_job(f"p{i}", None, None) for i in range(3)]
+    first = client.get("/api/videos")
+    assert first.status_code == 200
+    assert len(first.get_json()["items"]) == 3
+    etag = first.headers["ETag"]
+
+    assert client.get("/api/videos", headers={"If-None-Match": etag}).status_code == 304
+
+    app.update_job(job_ids[0], status="error", error="failed")
+    changed = client.get("/api/videos", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+def test_history_etag_covers_new_jobs(app, client):
+    app.make_job("p", None, None)
+    etag = client.get("/api/videos").headers["ETag"]
+    app.make_job("q", None, None)
+    assert client.get("/api/videos", headers={"If-None-Match": etag}).status_code == 200
+
+def test_history_is_compressed(app, client, monkeypatch):
+    monkeypatch.setattr(app, "brotli", None)
+    for i in range(20):
+        app.make_job(f"a fairly long prompt about a lighthouse in a storm, take {i}", None, None)
+    resp = client.get("/api/videos", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    assert len(gzip.decompress(resp.data)) > len(resp.data)
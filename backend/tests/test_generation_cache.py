@@ -0,0 +1,90 @@
+import pytest
+
+PROMPT = {"prompt": "A red fox crossing a snowy field at dawn"}
+ASSETS = {
+    "mp4_gcs_path": "videos/fox.mp4",
+    "mp4_url": "https://storage.googleapis.com/tests/videos/fox.mp4",
+    "hls_url": "https://storage.googleapis.com/tests/hls/fox/master.m3u8",
+}
+
+@pytest.fixture
+def cache_enabled(app, monkeypatch):
+    monkeypatch.setattr(app, "GEN_CACHE_ENABLED", True)
+
+def generate(client, body=PROMPT):
+    resp = client.post("/api/generate", json=body)
+    return resp.status_code, resp.get_json()
+
+def entry_for(app, job_id):
+    return app.gen_cache_col.find_one({"$or": [{"leader_job_id": job_id}, {"followers": job_id}]})
+
+def test_first_request_leads(app, client, cache_enabled):
+    status, body = generate(client)
+    assert status == 202
+    assert "cached" not in body
+    assert app.get_job(body["job_id"])["status"] == "queued"
+    entry = entry_for(app, body["job_id"])
+    assert entry["status"] == "pending"
+    assert entry["leader_job_id"] == body["job_id"]
+
+def test_identical_request_follows_the_leader(app, client, cache_enabled):
+    _, leader = generate(client)
+    # Whitespace and case do not make a different generation
+    status, body = generate(client, {"prompt": "  a red FOX crossing a snowy field   at dawn"})
+    assert status == 202
+    assert body["cached"] is True
+    assert app.get_job(body["job_id"])["status"] == "waiting"
+    assert entry_for(app, leader["job_id"])["followers"] == [body["job_id"]]
+    # Followers are not queued, so they never reach a worker
+    assert app.queue_depth() == 1
+
+def test_leader_success_finishes_followers_and_later_requests_hit(app, client, cache_enabled):
+    _, leader = generate(client)
+    _, follower = generate(client)
+    app.update_job(leader["job_id"], status="done", progress=100, **ASSETS)
+    app.settle_generation(leader["job_id"])
+
+    job = app.get_job(follower["job_id"])
+    assert job["status"] == "done"
+    assert job["mp4_url"] == ASSETS["mp4_url"]
+    assert job["cache_source_job_id"] == leader["job_id"]
+
+    status, body = generate(client)
+    assert status == 200
+    assert body["cached"] is True
+    job = app.get_job(body["job_id"])
+    assert job["status"] == "done"
+    assert job["hls_url"] == ASSETS["hls_url"]
+
+def test_fresh_bypasses_the_cache(app, client, cache_enabled):
+    _, leader = generate(client)
+    app.update_job(leader["job_id"], status="done", **ASSETS)
+    app.settle_generation(leader["job_id"])
+
+    status, body = generate(client, {**PROMPT, "fresh": True})
+    assert status == 202
+    assert app.get_job(body["job_id"])["status"] == "queued"
+
+def test_leader_failure_promotes_oldest_follower(app, client, cache_enabled):
+    _, leader = generate(client)
+    _, first = generate(client)
+    _, second = generate(client)
+    app.update_job(leader["job_id"], status="error", error="Veo failed")
+    app.settle_generation(leader["job_id"])
+
+    assert app.get_job(first["job_id"])["status"] == "queued"
+    assert app.get_job(second["job_id"])["status"] == "waiting"
+    entry = entry_for(app, first["job_id"])
+    assert entry["status"] == "pending"
+    assert entry["leader_job_id"] == first["job_id"]
+    assert entry["followers"] == [second["job_id"]]
+
+def test_leader_failure_without_followers_drops_the_entry(app, client, cache_enabled):
+    _, leader = generate(client)
+    app.update_job(leader["job_id"], status="error", error="Veo failed")
+    app.settle_generation(leader["job_id"])
+
+    assert app.gen_cache_col.count_documents({}) == 0
+    # The next identical request leads a new generation
+    _, body = generate(client)
+    assert entry_for(app, body["job_id"])["leader_job_id"] == body["job_id"]
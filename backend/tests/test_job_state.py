@@ -0,0 +1,61 @@
+import pytest
+
+@pytest.fixture
+def reads(app, monkeypatch):
+    """Job ids read from Mongo with find_one."""
+    seen = []
+    find_one = app.videos_col.find_one
+
+    def counting(query, *args, **kwargs):
+        seen.append(query.get("job_id"))
+        return find_one(query, *args, **kwargs)
+    monkeypatch.setattr(app.videos_col, "find_one", counting)
+    return seen
+
+def test_deferred_update_of_uncached_job_skips_mongo(app, reads):
+    job_id = app.make_job("p", None, None)
+    app.update_job(job_id, progress=10)
+    app.update_job(job_id, **{"timings.download": 1.5})
+    assert reads == []
+
+    job = app.get_job(job_id)
+    assert job["progress"] == 10
+    assert job["timings"] == {"download": 1.5}
+    assert job["version"] == 2
+
+def test_deferred_update_publishes_to_watchers(app, reads, monkeypatch):
+    job_id = app.make_job("p", None, None)
+    published = []
+    monkeypatch.setattr(app.JOB_EVENTS, "publish", lambda jid, version: published.append((jid, version)))
+    with app.JOB_EVENTS.watch(job_id):
+        app.update_job(job_id, progress=10)
+    assert reads == [job_id]
+    assert published == [(job_id, 1)]
+
+def test_flush_coalesces_updates_per_job(app, monkeypatch):
+    first = app.make_job("first", None, None)
+    second = app.make_job("second", None, None)
+    app.update_job(first, progress=10)
+    app.update_job(first, progress=20, **{"timings.download": 1.5})
+    app.update_job(second, progress=30)
+    writes = []
+    monkeypatch.setattr(app.videos_col, "bulk_write", lambda ops, ordered=True: writes.append(ops))
+
+    app.JOB_STATE.flush()
+    assert len(writes) == 1
+    ops = {op._filter["job_id"]: op._doc for op in writes[0]}
+    assert ops[first]["$inc"] == {"version": 2}
+    assert ops[first]["$set"]["progress"] == 20
+    assert ops[first]["$set"]["timings.download"] == 1.5
+    assert ops[second]["$inc"] == {"version": 1}
+
+def test_write_through_carries_pending_fields(app):
+    job_id = app.make_job("p", None, None)
+    app.update_job(job_id, progress=50)
+    app.update_job(job_id, status="running")
+
+    doc = app.videos_col.find_one({"job_id": job_id})
+    assert doc["status"] == "running"
+    assert doc["progress"] == 50
+    assert doc["version"] == 2
+    assert app.JOB_STATE._pending == {}
@@ -0,0 +1,95 @@
+import os
+import time
+
+import pytest
+
+OLD = time.time() - 3600
+
+@pytest.fixture
+def storage(app, tmp_path):
+    roots = [tmp_path / "videos", tmp_path / "hls"]
+    for root in roots:
+        root.mkdir()
+    return app.LocalStorage(roots, quota_bytes=0, orphan_sec=60)
+
+def add_unit(storage, job_id: str, age: float = OLD, size: int = 100):
+    """The MP4 and HLS tree job_paths() would give `job_id`, last used at `age`."""
+    uid = job_id[:8]
+    mp4 = storage.roots[0] / f"a_red_fox-{uid}.mp4"
+    mp4.write_bytes(b"m" * size)
+    tree = storage.roots[1] / uid
+    (tree / "720p").mkdir(parents=True)
+    (tree / "720p" / "seg_000.ts").write_bytes(b"s" * size)
+    for path in (mp4, tree):
+        os.utime(path, (age, age))
+    return mp4, tree
+
+def test_active_leased_job_survives(app, storage):
+    job_id = app.make_job("p", None, None, status="running", lease_owner="other-worker",
+                          lease_until=time.time() + 60)
+    units = add_unit(storage, job_id)
+    storage.sweep()
+    assert all(u.exists() for u in units)
+
+@pytest.mark.parametrize("status", ["queued", "waiting"])
+def test_waiting_job_survives(app, storage, status):
+    units = add_unit(storage, app.make_job("p", None, None, status=status))
+    storage.sweep()
+    assert all(u.exists() for u in units)
+
+def test_job_held_by_this_process_survives(app, storage):
+    job_id = "feedface" + "0" * 24
+    app.JOBS[job_id] = {"claimed_at": time.time()}
+    units = add_unit(storage, job_id)
+    storage.sweep()
+    assert all(u.exists() for u in units)
+
+def test_expired_lease_is_stale(app, storage):
+    job_id = app.make_job("p", None, None, status="running", lease_owner="dead-worker",
+                          lease_until=time.time() - 1)
+    units = add_unit(storage, job_id)
+    storage.sweep()
+    assert not any(u.exists() for u in units)
+    assert storage.stats["orphans_removed"] == 2
+
+def test_finished_and_unknown_jobs_are_stale(app, storage):
+    done = add_unit(storage, app.make_job("p", None, None, status="done"))
+    unknown = add_unit(storage, "0badc0de" + "0" * 24)
+    storage.sweep()
+    assert not any(u.exists() for u in done + unknown)
+
+def test_stale_units_wait_for_orphan_sec(app, storage):
+    units = add_unit(storage, app.make_job("p", None, None, status="error"), age=time.time())
+    storage.sweep()
+    assert all(u.exists() for u in units)
+
+def test_foreign_names_are_never_deleted(storage):
+    videos, hls = storage.roots
+    foreign = [videos / ".gitkeep", videos / "notes.txt", videos / "clip.mp4", videos / "clip-ABCDEF12.mp4",
+               hls / ".gitkeep", hls / "abcd1234.ts", hls / "shared"]
+    for path in foreign[:-1]:
+        path.write_bytes(b"x")
+    foreign[-1].mkdir()
+    for path in foreign:
+        os.utime(path, (OLD, OLD))
+    storage.sweep()
+    assert all(p.exists() for p in foreign)
+
+def test_served_units_are_evicted_lru_first(app, storage, monkeypatch):
+    monkeypatch.setattr(app, "GCS_PUBLIC", False)
+    storage.quota_bytes = 250
+    jobs = []
+    for i, age in enumerate((OLD, OLD + 60, OLD + 120)):
+        job_id = f"{i:08x}" + "0" * 24
+        app.videos_col.insert_one(app.new_job_doc("p", None, None, status="done", job_id=job_id,
+                                                  hls_url=f"/hls/{job_id[:8]}/master.m3u8"))
+        (storage.roots[1] / job_id[:8]).mkdir()
+        (storage.roots[1] / job_id[:8] / "seg_000.ts").write_bytes(b"s" * 100)
+        os.utime(storage.roots[1] / job_id[:8], (age, age))
+        jobs.append(job_id)
+
+    storage.sweep()
+    assert [(storage.roots[1] / j[:8]).exists() for j in jobs] == [False, True, True]
+    assert storage.stats["evictions"] == 1
+    assert app.videos_col.find_one({"job_id": jobs[0]})["hls_url"] is None
+    assert app.videos_col.find_one({"job_id": jobs[1]})["hls_url"] == f"/hls/{jobs[1][:8]}/master.m3u8"
@@ -0,0 +1,112 @@
+import shutil
+
+import pytest
+from werkzeug.exceptions import NotFound
+
+SEGMENT = bytes(range(256)) * 16
+PLAYLIST = b"#EXTM3U\n#EXT-X-TARGETDURATION:2\n#EXTINF:2.0,\nseg_000.ts\n#EXT-X-ENDLIST\n"
+
+@pytest.fixture
+def media(app):
+    """One packaged HLS tree and one MP4 under the app's media directories."""
+    app.MEDIA_CACHE._entries.clear()
+    app.MEDIA_CACHE._seen.clear()
+    app.MEDIA_CACHE._bytes = 0
+    tree = app.HLS_DIR / "abcd1234"
+    (tree / "720p").mkdir(parents=True)
+    (tree / "720p" / "seg_000.ts").write_bytes(SEGMENT)
+    (tree / "720p" / "index.m3u8").write_bytes(PLAYLIST)
+    mp4 = app.VIDEO_DIR / "clip-abcd1234.mp4"
+    mp4.write_bytes(SEGMENT)
+    # Outside both media roots
+    secret = app.HLS_DIR.parent / "secret.txt"
+    secret.write_text("secret")
+    yield tree
+    shutil.rmtree(tree)
+    mp4.unlink()
+    secret.unlink()
+
+def test_segment_is_immutable(client, media):
+    resp = client.get("/hls/abcd1234/720p/seg_000.ts")
+    assert resp.status_code == 200
+    assert resp.data == SEGMENT
+    assert resp.mimetype == "video/MP2T"
+    assert resp.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert resp.headers["ETag"]
+
+def test_playlist_is_revalidated(app, client, media):
+    resp = client.get("/hls/abcd1234/720p/index.m3u8")
+    assert resp.data == PLAYLIST
+    assert f"max-age={app.MEDIA_MANIFEST_MAX_AGE}" in resp.headers["Cache-Control"]
+    assert "immutable" not in resp.headers["Cache-Control"]
+
+@pytest.mark.parametrize("url", ["/hls/abcd1234/720p/seg_000.ts", "/videos/clip-abcd1234.mp4"])
+def test_range_requests(client, media, url):
+    # The segment is served from disk first, then from the media cache
+    for _ in range(3):
+        resp = client.get(url, headers={"Range": "bytes=100-199"})
+        assert resp.status_code == 206
+        assert resp.data == SEGMENT[100:200]
+        assert resp.headers["Content-Range"] == f"bytes 100-199/{len(SEGMENT)}"
+
+    tail = client.get(url, headers={"Range": "bytes=-10"})
+    assert tail.status_code == 206
+    assert tail.data == SEGMENT[-10:]
+
+def test_unsatisfiable_range(client, media):
+    resp = client.get("/hls/abcd1234/720p/seg_000.ts", headers={"Range": f"bytes={len(SEGMENT) + 10}-"})
+    assert resp.status_code == 416
+
+@pytest.mark.parametrize("url", ["/hls/abcd1234/720p/seg_000.ts", "/hls/abcd1234/720p/index.m3u8"])
+def test_if_none_match(client, media, url):
+    etag = client.get(url).headers["ETag"]
+    for _ in range(2):
+        resp = client.get(url, headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.data == b""
+
+def test_changed_file_is_not_served_from_cache(client, media):
+    url = "/hls/abcd1234/720p/index.m3u8"
+    first = client.get(url)
+    (media / "720p" / "index.m3u8").write_bytes(PLAYLIST + b"#EXT-X-DISCONTINUITY\n")
+    second = client.get(url)
+    assert second.data.endswith(b"#EXT-X-DISCONTINUITY\n")
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+def test_accel_redirect_hands_the_file_to_nginx(app, client, media, monkeypatch):
+    monkeypatch.setattr(app, "MEDIA_ACCEL_REDIRECT", "/_media")
+    resp = client.get("/hls/abcd1234/720p/seg_000.ts")
+    assert resp.status_code == 200
+    assert resp.headers["X-Accel-Redirect"] == "/_media/hls/abcd1234/720p/seg_000.ts"
+    assert resp.data == b""
+    assert resp.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+
+    playlist = client.get("/hls/abcd1234/720p/index.m3u8")
+    assert playlist.headers["Cache-Control"] == f"public, max-age={app.MEDIA_MANIFEST_MAX_AGE}"
+
+def test_accel_redirect_checks_the_path_first(app, client, media, monkeypatch):
+    monkeypatch.setattr(app, "MEDIA_ACCEL_REDIRECT", "/_media")
+    resp = client.get("/hls/abcd1234/missing.ts")
+    assert resp.status_code == 404
+    assert "X-Accel-Redirect" not in resp.headers
+
+@pytest.mark.parametrize("url", [
+    "/hls/../secret.txt",
+    "/hls/%2e%2e/secret.txt",
+    "/hls/abcd1234/../../secret.txt",
+    "/hls/..%2fsecret.txt",
+    "/hls/abcd1234/%2e%2e%2f%2e%2e%2fsecret.txt",
+    "/videos/..%2fsecret.txt",
+    "/hls/abcd1234",
+])
+def test_paths_outside_the_roots_are_rejected(client, media, url):
+    resp = client.get(url)
+    assert resp.status_code == 404
+    assert b"secret" not in resp.data
+
+def test_serve_media_rejects_traversal(app, media):
+    # Below the routing layer too: filenames reach serve_media unnormalised
+    with app.app.test_request_context():
+        for filename in ("../secret.txt", "abcd1234/../../secret.txt", "/etc/passwd"):
+            with pytest.raises(NotFound):
+                app.serve_media(app.HLS_DIR, "hls", filename)
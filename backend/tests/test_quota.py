@@ -0,0 +1,139 @@
+import threading
+import time
+import types
+
+import pytest
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(app, "time", types.SimpleNamespace(time=clock.time, sleep=clock.sleep))
+    return clock
+
+def test_burst_of_one_minute(app, clock):
+    bucket = app.TokenBucket("veo", 6)
+    assert [bucket.try_acquire() for _ in range(6)] == [0.0] * 6
+    assert bucket.try_acquire() == pytest.approx(10.0)
+
+def test_refill(app, clock):
+    bucket = app.TokenBucket("veo", 6)
+    for _ in range(6):
+        bucket.try_acquire()
+    clock.now += 4
+    assert bucket.try_acquire() == pytest.approx(6.0)
+    clock.now += 6
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(10.0)
+
+def test_refill_is_capped_at_the_burst(app, clock):
+    bucket = app.TokenBucket("veo", 6)
+    bucket.try_acquire()
+    clock.now += 3600
+    assert [bucket.try_acquire() for _ in range(7)][-2:] == [0.0, pytest.approx(10.0)]
+
+def test_acquire_waits_within_timeout(app, clock):
+    bucket = app.TokenBucket("openai", 60)
+    bucket.drain()
+    start = clock.now
+    bucket.acquire(timeout=5)
+    assert clock.now - start == pytest.approx(1.0)
+
+def test_acquire_raises_past_timeout(app, clock):
+    bucket = app.TokenBucket("openai", 6)
+    bucket.drain()
+    with pytest.raises(app.QuotaExhausted) as exc:
+        bucket.acquire(timeout=5)
+    assert exc.value.retry_after == pytest.approx(10.0)
+
+def test_refund_and_drain(app, clock):
+    bucket = app.TokenBucket("veo", 2)
+    bucket.try_acquire()
+    bucket.try_acquire()
+    bucket.refund()
+    assert bucket.try_acquire() == 0.0
+    bucket.refund()
+    bucket.refund()
+    bucket.refund()
+    # Refunds never exceed the burst
+    assert [bucket.try_acquire() for _ in range(3)][-1] > 0
+    bucket.drain()
+    assert bucket.try_acquire() > 0
+
+def test_unlimited(app, clock):
+    bucket = app.TokenBucket("veo", 0)
+    assert all(bucket.try_acquire() == 0.0 for _ in range(100))
+
+def test_shared_bucket_across_processes(app, clock):
+    # Two processes' buckets over the same collection draw from one budget
+    first = app.TokenBucket("veo", 4, app.quotas_col)
+    second = app.TokenBucket("veo", 4, app.quotas_col)
+    assert [first.try_acquire(), second.try_acquire(), first.try_acquire(), second.try_acquire()] == [0.0] * 4
+    assert first.try_acquire() > 0
+    assert second.try_acquire() > 0
+    clock.now += 15
+    assert second.try_acquire() == 0.0
+    assert first.try_acquire() > 0
+
+def test_shared_bucket_under_concurrency(app):
+    buckets = [app.TokenBucket("veo", 20, app.quotas_col) for _ in range(4)]
+    granted = []
+
+    def take(bucket):
+        for _ in range(10):
+            if bucket.try_acquire() == 0.0:
+                granted.append(1)
+    threads = [threading.Thread(target=take, args=(b,)) for b in buckets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Refill during the test may add a token at most
+    assert 20 <= len(granted) <= 21
+
+def test_defer_for_quota_requeues_at_the_front(app, monkeypatch):
+    monkeypatch.setitem(app._veo_quota_wait, "until", 0.0)
+    queue = app.InProcessJobQueue()
+    monkeypatch.setattr(app, "JOB_QUEUE", queue)
+    first = app.make_job("first", None, None)
+    second = app.make_job("second", None, None)
+    queue.notify(first)
+    queue.notify(second)
+
+    assert queue.claim()["job_id"] == first
+    app.defer_for_quota(first, 30)
+    job = app.videos_col.find_one({"job_id": first})
+    assert job["status"] == "queued"
+    assert job["attempts"] == 0
+    assert job["lease_owner"] is None
+    assert app._veo_quota_wait["until"] >= time.time() + 29
+    # Deferred jobs keep their place ahead of later ones
+    assert queue.claim()["job_id"] == first
+
+def test_defer_for_quota_leaves_other_workers_jobs(app, monkeypatch):
+    monkeypatch.setitem(app._veo_quota_wait, "until", 0.0)
+    job_id = app.make_job("p", None, None, status="running", lease_owner="other-worker",
+                          lease_until=time.time() + 60, attempts=1)
+    app.defer_for_quota(job_id, 30)
+    job = app.videos_col.find_one({"job_id": job_id})
+    assert job["status"] == "running"
+    assert job["attempts"] == 1
+
+def test_improve_answers_429_when_openai_quota_is_spent(app, client, monkeypatch):
+    bucket = app.TokenBucket("openai", 6)
+    bucket.drain()
+    monkeypatch.setattr(app, "OPENAI_QUOTA", bucket)
+    monkeypatch.setattr(app, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(app, "OPENAI_QUOTA_WAIT_SEC", 0)
+    resp = client.post("/api/improve", json={"prompt": f"quota test {time.time()}"})
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) == resp.get_json()["retry_after"] > 0
@@ -0,0 +1,160 @@
+import types
+
+import pytest
+
+class FakePipeline:
+    """Stand-ins for the Veo download, GCS uploads and ffmpeg under finish_sample."""
+
+    def __init__(self, app):
+        self.app = app
+        self.downloads = []
+        self.uploads = []
+        self.packaged = []
+        self.failing = set()
+
+    def download(self, video, sink):
+        self.downloads.append(video)
+        sink.write(f"mp4 of {video}".encode())
+
+    def upload(self, local_path, object_name, content_type):
+        self.uploads.append(object_name)
+        if object_name in self.failing:
+            raise RuntimeError(f"upload of {object_name} failed")
+        return self.app.gcs_public_url(self.app.GCS_BUCKET, object_name)
+
+    def package(self, local_mp4, hls_dir):
+        self.packaged.append(local_mp4.name)
+        hls_path = hls_dir / local_mp4.stem
+        (hls_path / "thumbs").mkdir(parents=True)
+        (hls_path / "master.m3u8").write_text("#EXTM3U\n")
+        (hls_path / "thumbs" / "thumbs.vtt").write_text("WEBVTT\n")
+        return hls_path, hls_path / "thumbs" / "thumbs.vtt"
+
+@pytest.fixture
+def pipeline(app, monkeypatch):
+    fake = FakePipeline(app)
+    monkeypatch.setattr(app, "VEO_TRANSFER_MODE", "file")
+    monkeypatch.setattr(app, "download_generated_video", fake.download)
+    monkeypatch.setattr(app, "upload_file_to_gcs", fake.upload)
+    monkeypatch.setattr(app, "package_media", fake.package)
+    monkeypatch.setattr(app, "upload_directory_to_gcs", lambda *a, **k: [])
+    return fake
+
+def operation(count: int):
+    videos = [types.SimpleNamespace(video=f"video {i}") for i in range(count)]
+    return types.SimpleNamespace(name="operations/1", error=None,
+                                 result=types.SimpleNamespace(generated_videos=videos))
+
+def multi_job(app, samples: int = 3) -> str:
+    return app.make_job("a red fox", None, None, status="running", **app.sample_job_fields(samples))
+
+def test_sample_updater_writes_assets(app):
+    job_id = multi_job(app)
+    app.sample_updater(job_id, 0, True)(mp4_url="u0", progress=50)
+    app.sample_updater(job_id, 2, True)(mp4_url="u2", progress=90)
+
+    job = app.get_job(job_id)
+    assert job["mp4_url"] == "u0"
+    assert job["progress"] == 50
+    assert [a.get("mp4_url") for a in job["assets"]] == ["u0", None, "u2"]
+    # Progress is the job's; samples other than 0 never report it
+    assert all("progress" not in a for a in job["assets"])
+
+def test_sample_updater_single_sample_job(app):
+    job_id = app.make_job("p", None, None)
+    app.sample_updater(job_id, 0, False)(mp4_url="u0", **app.checkpoint_fields("uploaded"))
+    job = app.get_job(job_id)
+    assert job["mp4_url"] == "u0"
+    assert job["checkpoints"]["uploaded"]
+    assert job.get("assets") is None
+
+def test_samples_are_requested_from_one_operation(app, client, monkeypatch):
+    resp = client.post("/api/generate", json={"prompt": "a red fox", "samples": 3})
+    job_id = resp.get_json()["job_id"]
+    assert [a["index"] for a in app.get_job(job_id)["assets"]] == [0, 1, 2]
+
+    configs = []
+
+    def generate_videos(model, prompt, config):
+        configs.append(config)
+        return types.SimpleNamespace(name="operations/1")
+    monkeypatch.setattr(app, "genai_client", types.SimpleNamespace(
+        models=types.SimpleNamespace(generate_videos=generate_videos)))
+    monkeypatch.setattr(app.OPERATION_POLLER, "watch", lambda *a: None)
+    try:
+        assert app.generate_video_job(job_id) is True
+    finally:
+        app.release_stage("veo")
+    assert [c.number_of_videos for c in configs] == [3]
+    assert app.get_job(job_id)["checkpoints"]["operation"] == "operations/1"
+
+@pytest.mark.parametrize("samples", [-1, 5])
+def test_sample_count_is_bounded(client, samples):
+    resp = client.post("/api/generate", json={"prompt": "a red fox", "samples": samples})
+    assert resp.status_code == 400
+
+def test_every_sample_is_stored_and_packaged(app, pipeline):
+    job_id = multi_job(app)
+    app.finish_video_job(job_id, operation(3))
+
+    job = app.get_job(job_id)
+    assert job["status"] == "done"
+    assert sorted(pipeline.downloads) == ["video 0", "video 1", "video 2"]
+    assert len(set(pipeline.uploads)) == 3
+    assert [bool(a.get("mp4_url") and a.get("hls_url")) for a in job["assets"]] == [True] * 3
+    assert job["mp4_url"] == job["assets"][0]["mp4_url"]
+    assert len({a["hls_url"] for a in job["assets"]}) == 3
+    # Stored in GCS, so nothing stays on local disk
+    assert not any(app.job_paths(job, i)[1].exists() for i in range(3))
+
+def test_fewer_videos_than_samples(app, pipeline):
+    job_id = multi_job(app)
+    app.finish_video_job(job_id, operation(2))
+    job = app.get_job(job_id)
+    assert job["status"] == "done"
+    assert job["samples"] == 2
+    assert len(job["assets"]) == 2
+
+def test_failed_first_sample_fails_the_job(app, pipeline):
+    job_id = multi_job(app, 2)
+    pipeline.failing.add(app.job_paths(app.get_job(job_id), 0)[2])
+    app.finish_video_job(job_id, operation(2))
+    job = app.get_job(job_id)
+    assert job["status"] == "error"
+    assert "upload" in job["error"]
+
+def test_retry_reruns_only_the_failed_sample(app, pipeline, monkeypatch):
+    job_id = multi_job(app)
+    job = app.get_job(job_id)
+    failed_object = app.job_paths(job, 1)[2]
+    pipeline.failing.add(failed_object)
+    app.finish_video_job(job_id, operation(3))
+
+    job = app.get_job(job_id)
+    assert job["status"] == "done"
+    assert "failed" in job["assets"][1]["error"]
+    assert [a.get("error") for a in (job["assets"][0], job["assets"][2])] == [None, None]
+    # The failed sample keeps its MP4 for the retry
+    assert app.job_paths(job, 1)[1].exists()
+
+    assert app.requeue_failed_job(job_id)["status"] == "queued"
+    app.MongoJobQueue().claim()
+    tasks = []
+    monkeypatch.setattr(app, "enqueue_task", lambda fn, *args: tasks.append((fn, args)))
+    # Every sample's MP4 is saved, so Veo is not asked again
+    assert app.generate_video_job(job_id) is True
+    assert tasks == [(app.finish_video_job, (job_id, None))]
+
+    pipeline.failing.clear()
+    pipeline.downloads.clear()
+    pipeline.uploads.clear()
+    pipeline.packaged.clear()
+    app.finish_video_job(job_id, None)
+
+    assert pipeline.downloads == []
+    assert pipeline.uploads == [failed_object]
+    assert pipeline.packaged == [app.job_paths(job, 1)[1].name]
+    job = app.get_job(job_id)
+    assert job["status"] == "done"
+    assert [a.get("error") for a in job["assets"]] == [None, None, None]
+    assert all(a.get("mp4_url") for a in job["assets"])
@@ -0,0 +1,54 @@
+import time
+
+def test_claim_leases_oldest_queued_job(app):
+    newer = app.make_job("newer", None, None, created_at=time.time())
+    older = app.make_job("older", None, None, created_at=time.time() - 10)
+    queue = app.MongoJobQueue()
+    assert queue.depth() == 2
+
+    job = queue.claim()
+    assert job["job_id"] == older
+    assert job["status"] == "running"
+    assert job["lease_owner"] == app.WORKER_ID
+    assert job["lease_until"] > time.time()
+    assert job["attempts"] == 1
+
+    assert queue.claim()["job_id"] == newer
+    assert queue.claim() is None
+    assert queue.depth() == 0
+
+def test_claim_skips_jobs_that_are_not_queued(app):
+    for status in ("waiting", "batched", "done", "error"):
+        app.make_job(status, None, None, status=status)
+    assert app.MongoJobQueue().claim() is None
+
+def test_expired_lease_is_reclaimed(app):
+    dead = app.make_job("dead", None, None, status="running", lease_owner="dead-worker",
+                        lease_until=time.time() - 1, attempts=1)
+    app.make_job("alive", None, None, status="running", lease_owner="other-worker",
+                 lease_until=time.time() + 60, attempts=1)
+    queue = app.MongoJobQueue()
+
+    job = queue.claim()
+    assert job["job_id"] == dead
+    assert job["lease_owner"] == app.WORKER_ID
+    assert job["attempts"] == 2
+    # A live lease is left to its owner
+    assert queue.claim() is None
+
+def test_running_job_without_lease_is_reclaimed(app):
+    legacy = app.make_job("legacy", None, None, status="running")
+    assert app.MongoJobQueue().claim()["job_id"] == legacy
+
+def test_renew_leases_extends_only_held_jobs(app):
+    held = app.make_job("held", None, None, status="running", lease_owner=app.WORKER_ID,
+                        lease_until=time.time() + 1)
+    other = app.make_job("other", None, None, status="running", lease_owner="other-worker",
+                         lease_until=time.time() + 1)
+    app.JOBS[held] = {"claimed_at": time.time()}
+    app.JOBS[other] = {"claimed_at": time.time()}
+
+    app.renew_leases()
+    leases = {d["job_id"]: d["lease_until"] for d in app.videos_col.find({}, {"job_id": 1, "lease_until": 1})}
+    assert leases[held] > time.time() + app.JOB_LEASE_SEC - 5
+    assert leases[other] < time.time() + 5
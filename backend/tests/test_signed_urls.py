@@ -0,0 +1,103 @@
+import types
+
+import pytest
+
+class Signer:
+    def __init__(self):
+        self.calls = []
+        self.failing = set()
+
+    def __call__(self, bucket_name, object_name, ttl_min, method="GET"):
+        self.calls.append(object_name)
+        if object_name in self.failing:
+            raise RuntimeError("signing failed")
+        return f"https://signed/{object_name}?n={len(self.calls)}"
+
+@pytest.fixture
+def signer(app, monkeypatch):
+    signer = Signer()
+    monkeypatch.setattr(app, "gcs_signed_url", signer)
+    return signer
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    clock = types.SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(app, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+def test_urls_are_reused_until_three_quarters_of_the_ttl(app, signer, clock):
+    cache = app.SignedUrlCache(ttl_min=60, max_entries=10)
+    first = cache.get_many(["a.mp4"])["a.mp4"]
+    clock.now += 44 * 60
+    assert cache.get_many(["a.mp4"])["a.mp4"] == first
+    assert signer.calls == ["a.mp4"]
+
+    clock.now += 2 * 60
+    assert cache.get_many(["a.mp4"])["a.mp4"] != first
+    assert signer.calls == ["a.mp4", "a.mp4"]
+
+def test_least_recently_used_is_evicted(app, signer, clock):
+    cache = app.SignedUrlCache(ttl_min=60, max_entries=2)
+    cache.get_many(["a", "b"])
+    cache.get_many(["a"])
+    cache.get_many(["c"])
+    signer.calls.clear()
+
+    cache.get_many(["a", "c"])
+    assert signer.calls == []
+    cache.get_many(["b"])
+    assert signer.calls == ["b"]
+
+def test_page_is_signed_once_per_name(app, signer, clock):
+    cache = app.SignedUrlCache(ttl_min=60, max_entries=10)
+    cache.get_many(["a"])
+    urls = cache.get_many(["a", "b", "b", "c"])
+    assert set(urls) == {"a", "b", "c"}
+    assert signer.calls == ["a", "b", "c"]
+
+def test_failed_name_gets_none_and_the_page_is_still_served(app, signer, clock):
+    cache = app.SignedUrlCache(ttl_min=60, max_entries=10)
+    signer.failing.add("bad")
+    urls = cache.get_many(["a", "bad", "c"])
+    assert urls["bad"] is None
+    assert urls["a"].startswith("https://signed/a")
+    assert urls["c"].startswith("https://signed/c")
+
+    # Failures are not cached: the next request tries again
+    signer.failing.clear()
+    assert cache.get_many(["bad"])["bad"].startswith("https://signed/bad")
+
+def test_with_signed_urls_signs_jobs_and_assets(app, signer, monkeypatch):
+    monkeypatch.setattr(app, "GCS_PUBLIC", False)
+    monkeypatch.setattr(app, "SIGNED_URLS", app.SignedUrlCache(60, 10))
+    docs = [
+        {"job_id": "j1", "mp4_gcs_path": "videos/a.mp4", "mp4_url": None,
+         "assets": [{"index": 0, "mp4_gcs_path": "videos/a.mp4"}, {"index": 1, "mp4_gcs_path": "videos/b.mp4"},
+                    {"index": 2, "error": "failed"}]},
+        {"job_id": "j2", "mp4_gcs_path": None, "mp4_url": None},
+    ]
+    signed = app.with_signed_urls(docs)
+
+    assert signed[0]["mp4_url"].startswith("https://signed/videos/a.mp4")
+    assert [a.get("mp4_url", "").split("?")[0] for a in signed[0]["assets"]] == [
+        "https://signed/videos/a.mp4", "https://signed/videos/b.mp4", ""]
+    assert signed[1]["mp4_url"] is None
+    assert sorted(signer.calls) == ["videos/a.mp4", "videos/b.mp4"]
+    # The cached job docs are left as they were
+    assert docs[0]["mp4_url"] is None
+    assert "mp4_url" not in docs[0]["assets"][0]
+
+def test_public_bucket_is_not_signed(app, signer):
+    docs = [{"job_id": "j1", "mp4_gcs_path": "videos/a.mp4", "mp4_url": "https://public/a.mp4"}]
+    assert app.with_signed_urls(docs) == docs
+    assert signer.calls == []
+
+def test_private_urls_are_not_stored(app, monkeypatch):
+    assert app.stored_object_url("videos/a.mp4") == "https://storage.googleapis.com/tests/videos/a.mp4"
+    monkeypatch.setattr(app, "GCS_PUBLIC", False)
+    assert app.stored_object_url("videos/a.mp4") is None
+
+def test_status_response_carries_a_signed_url(app, client, signer, monkeypatch):
+    monkeypatch.setattr(app, "GCS_PUBLIC", False)
+    job_id = app.make_job("p", None, None, status="done", mp4_gcs_path="videos/a.mp4")
+    assert client.get(f"/api/status/{job_id}").get_json()["mp4_url"].startswith("https://signed/videos/a.mp4")
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+def test_stage_capacity_follows_held_slots(app):
+    limit = max(1, app.STAGE_LIMITS["ffmpeg"])
+    assert app.stage_has_capacity("ffmpeg")
+    for _ in range(limit):
+        app.acquire_stage("ffmpeg")
+    try:
+        assert not app.stage_has_capacity("ffmpeg")
+    finally:
+        for _ in range(limit):
+            app.release_stage("ffmpeg")
+    assert app.stage_has_capacity("ffmpeg")
+
+def test_stage_slot_is_released_on_error(app):
+    limit = max(1, app.STAGE_LIMITS["upload"])
+    for _ in range(limit + 1):
+        with pytest.raises(RuntimeError):
+            with app.stage_slot("upload"):
+                raise RuntimeError("upload failed")
+    assert app.stage_has_capacity("upload")
+
+def test_independent_stages_overlap(app):
+    job_id = app.make_job("p", None, None)
+    both_running = threading.Barrier(2, timeout=5)
+
+    def stage(name):
+        def fn(results):
+            both_running.wait()
+            return name
+        return fn
+    results = app.run_stage_graph(job_id, {
+        "download": ((), lambda r: "mp4"),
+        "mp4_upload": (("download",), stage("mp4_upload")),
+        "package": (("download",), stage("package")),
+        "hls_upload": (("package",), lambda r: f"after {r['package']}"),
+    })
+    assert results == {"download": "mp4", "mp4_upload": "mp4_upload", "package": "package",
+                       "hls_upload": "after package"}
+
+def test_failure_skips_dependents_only(app):
+    job_id = app.make_job("p", None, None)
+    error = RuntimeError("ffmpeg failed")
+
+    def package(results):
+        raise error
+    results = app.run_stage_graph(job_id, {
+        "download": ((), lambda r: None),
+        "mp4_upload": (("download",), lambda r: "uploaded"),
+        "package": (("download",), package),
+        "hls_upload": (("package",), lambda r: pytest.fail("ran after a failed dependency")),
+    })
+    assert results["mp4_upload"] == "uploaded"
+    assert results["package"] is error
+    assert results["hls_upload"] is error
+
+def test_done_stages_are_not_run(app):
+    job_id = app.make_job("p", None, None)
+    results = app.run_stage_graph(job_id, {
+        "download": ((), lambda r: pytest.fail("download ran again")),
+        "mp4_upload": (("download",), lambda r: "uploaded"),
+    }, done={"download": None})
+    assert results == {"download": None, "mp4_upload": "uploaded"}
+
+def test_stage_timings_are_recorded(app):
+    job_id = app.make_job("p", None, None)
+    app.run_stage_graph(job_id, {"download": ((), lambda r: time.sleep(0.01))}, sample=2)
+    assert app.get_job(job_id)["timings"]["download[2]"] >= 0.01
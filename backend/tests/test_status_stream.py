@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+@pytest.fixture
+def one_waiter(app, monkeypatch):
+    """A single status waiter slot, held by the test itself."""
+    monkeypatch.setattr(app, "_status_waiter_slots", threading.BoundedSemaphore(1))
+    with app.status_waiter_slot() as held:
+        assert held
+        yield
+
+def when_watched(app, job_id, *updates):
+    """Apply `updates` (update_job kwargs) once a waiter watches the job, from another thread."""
+    def run():
+        deadline = time.time() + 5
+        while not app.JOB_EVENTS.watching(job_id) and time.time() < deadline:
+            time.sleep(0.01)
+        for fields in updates:
+            app.update_job(job_id, **fields)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def sse_events(body: str):
+    """(event, id) pairs of an SSE body."""
+    events = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            events.append((fields["event"], fields.get("id")))
+    return events
+
+def test_long_poll_wakes_on_version_bump(app, client):
+    job_id = app.make_job("p", None, None)
+    updater = when_watched(app, job_id, {"status": "running"})
+    start = time.time()
+    resp = client.get(f"/api/status/{job_id}?since=0&wait=10")
+    updater.join()
+    assert resp.status_code == 200
+    assert resp.get_json()["status"] == "running"
+    assert resp.get_json()["version"] == 1
+    assert time.time() - start < 5
+    assert "Retry-After" not in resp.headers
+
+def test_long_poll_returns_newer_version_at_once(app, client):
+    job_id = app.make_job("p", None, None)
+    app.update_job(job_id, status="running")
+    resp = client.get(f"/api/status/{job_id}?since=0&wait=10")
+    assert resp.get_json()["version"] == 1
+
+def test_long_poll_times_out_unchanged(app, client):
+    job_id = app.make_job("p", None, None)
+    resp = client.get(f"/api/status/{job_id}?since=0&wait=0.2")
+    assert resp.status_code == 200
+    assert resp.get_json()["version"] == 0
+
+def test_long_poll_past_the_cap_answers_at_once(app, client, one_waiter):
+    job_id = app.make_job("p", None, None)
+    start = time.time()
+    resp = client.get(f"/api/status/{job_id}?since=0&wait=3")
+    assert time.time() - start < 2
+    assert resp.status_code == 200
+    assert resp.headers["Retry-After"] == str(app.STATUS_BUSY_RETRY_SEC)
+
+def test_waiter_slots_are_released(app, monkeypatch):
+    monkeypatch.setattr(app, "_status_waiter_slots", threading.BoundedSemaphore(1))
+    for _ in range(3):
+        with app.status_waiter_slot() as held:
+            assert held
+            with app.status_waiter_slot() as second:
+                assert not second
+
+def test_stream_follows_job_until_done(app, client, monkeypatch):
+    monkeypatch.setattr(app, "SSE_MAX_SEC", 10)
+    job_id = app.make_job("p", None, None)
+    updater = when_watched(app, job_id, {"status": "running"}, {"status": "done", "progress": 100})
+    body = client.get(f"/api/status/{job_id}/stream").get_data(as_text=True)
+    updater.join()
+
+    assert body.startswith("retry: 2000\n\n")
+    events = sse_events(body)
+    assert events[0] == ("status", "0")
+    assert events[-2:] == [("status", "2"), ("end", None)]
+
+def test_stream_resumes_after_last_event_id(app, client):
+    job_id = app.make_job("p", None, None)
+    app.update_job(job_id, status="done")
+    body = client.get(f"/api/status/{job_id}/stream", headers={"Last-Event-ID": "1"}).get_data(as_text=True)
+    # Nothing newer than the client's version: just the end of the stream
+    assert sse_events(body) == [("end", None)]
+
+def test_stream_past_the_cap_sends_status_and_closes(app, client, one_waiter, monkeypatch):
+    monkeypatch.setattr(app, "SSE_MAX_SEC", 3)
+    job_id = app.make_job("p", None, None)
+    start = time.time()
+    body = client.get(f"/api/status/{job_id}/stream").get_data(as_text=True)
+    assert time.time() - start < 2
+    assert body.startswith(f"retry: {app.STATUS_BUSY_RETRY_SEC * 1000}\n\n")
+    assert sse_events(body) == [("status", "0")]
+
+def test_stream_unknown_job(client):
+    assert client.get("/api/status/nope/stream").status_code == 404
@@ -3,7 +3,7 @@ import Header from './components/Header'
 import Auth from './components/Auth'
 import useToast from './hooks/useToast'
 import { login } from './services/api'
-import { improvePrompt, startGeneration, jobStatus } from './services/api';
+import { improvePrompt, startGeneration, watchJob } from './services/api';
 import { Routes, Route, Navigate } from 'react-router-dom'
 import History from './components/History'
 import { Container, Center, Stack, TextInput, Button, Group, Paper, Text, Loader, Title, Progress, UnstyledButton, Divider, Box, Transition } from '@mantine/core'
@@ -26,7 +26,7 @@ export default function App(){
       setProgress(0)
       setEnhancedPrompt('')
       setConcisePrompts([])
-      const response = await improvePrompt(prompt)
+      const response = await improvePrompt(prompt, setEnhancedPrompt)
       setEnhancedPrompt(response.auto_improved)
       setConcisePrompts(response.variants || [])
     } catch (err) {
@@ -36,7 +36,12 @@ export default function App(){
     }
   }
 
-  const pollIntervalRef = React.useRef(null);
+  const unwatchRef = React.useRef(null);
+
+  function stopWatching() {
+    if (unwatchRef.current) unwatchRef.current();
+    unwatchRef.current = null;
+  }
 
   async function handleGenerateVideo(inputPrompt) {
     setLoading(true);
@@ -50,47 +55,35 @@ export default function App(){
       });
       const jobId = response.job_id;
       if (!jobId) throw new Error('No job_id returned from backend');
-      if (pollIntervalRef.current) clearInterval(pollIntervalRef.current);
-      const pollStatus = async () => {
-        try {
-          const data = await jobStatus(jobId);
-          console.log('[pollStatus]', data);
-          if (data && typeof data.progress === 'number') {
-            setProgress(Math.round(data.progress));
-          }
-          if (data && data.status === 'done' && data.mp4_url) {
-            setMp4Url(data.mp4_url || null);
-            setLoading(false);
-            clearInterval(pollIntervalRef.current);
-            pollIntervalRef.current = null;
-          }
-          if (data && data.status === 'error') {
-            showToast(data.error || 'Video generation failed.');
-            setLoading(false);
-            clearInterval(pollIntervalRef.current);
-            pollIntervalRef.current = null;
-          }
-        } catch (e) {
-          console.error('Polling fetch failed:', e);
-          showToast('Network error while polling video status.');
+      stopWatching();
+      unwatchRef.current = watchJob(jobId, (data) => {
+        console.log('[jobStatus]', data);
+        if (data && typeof data.progress === 'number') {
+          setProgress(Math.round(data.progress));
+        }
+        if (data && data.status === 'done' && data.mp4_url) {
+          setMp4Url(data.mp4_url || null);
           setLoading(false);
-          clearInterval(pollIntervalRef.current);
-          pollIntervalRef.current = null;
-        };
-      };
-      pollIntervalRef.current = setInterval(pollStatus, 1500);
-      pollStatus();
+          stopWatching();
+        }
+        if (data && data.status === 'error') {
+          showToast(data.error || 'Video generation failed.');
+          setLoading(false);
+          stopWatching();
+        }
+      }, (e) => {
+        console.error('Status stream failed:', e);
+        showToast('Network error while polling video status.');
+        setLoading(false);
+        stopWatching();
+      });
     } catch (err) {
       showToast('Failed to generate video!');
       setLoading(false);
     }
   }
 
-  React.useEffect(() => {
-    return () => {
-      if (pollIntervalRef.current) clearInterval(pollIntervalRef.current);
-    };
-  }, []);
+  React.useEffect(() => stopWatching, []);
 
   async function handleInlineDownload() {
     if (!mp4Url) return;
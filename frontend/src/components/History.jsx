@@ -2,6 +2,37 @@ import React, { useEffect, useState, useRef } from 'react'
 import { listVideos } from '../services/api'
 import { Container, Group, Button, Text, Paper, Stack, Badge, ScrollArea, Title, Modal } from '@mantine/core'
 
+// Split a VTT cue target into image URL and optional sprite region (#xywh=x,y,w,h)
+function parseCueTarget(name, base) {
+  const [file, frag] = name.split('#')
+  const src = /^https?:\/\//i.test(file) ? file : `${base}/${file}`
+  const m = frag && frag.match(/^xywh=(\d+),(\d+),(\d+),(\d+)$/)
+  return m ? { src, xywh: m.slice(1).map(Number) } : { src, xywh: null }
+}
+
+// Render a thumbnail cue: a plain image, or one tile cropped out of a sprite sheet
+function CueImage({ cue, width, height }) {
+  if (!cue.xywh) {
+    return <img src={cue.src} alt="preview" style={{ width, height: height || 'auto', objectFit: 'cover', display: 'block', borderRadius: 4 }} />
+  }
+  const [x, y, w, h] = cue.xywh
+  const scale = height ? Math.max(width / w, height / h) : width / w
+  return (
+    <div style={{ width, height: height || h * scale, overflow: 'hidden', borderRadius: 4 }}>
+      <div
+        style={{
+          width: w,
+          height: h,
+          backgroundImage: `url(${cue.src})`,
+          backgroundPosition: `-${x}px -${y}px`,
+          transform: `scale(${scale})`,
+          transformOrigin: 'top left',
+        }}
+      />
+    </div>
+  )
+}
+
 export default function History() {
   const API_BASE = import.meta.env.VITE_API_BASE || ''
   const resolveUrl = (u) => {
@@ -10,15 +41,18 @@ export default function History() {
     return API_BASE + u
   }
   const [items, setItems] = useState([])
-  const [page, setPage] = useState(1)
+  const [cursor, setCursor] = useState(null)
+  const [hasMore, setHasMore] = useState(true)
   const [perPage] = useState(20)
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState(null)
   const [downloadingId, setDownloadingId] = useState(null)
   const [viewItem, setViewItem] = useState(null)
   const videoRef = useRef(null)
-  const [thumbCues, setThumbCues] = useState([]) // [{start,end,src}]
-  const [preview, setPreview] = useState({ visible: false, x: 0, y: 0, src: null })
+  const sentinelRef = useRef(null)
+  const loadingRef = useRef(false)
+  const [thumbCues, setThumbCues] = useState([]) // [{start,end,src,xywh}]
+  const [preview, setPreview] = useState({ visible: false, x: 0, y: 0, cue: null })
   const [thumbMap, setThumbMap] = useState({})
 
   // Setup HLS playback when a viewItem is opened
@@ -69,7 +103,7 @@ export default function History() {
       videoEl.removeAttribute('src')
       videoEl.load()
       setThumbCues([])
-      setPreview({ visible: false, x: 0, y: 0, src: null })
+      setPreview({ visible: false, x: 0, y: 0, cue: null })
     }
   }, [viewItem])
 
@@ -103,8 +137,7 @@ export default function History() {
           while (i < lines.length && lines[i].trim() === '') i++
           if (i >= lines.length) break
           const name = lines[i++].trim()
-          const src = /^https?:\/\//i.test(name) ? name : `${base}/${name}`
-          cues.push({ start, end, src })
+          cues.push({ start, end, ...parseCueTarget(name, base) })
           // Skip until blank line
           while (i < lines.length && lines[i].trim() !== '') i++
         }
@@ -135,8 +168,9 @@ export default function History() {
     const t = ratio * videoEl.duration
     // Find cue covering t; assuming sorted
     let cue = null
-    // Fast index by Math.floor(t) since fps=1
-    const idx = Math.max(0, Math.min(thumbCues.length - 1, Math.floor(t)))
+    // Fast index assuming evenly spaced cues
+    const step = thumbCues[0].end - thumbCues[0].start || 1
+    const idx = Math.max(0, Math.min(thumbCues.length - 1, Math.floor(t / step)))
     cue = thumbCues[idx]
     if (!cue || t < cue.start || t >= cue.end) {
       cue = thumbCues.find(c => t >= c.start && t < c.end) || null
@@ -144,7 +178,7 @@ export default function History() {
     if (cue) {
       const px = Math.min(Math.max(x - 60, 4), rect.width - 124)
       const py = Math.max(y - 100, 4)
-      setPreview({ visible: true, x: px, y: py, src: cue.src })
+      setPreview({ visible: true, x: px, y: py, cue })
     } else {
       setPreview(p => ({ ...p, visible: false }))
     }
@@ -171,14 +205,18 @@ export default function History() {
 
   // Retry functionality removed per request
 
-  async function load(p = page) {
+  // Load the next page (or the first one when reset is set)
+  async function load(reset = false) {
+    if (loadingRef.current || (!reset && !hasMore)) return
+    loadingRef.current = true
     try {
       setLoading(true)
       setError(null)
-      const res = await listVideos(p, perPage)
+      const res = await listVideos(reset ? null : cursor, perPage)
       const list = res.items || []
-      setItems(list)
-      setPage(res.page || p)
+      setItems(prev => reset ? list : [...prev, ...list])
+      setCursor(res.next_cursor || null)
+      setHasMore(!!res.next_cursor)
       // Build per-item thumbnail from VTT (first cue image)
       try {
         const entries = await Promise.allSettled(
@@ -204,8 +242,7 @@ export default function History() {
                 while (i < lines.length && lines[i].trim() === '') i++
                 if (i >= lines.length) break
                 const name = lines[i++].trim()
-                const src = /^https?:\/\//i.test(name) ? name : `${base}/${name}`
-                return [key, src]
+                return [key, parseCueTarget(name, base)]
               }
               return [key, null]
             })
@@ -217,16 +254,28 @@ export default function History() {
             if (k && s) map[k] = s
           }
         }
-        setThumbMap(map)
+        setThumbMap(prev => reset ? map : { ...prev, ...map })
       } catch {}
     } catch (e) {
       setError(e.message || 'Failed to load history')
     } finally {
+      loadingRef.current = false
       setLoading(false)
     }
   }
 
-  useEffect(() => { load(1) }, [])
+  useEffect(() => { load(true) }, [])
+
+  // Infinite scroll: fetch the next page when the sentinel below the list comes into view
+  useEffect(() => {
+    const el = sentinelRef.current
+    if (!el || !hasMore || typeof IntersectionObserver === 'undefined') return
+    const observer = new IntersectionObserver((entries) => {
+      if (entries.some(e => e.isIntersecting)) load()
+    }, { rootMargin: '200px' })
+    observer.observe(el)
+    return () => observer.disconnect()
+  }, [cursor, hasMore, items.length])
 
   async function handleDownload(it) {
     if (!it?.mp4_url) return
@@ -262,9 +311,9 @@ export default function History() {
                 <source src={resolveUrl(viewItem.mp4_url)} type="video/mp4" />
               ) : null}
             </video>
-            {preview.visible && preview.src && (
+            {preview.visible && preview.cue && (
               <div style={{ position: 'absolute', left: preview.x, top: preview.y, pointerEvents: 'none', background: 'rgba(0,0,0,0.6)', padding: 4, borderRadius: 6 }}>
-                <img src={preview.src} alt="preview" style={{ width: 120, height: 'auto', display: 'block', borderRadius: 4 }} />
+                <CueImage cue={preview.cue} width={120} />
               </div>
             )}
           </div>
@@ -272,7 +321,7 @@ export default function History() {
       </Modal>
       <Group justify="space-between" mb="sm">
         <Title order={3}>Generation history</Title>
-        <Button size="xs" variant="default" onClick={() => load(1)} loading={loading}>
+        <Button size="xs" variant="default" onClick={() => load(true)} loading={loading}>
           Refresh
         </Button>
       </Group>
@@ -298,7 +347,7 @@ export default function History() {
                     title="Play"
                   >
                     {thumbMap[(it.id || it.job_id)] ? (
-                      <img src={thumbMap[(it.id || it.job_id)]} alt="thumbnail" style={{ width: '100%', height: '100%', objectFit: 'cover', display: 'block' }} />
+                      <CueImage cue={thumbMap[(it.id || it.job_id)]} width={120} height={68} />
                     ) : (
                       <div style={{ width: '100%', height: '100%', display: 'flex', alignItems: 'center', justifyContent: 'center', color: '#999', fontSize: 12 }}>No preview</div>
                     )}
@@ -340,6 +389,13 @@ export default function History() {
                 </Group>
               </Paper>
             ))}
+            {hasMore && (
+              <div ref={sentinelRef} style={{ padding: 8, textAlign: 'center' }}>
+                <Button size="xs" variant="subtle" onClick={() => load()} loading={loading}>
+                  Load more
+                </Button>
+              </div>
+            )}
           </Stack>
         </ScrollArea>
       )}
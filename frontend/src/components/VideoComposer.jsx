@@ -1,5 +1,5 @@
 import { useEffect, useRef, useState } from 'react'
-import { composePrompt, jobStatus, startGeneration } from '../services/api'
+import { composePrompt, startGeneration, watchJob } from '../services/api'
 import VideoPlayer from './VideoPlayer'
 
 export default function VideoComposer({ initialPrompt='', onGenerated }) {
@@ -16,7 +16,7 @@ export default function VideoComposer({ initialPrompt='', onGenerated }) {
   const [mp4Url, setMp4Url] = useState(null)
   const [hlsUrl, setHlsUrl] = useState(null)
 
-  const pollRef = useRef(null)
+  const unwatchRef = useRef(null)
 
   async function doCompose(){
     setLoadingCompose(true)
@@ -36,22 +36,19 @@ export default function VideoComposer({ initialPrompt='', onGenerated }) {
   }
 
   function poll(jid){
-    if (pollRef.current) clearInterval(pollRef.current)
-    pollRef.current = setInterval(async ()=>{
-      try {
-        const j = await jobStatus(jid)
-        setStatus(j.status); setProgress(j.progress || 0)
-        if (j.mp4_url) setMp4Url(j.mp4_url)
-        if (j.hls_url) setHlsUrl(j.hls_url)
-        if (j.status==='done' || j.status==='error') {
-          clearInterval(pollRef.current)
-          onGenerated && onGenerated()
-        }
-      } catch {}
-    }, 2500)
+    if (unwatchRef.current) unwatchRef.current()
+    unwatchRef.current = watchJob(jid, (j)=>{
+      setStatus(j.status); setProgress(j.progress || 0)
+      if (j.mp4_url) setMp4Url(j.mp4_url)
+      if (j.hls_url) setHlsUrl(j.hls_url)
+      if (j.status==='done' || j.status==='error') {
+        unwatchRef.current && unwatchRef.current()
+        onGenerated && onGenerated()
+      }
+    })
   }
 
-  useEffect(()=>()=>{ if (pollRef.current) clearInterval(pollRef.current) }, [])
+  useEffect(()=>()=>{ if (unwatchRef.current) unwatchRef.current() }, [])
 
   return (
     <div className="bg-white p-4 rounded shadow space-y-3">
@@ -20,14 +20,44 @@ export async function register(username, password) {
   return { user: { username } }
 }
 
-export async function improvePrompt(prompt) {
-  const r = await authFetch('/api/improve', {
+// With onPartial, the response is streamed and onPartial(auto_improved) fires
+// as soon as the server has it, before the variants are finished.
+export async function improvePrompt(prompt, onPartial) {
+  if (!onPartial) {
+    const r = await authFetch('/api/improve', {
+      method: 'POST',
+      body: JSON.stringify({ prompt })
+    })
+    const j = await r.json()
+    if (!r.ok) throw new Error(j.error || 'Improve failed')
+    return j
+  }
+
+  const r = await authFetch('/api/improve?stream=1', {
     method: 'POST',
     body: JSON.stringify({ prompt })
   })
-  const j = await r.json()
-  if (!r.ok) throw new Error(j.error || 'Improve failed')
-  return j
+  if (!r.ok || !r.body) {
+    const j = await r.json()
+    throw new Error(j.error || 'Improve failed')
+  }
+  const reader = r.body.getReader()
+  const decoder = new TextDecoder()
+  let buffered = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    buffered += decoder.decode(value || new Uint8Array(), { stream: !done })
+    const lines = buffered.split('\n')
+    buffered = lines.pop()
+    for (const line of lines) {
+      if (!line.trim()) continue
+      const msg = JSON.parse(line)
+      if (msg.type === 'auto_improved') onPartial(msg.auto_improved)
+      else if (msg.type === 'error') throw new Error(msg.error || 'Improve failed')
+      else if (msg.type === 'result') return { auto_improved: msg.auto_improved, variants: msg.variants }
+    }
+    if (done) throw new Error('Improve stream ended early')
+  }
 }
 
 export async function composePrompt(base_improved, variant, mode='auto_refine') {
@@ -50,15 +80,68 @@ export async function startGeneration({ prompt, composed_prompt, negative_prompt
   return j
 }
 
-export async function jobStatus(job_id) {
-  const r = await authFetch(`/api/status/${job_id}`)
+export async function jobStatus(job_id, since) {
+  const qs = since === undefined ? '' : `?since=${since}`
+  const r = await authFetch(`/api/status/${job_id}${qs}`)
   const j = await r.json()
   if (!r.ok) throw new Error(j.error || 'Status failed')
   return j
 }
 
-export async function listVideos(page=1, per_page=20) {
-  const r = await authFetch(`/api/videos?page=${page}&per_page=${per_page}`)
+const TERMINAL = ['done', 'error']
+const POLL_IDLE_MS = 3000
+
+// Subscribe to job status updates. Uses the SSE stream when available and
+// falls back to long-polling. Returns a function that stops watching.
+export function watchJob(job_id, onUpdate, onError) {
+  let stopped = false
+  let source = null
+
+  async function longPoll(since = -1) {
+    while (!stopped) {
+      try {
+        const j = await jobStatus(job_id, since)
+        if (stopped) return
+        if (j.version !== since) onUpdate(j)
+        if (TERMINAL.includes(j.status)) return
+        // Unchanged means the wait timed out or the server was too busy to hold it
+        if (j.version === since) await new Promise(r => setTimeout(r, POLL_IDLE_MS))
+        since = j.version
+      } catch (e) {
+        if (!stopped && onError) onError(e)
+        return
+      }
+    }
+  }
+
+  if (typeof EventSource === 'undefined') {
+    longPoll()
+  } else {
+    let lastVersion = -1
+    source = new EventSource(`${API_BASE}/api/status/${job_id}/stream`)
+    source.addEventListener('status', (ev) => {
+      const j = JSON.parse(ev.data)
+      lastVersion = j.version
+      onUpdate(j)
+      if (TERMINAL.includes(j.status)) source.close()
+    })
+    source.addEventListener('end', () => source.close())
+    source.onerror = () => {
+      // EventSource retries on its own; only fall back once it gives up
+      if (source.readyState === EventSource.CLOSED && !stopped) longPoll(lastVersion)
+    }
+  }
+
+  return () => {
+    stopped = true
+    if (source) source.close()
+  }
+}
+
+// Cursor pagination: pass the previous response's next_cursor as `after`
+export async function listVideos(after=null, per_page=20) {
+  const qs = `per_page=${per_page}` + (after ? `&after=${encodeURIComponent(after)}` : '')
+  const r = await authFetch(`/api/videos?${qs}`)
   const j = await r.json()
   if (!r.ok) throw new Error(j.error || 'List failed')
   return j